@@ -0,0 +1,236 @@
+"""
+Content-addressed cache for parsed analysis results.
+
+Two tiers sit in front of the vision model call:
+
+* an in-process LRU with a TTL for hot entries, and
+* an SQLite file on local disk that survives restarts and is shared by
+  every worker process on the same host.
+
+Keys are derived from the image bytes and every request parameter that
+changes the prompt, so a hit is always safe to serve as-is.
+"""
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(
+    image_bytes: bytes,
+    category: str,
+    language: str,
+    sub_category: Optional[str],
+    prompt_version: str,
+    patient_data: Any,
+    language_instruction: Optional[str] = None,
+) -> str:
+    """Build a stable cache key for an analysis request"""
+    if isinstance(patient_data, (dict, list)):
+        normalized_patient = json.dumps(patient_data, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    else:
+        normalized_patient = str(patient_data or "").strip()
+
+    digest = hashlib.sha256()
+    digest.update(hashlib.sha256(image_bytes).digest())
+    for part in (category, language, sub_category or "", prompt_version, normalized_patient, language_instruction or ""):
+        digest.update(b"\x00")
+        digest.update(part.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class AnalysisCache:
+    """Two-tier LRU + on-disk cache of parse_analysis_response results"""
+
+    def __init__(self, max_entries: int = 256, ttl: float = 86400.0, disk_path: Optional[str] = None, disk_max_entries: int = 10000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_path = disk_path
+        self.disk_max_entries = disk_max_entries
+        self._memory: "OrderedDict[str, tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Calls arrive through asyncio.to_thread, so the executor's threads bound the connection count
+        self._local = threading.local()
+        self._connections: "list[sqlite3.Connection]" = []
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expired": 0,
+            "invalidations": 0,
+        }
+        if disk_path:
+            self._init_disk()
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """This thread's connection, in a transaction that commits (or rolls back) on exit"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Only ever used by this thread; check_same_thread=False lets close() run elsewhere
+            conn = sqlite3.connect(self.disk_path, timeout=5.0, check_same_thread=False)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        with conn:
+            yield conn
+
+    def close(self) -> None:
+        """Close every per-thread disk connection"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        self._local = threading.local()
+        for conn in connections:
+            conn.close()
+
+    def _init_disk(self) -> None:
+        try:
+            self._prepare_disk_file()
+            with self._connect() as conn:
+                # WAL is a property of the database file, so setting it once here is enough
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS analysis_cache ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS analysis_cache_created ON analysis_cache(created)")
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"Disabling on-disk analysis cache: {str(e)}")
+            self.disk_path = None
+
+    def _prepare_disk_file(self) -> None:
+        """Create the cache file readable by this user only; cached results hold patient data"""
+        directory = os.path.dirname(self.disk_path) or "."
+        if not os.path.isdir(directory):
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            os.chmod(directory, 0o700)
+        # SQLite gives the -wal and -shm files the permissions of the database file
+        fd = os.open(self.disk_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            owner = os.fstat(fd).st_uid
+            if hasattr(os, "getuid") and owner != os.getuid():
+                raise PermissionError(f"{self.disk_path} is owned by another user (uid {owner})")
+            os.fchmod(fd, 0o600)
+        finally:
+            os.close(fd)
+
+    def _remember(self, key: str, created: float, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._memory[key] = (created, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a cached result or None; promotes disk hits into memory"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, value = entry
+                if now - created <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+                self.stats["expired"] += 1
+
+        if self.disk_path:
+            try:
+                with self._connect() as conn:
+                    row = conn.execute(
+                        "SELECT value, created FROM analysis_cache WHERE key = ?", (key,)
+                    ).fetchone()
+                if row is not None:
+                    value_json, created = row
+                    if now - created <= self.ttl:
+                        value = json.loads(value_json)
+                        self._remember(key, created, value)
+                        with self._lock:
+                            self.stats["disk_hits"] += 1
+                        return value
+                    self.invalidate(key, count=False)
+                    with self._lock:
+                        self.stats["expired"] += 1
+            except (sqlite3.Error, ValueError) as e:
+                logger.warning(f"Analysis cache disk read failed: {str(e)}")
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        """Store a result in both tiers"""
+        created = time.time()
+        self._remember(key, created, value)
+        if not self.disk_path:
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO analysis_cache (key, value, created) VALUES (?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), created),
+                )
+                expired = conn.execute("DELETE FROM analysis_cache WHERE created < ?", (created - self.ttl,))
+                overflow = conn.execute(
+                    "DELETE FROM analysis_cache WHERE key IN ("
+                    "SELECT key FROM analysis_cache ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                    (self.disk_max_entries,),
+                )
+                evicted = expired.rowcount + overflow.rowcount
+            if evicted:
+                with self._lock:
+                    self.stats["evictions"] += evicted
+        except sqlite3.Error as e:
+            logger.warning(f"Analysis cache disk write failed: {str(e)}")
+
+    def invalidate(self, key: Optional[str] = None, count: bool = True) -> int:
+        """Drop one entry, or every entry when no key is given; returns entries removed"""
+        with self._lock:
+            if key is None:
+                removed = len(self._memory)
+                self._memory.clear()
+            else:
+                removed = 1 if self._memory.pop(key, None) is not None else 0
+
+        if self.disk_path:
+            try:
+                with self._connect() as conn:
+                    if key is None:
+                        cursor = conn.execute("DELETE FROM analysis_cache")
+                    else:
+                        cursor = conn.execute("DELETE FROM analysis_cache WHERE key = ?", (key,))
+                    removed = max(removed, cursor.rowcount)
+            except sqlite3.Error as e:
+                logger.warning(f"Analysis cache disk invalidation failed: {str(e)}")
+
+        if count:
+            with self._lock:
+                self.stats["invalidations"] += removed
+        return removed
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters and sizes for the admin/metrics endpoints"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+        stats["max_entries"] = self.max_entries
+        stats["ttl_seconds"] = self.ttl
+        stats["disk_enabled"] = bool(self.disk_path)
+        return stats
+
+
+def default_cache_path() -> str:
+    """Per-user cache location: $XDG_CACHE_HOME/meddx, or ~/.cache/meddx"""
+    cache_home = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "meddx", "analysis.sqlite3")
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for parse_analysis_response.
+
+Parses a corpus of model responses repeatedly and prints the mean and p95
+per response, plus a checksum of the parsed output (without the random
+confidence) so runs against two trees can be checked for identical
+results. Point --backend-dir at a checkout of another commit (for example
+a git worktree) to measure the parser before a change.
+
+Usage:
+    python bench_parser.py --iterations 2000
+    git worktree add /tmp/before HEAD~1
+    python bench_parser.py --backend-dir /tmp/before/backend
+
+By default the corpus is the canned responses of mock_upstream.py (every
+category in English and Arabic). Pass --corpus with a JSON array of
+response strings, or JSON lines with a "response" field, to measure
+responses captured from the real model.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+
+def load_corpus(path: str) -> List[Tuple[str, str]]:
+    """(category, response) pairs from a JSON array or JSON lines file"""
+    with open(path, encoding="utf-8") as f:
+        content = f.read()
+    try:
+        records = json.loads(content)
+    except json.JSONDecodeError:
+        records = [json.loads(line) for line in content.splitlines() if line.strip()]
+    corpus = []
+    for record in records:
+        if isinstance(record, str):
+            corpus.append(("cbc", record))
+        else:
+            corpus.append((record.get("category", "cbc"), record["response"]))
+    return corpus
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Per-response parse time")
+    parser.add_argument("--backend-dir", default=os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--corpus", help="JSON array of responses, or JSON lines with category/response")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    if args.corpus:
+        corpus = load_corpus(os.path.abspath(args.corpus))
+    else:
+        from mock_upstream import CANNED_RESPONSES
+        corpus = [(category, response) for (category, _), response in CANNED_RESPONSES.items()]
+
+    os.environ.setdefault("GITHUB_TOKEN", "benchmark")
+    os.environ.setdefault("ANALYSIS_CACHE_ENABLED", "0")
+    sys.path.insert(0, os.path.abspath(args.backend_dir))
+    os.chdir(args.backend_dir)
+    import main as backend
+
+    checksum = hashlib.sha256()
+    for category, response in corpus:
+        parsed = {key: value for key, value in backend.parse_analysis_response(response, category).items() if key != "confidence"}
+        checksum.update(json.dumps(parsed, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+
+    samples: List[float] = []
+    for _ in range(args.iterations):
+        for category, response in corpus:
+            started = time.perf_counter()
+            backend.parse_analysis_response(response, category)
+            samples.append(time.perf_counter() - started)
+    samples.sort()
+    total_bytes = sum(len(response.encode("utf-8")) for _, response in corpus) * args.iterations
+    result: Dict[str, Any] = {
+        "responses": len(corpus),
+        "iterations": args.iterations,
+        "mean_us": round(sum(samples) / len(samples) * 1e6, 1),
+        "p95_us": round(samples[int(0.95 * (len(samples) - 1))] * 1e6, 1),
+        "mb_per_s": round(total_bytes / sum(samples) / 1e6, 2),
+        "output_sha256": checksum.hexdigest(),
+    }
+    print(f"{result['responses']} responses x {args.iterations}: mean {result['mean_us']}us  p95 {result['p95_us']}us  "
+          f"{result['mb_per_s']} MB/s  output {result['output_sha256'][:16]}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"backend_dir": args.backend_dir, "corpus": args.corpus, **result}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
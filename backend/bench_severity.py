@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Accuracy and speed of the severity classifier on a labeled corpus.
+
+Every response in the corpus carries the severity a reader would assign
+it. The script reports the accuracy of severity.detect_severity per
+language next to the keyword-substring detector it replaced, lists the
+responses the classifier gets wrong, and times both per response.
+
+Usage:
+    python bench_severity.py
+    python bench_severity.py --corpus captured.jsonl --iterations 5000 --output severity.json
+
+The default corpus is severity_corpus.jsonl next to this script: JSON
+lines with id, language, category, severity and response. The same file
+can be passed to bench_parser.py --corpus.
+"""
+import argparse
+import json
+import os
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List
+
+from severity import SEVERITY_LEVELS, severity_classifier
+
+# The detector parse_analysis_response used before severity.py: English
+# keywords only, anywhere in the text, no negation or section weighting
+LEGACY_SEVERITY_WORDS = {
+    'severe': ('severe', 'critical', 'emergency', 'urgent'),
+    'moderate': ('moderate', 'concerning'),
+    'mild': ('mild', 'slight'),
+}
+
+
+def legacy_detect_severity(text: str) -> str:
+    lowered = text.lower()
+    for level, words in LEGACY_SEVERITY_WORDS.items():
+        if any(word in lowered for word in words):
+            return level
+    return 'normal'
+
+
+def load_corpus(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def accuracy(detect: Callable[[str], str], corpus: List[Dict[str, Any]]) -> Dict[str, Any]:
+    correct: Counter = Counter()
+    totals: Counter = Counter()
+    for record in corpus:
+        totals[record["language"]] += 1
+        correct[record["language"]] += detect(record["response"]) == record["severity"]
+    result = {language: round(correct[language] / totals[language], 3) for language in sorted(totals)}
+    result["all"] = round(sum(correct.values()) / len(corpus), 3)
+    return result
+
+
+def timing(detect: Callable[[str], str], corpus: List[Dict[str, Any]], iterations: int) -> Dict[str, float]:
+    samples: List[float] = []
+    for _ in range(iterations):
+        for record in corpus:
+            started = time.perf_counter()
+            detect(record["response"])
+            samples.append(time.perf_counter() - started)
+    samples.sort()
+    total_bytes = sum(len(record["response"].encode("utf-8")) for record in corpus) * iterations
+    return {
+        "mean_us": round(sum(samples) / len(samples) * 1e6, 1),
+        "p95_us": round(samples[int(0.95 * (len(samples) - 1))] * 1e6, 1),
+        "mb_per_s": round(total_bytes / sum(samples) / 1e6, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Severity classifier accuracy and speed")
+    parser.add_argument("--corpus", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "severity_corpus.jsonl"))
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    detectors = {"automaton": severity_classifier.classify, "legacy": legacy_detect_severity}
+    results: Dict[str, Any] = {"responses": len(corpus), "iterations": args.iterations,
+                               "automaton_states": len(severity_classifier.automaton)}
+    for name, detect in detectors.items():
+        results[name] = {"accuracy": accuracy(detect, corpus), **timing(detect, corpus, args.iterations)}
+        print(f"{name:>9}: accuracy {results[name]['accuracy']}  mean {results[name]['mean_us']}us  "
+              f"p95 {results[name]['p95_us']}us  {results[name]['mb_per_s']} MB/s")
+
+    confusion: Counter = Counter()
+    mismatches = []
+    for record in corpus:
+        predicted = severity_classifier.classify(record["response"])
+        confusion[(record["severity"], predicted)] += 1
+        if predicted != record["severity"]:
+            mismatches.append({"id": record.get("id"), "expected": record["severity"], "predicted": predicted})
+    levels = SEVERITY_LEVELS + ('normal',)
+    print("\nexpected \\ predicted  " + "  ".join(f"{level:>8}" for level in levels))
+    for expected in levels:
+        print(f"{expected:>20}  " + "  ".join(f"{confusion[(expected, predicted)]:>8}" for predicted in levels))
+    for mismatch in mismatches:
+        print(f"mismatch {mismatch['id']}: expected {mismatch['expected']}, got {mismatch['predicted']}")
+    results["mismatches"] = mismatches
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"corpus": args.corpus, **results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
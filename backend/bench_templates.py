@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for building report HTML.
+
+Times create_pdf_html and create_html_for_pdf from main.py for every
+category and language and prints the mean and p95 per report. Point
+--backend-dir at a checkout of another commit (for example a git worktree)
+to measure the same builders before a change.
+
+Usage:
+    python bench_templates.py --iterations 2000
+    git worktree add /tmp/before HEAD~1
+    python bench_templates.py --backend-dir /tmp/before/backend
+
+fonts/ is not committed, so by default the builders inline no fonts. Pass
+--font-css-kb to stand in for the bundled @font-face data URIs (the real
+subset bundle is several hundred KB) and include their copying cost.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+CATEGORIES = ['cbc', 'ecg', 'xray', 'microscopy']
+LANGUAGES = ['en', 'ar']
+
+SAMPLE_ANALYSIS = {
+    "analysis": "White cell count is mildly elevated with a neutrophil predominance. "
+                "Haemoglobin and platelets are within the reference range.\n\n" * 4,
+    "findings": [f"Finding {i}: WBC 12.5 x10³/µL above the 4.0-11.0 range" for i in range(6)],
+    "recommendations": [f"Recommendation {i}: repeat CBC in two weeks" for i in range(4)],
+    "parameters": [
+        {"name": name, "value": "12.5", "unit": "x10³/µL", "referenceRange": "4.0-11.0", "status": "high"}
+        for name in ("WBC", "RBC", "HGB", "HCT", "MCV", "MCH", "MCHC", "PLT")
+    ],
+    "severity": "mild",
+    "confidence": 92,
+}
+SAMPLE_PATIENT = {"name": "Benchmark Patient", "age": 42, "gender": "female", "generated_by": "bench", "user_email": "bench@example.com"}
+
+
+def time_builder(build, iterations: int) -> Dict[str, float]:
+    samples: List[float] = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        build()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return {
+        "mean_us": round(sum(samples) / len(samples) * 1e6, 1),
+        "p95_us": round(samples[int(0.95 * (len(samples) - 1))] * 1e6, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Per-report HTML build time")
+    parser.add_argument("--backend-dir", default=os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--font-css-kb", type=int, default=0, help="Substitute synthetic @font-face CSS of this size")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    os.environ.setdefault("GITHUB_TOKEN", "benchmark")
+    os.environ.setdefault("ANALYSIS_CACHE_ENABLED", "0")
+    sys.path.insert(0, os.path.abspath(args.backend_dir))
+    os.chdir(args.backend_dir)
+    if args.font_css_kb:
+        import report_fonts
+        font_css = "@font-face { src: url(data:font/woff2;base64," + "A" * (args.font_css_kb * 1024) + "); }"
+        report_fonts.font_face_css = lambda: font_css
+    import main as backend
+
+    builders = {
+        "create_pdf_html": lambda category, language: backend.create_pdf_html(SAMPLE_ANALYSIS, category, language, SAMPLE_PATIENT),
+        "create_html_for_pdf": lambda category, language: backend.create_html_for_pdf(SAMPLE_ANALYSIS, category, language),
+    }
+    results: List[Dict[str, Any]] = []
+    for name, build in builders.items():
+        for category in CATEGORIES:
+            for language in LANGUAGES:
+                # Warm-up call excluded from timing (template compilation, font loading)
+                build(category, language)
+                result = {"builder": name, "category": category, "language": language,
+                          **time_builder(lambda: build(category, language), args.iterations)}
+                results.append(result)
+                print(f"{name:22} {category:10} {language}  mean {result['mean_us']:8.1f}us  p95 {result['p95_us']:8.1f}us")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"backend_dir": args.backend_dir, "iterations": args.iterations, "font_css_kb": args.font_css_kb, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
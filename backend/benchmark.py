@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+End-to-end load and latency benchmark for the backend.
+
+Starts the mock upstream (mock_upstream.py) and the API server as
+subprocesses, then drives the analyze and PDF endpoints at a fixed
+concurrency for every category and language. Throughput, p50/p95/p99
+latency and the peak RSS of the server process tree (Chromium included)
+are written to a JSON file tagged with the current git commit, so runs
+on different commits can be compared with --compare.
+
+Every analyze request carries a distinct image (a per-request JPEG comment
+segment), so identical concurrent requests are not coalesced onto one
+upstream call and each one measures the full request path. The number of
+requests the server did coalesce is reported next to every scenario as a
+check; it needs the server's ADMIN_TOKEN (--admin-token with --base-url).
+
+Usage:
+    python benchmark.py --requests 40 --concurrency 8 --output bench.json
+    python benchmark.py --output new.json --compare bench.json --max-regression 0.15
+    python benchmark.py --pdf-engine reportlab --output native.json --compare bench.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+ENDPOINTS = ['/api/medical/analyze', '/api/cbc/analyze', '/generate-pdf', '/api/medical/generate-pdf']
+CATEGORIES = ['cbc', 'ecg', 'xray', 'microscopy']
+LANGUAGES = ['en', 'ar']
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def percentile(samples: List[float], q: float) -> float:
+    """Nearest-rank percentile"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def process_tree_rss(root_pid: int) -> int:
+    """Resident set size in bytes of a process and all its descendants"""
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            children.setdefault(ppid, []).append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+
+    total, stack = 0, [root_pid]
+    while stack:
+        pid = stack.pop()
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            pass
+        stack.extend(children.get(pid, []))
+    return total
+
+class RssSampler(threading.Thread):
+    """Tracks the peak RSS of a process tree in the background"""
+
+    def __init__(self, pid: int, interval: float = 0.2):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            self.peak = max(self.peak, process_tree_rss(self.pid))
+            self._stop_event.wait(self.interval)
+
+    def stop(self) -> int:
+        self._stop_event.set()
+        self.join()
+        return self.peak
+
+def sample_image() -> bytes:
+    """A phone-photo sized test image so preprocessing cost is realistic"""
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (3024, 4032), (245, 245, 240))
+    draw = ImageDraw.Draw(image)
+    for y in range(0, 4032, 48):
+        draw.line([(0, y), (3024, y)], fill=(220, 120, 120), width=2)
+    for row in range(60):
+        draw.text((200, 300 + row * 60), f"WBC {row}.{row % 10} x10^3/uL   4.0-11.0", fill=(20, 20, 20))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=92)
+    return buffer.getvalue()
+
+def unique_image(image: bytes, variant: int) -> bytes:
+    """The same JPEG with a per-request comment segment, so no two requests share a coalescing key"""
+    comment = f"benchmark request {variant}".encode("ascii")
+    return image[:2] + b"\xff\xfe" + (len(comment) + 2).to_bytes(2, "big") + comment + image[2:]
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def wait_until_up(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as http:
+        while time.monotonic() < deadline:
+            try:
+                if (await http.get(url)).status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+def build_request(endpoint: str, category: str, language: str, image: bytes, analyses: Dict[tuple, Dict[str, Any]], variant: int = 0) -> Dict[str, Any]:
+    """httpx.post keyword arguments for one request to an endpoint"""
+    image = unique_image(image, variant)
+    if endpoint == '/api/medical/analyze':
+        return {"files": {"file": ("sample.jpg", image, "image/jpeg")}, "data": {"category": category, "language": language}}
+    if endpoint == '/api/cbc/analyze':
+        return {"files": {"file": ("sample.jpg", image, "image/jpeg")}}
+    analysis = analyses[(category, language)]
+    return {"data": {
+        "analysis_data": json.dumps(analysis, ensure_ascii=False),
+        "category": category,
+        "language": language,
+        "patient_info": json.dumps({"name": "Benchmark Patient", "age": 42, "gender": "female"}),
+    }}
+
+async def coalesced_count(http: httpx.AsyncClient, base_url: str, admin_token: Optional[str]) -> Optional[int]:
+    """Requests the server has coalesced so far, or None when metrics are not reachable"""
+    try:
+        response = await http.get(f"{base_url}/api/admin/metrics", headers={"X-Admin-Token": admin_token or ""})
+        return response.json()["request_coalescing"]["coalesced"] if response.status_code == 200 else None
+    except (httpx.HTTPError, ValueError, KeyError):
+        return None
+
+async def run_scenario(http: httpx.AsyncClient, base_url: str, endpoint: str, category: str, language: str, requests: int, concurrency: int, make_kwargs: Callable[[int], Dict[str, Any]], admin_token: Optional[str] = None) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+    # Built up front so payload construction is not timed
+    payloads = [make_kwargs(variant) for variant in range(requests)]
+
+    async def one(kwargs: Dict[str, Any]) -> None:
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await http.post(f"{base_url}{endpoint}", **kwargs)
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            elapsed = time.perf_counter() - started
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors += 1
+
+    coalesced_before = await coalesced_count(http, base_url, admin_token)
+    started = time.perf_counter()
+    await asyncio.gather(*[one(kwargs) for kwargs in payloads])
+    wall = time.perf_counter() - started
+    coalesced_after = await coalesced_count(http, base_url, admin_token)
+
+    return {
+        "endpoint": endpoint,
+        "category": category,
+        "language": language,
+        "requests": requests,
+        "errors": errors,
+        "concurrency": concurrency,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "coalesced": coalesced_after - coalesced_before if coalesced_before is not None and coalesced_after is not None else None,
+    }
+
+async def run_benchmark(args: argparse.Namespace, base_url: str, server_pid: Optional[int]) -> Dict[str, Any]:
+    image = sample_image()
+    results = []
+    sampler = RssSampler(server_pid) if server_pid else None
+    if sampler:
+        sampler.start()
+
+    timeout = httpx.Timeout(args.timeout)
+    limits = httpx.Limits(max_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as http:
+        # Real analysis payloads for the PDF endpoints, one per category and language
+        analyses = {}
+        for category in args.categories:
+            for language in args.languages:
+                response = await http.post(f"{base_url}/api/medical/analyze", **build_request('/api/medical/analyze', category, language, image, {}))
+                response.raise_for_status()
+                analyses[(category, language)] = response.json()
+
+        for endpoint in args.endpoints:
+            # The legacy endpoint is CBC/English only
+            combos = [('cbc', 'en')] if endpoint == '/api/cbc/analyze' else [(c, l) for c in args.categories for l in args.languages]
+            for category, language in combos:
+                make_kwargs = lambda variant, endpoint=endpoint, category=category, language=language: build_request(endpoint, category, language, image, analyses, variant)
+                result = await run_scenario(http, base_url, endpoint, category, language, args.requests, args.concurrency, make_kwargs, args.admin_token)
+                results.append(result)
+                print(
+                    f"{endpoint:28} {category:10} {language}  "
+                    f"{result['throughput_rps']:7.2f} req/s  p50 {result['p50_ms']:8.1f}ms  "
+                    f"p95 {result['p95_ms']:8.1f}ms  p99 {result['p99_ms']:8.1f}ms  errors {result['errors']}  "
+                    f"coalesced {'n/a' if result['coalesced'] is None else result['coalesced']}"
+                )
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "upstream_latency": args.upstream_latency,
+            "upstream_latency_mean": args.upstream_latency_mean,
+            "pdf_engine": args.pdf_engine,
+        },
+        "results": results,
+    }
+    if sampler:
+        report["peak_rss_mb"] = round(sampler.stop() / (1024 * 1024), 1)
+        print(f"Peak server RSS: {report['peak_rss_mb']} MB")
+    return report
+
+def compare(report: Dict[str, Any], baseline_path: str, max_regression: float) -> int:
+    """Print p95 deltas against a previous run; returns the number of regressions"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {(r["endpoint"], r["category"], r["language"]): r for r in baseline["results"]}
+    regressions = 0
+    print(f"\nComparison against {baseline.get('commit') or baseline_path}:")
+    for result in report["results"]:
+        key = (result["endpoint"], result["category"], result["language"])
+        before = previous.get(key)
+        if not before or not before["p95_ms"]:
+            continue
+        change = (result["p95_ms"] - before["p95_ms"]) / before["p95_ms"]
+        flag = "REGRESSION" if change > max_regression else ""
+        regressions += bool(flag)
+        print(f"{key[0]:28} {key[1]:10} {key[2]}  p95 {before['p95_ms']:8.1f} -> {result['p95_ms']:8.1f}ms ({change:+.0%}) {flag}")
+    return regressions
+
+def start_stack(args: argparse.Namespace) -> tuple[str, List[subprocess.Popen]]:
+    """Launch the mock upstream and the API server on free ports"""
+    mock_port, api_port = free_port(), free_port()
+    mock = subprocess.Popen(
+        [sys.executable, "mock_upstream.py", "--port", str(mock_port),
+         "--latency", args.upstream_latency, "--latency-mean", str(args.upstream_latency_mean), "--seed", "1"],
+        cwd=BACKEND_DIR,
+    )
+    env = {
+        **os.environ,
+        "BASE_URL": f"http://127.0.0.1:{mock_port}",
+        # Measure the full request path, not cache hits
+        "ANALYSIS_CACHE_ENABLED": "0",
+        "PDF_CACHE_MAX_BYTES": "0",
+        "PDF_ENGINE": args.pdf_engine,
+        "ADMIN_TOKEN": args.admin_token,
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(api_port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+    return f"http://127.0.0.1:{api_port}", [mock, server]
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load and latency benchmark for analyze and PDF endpoints")
+    parser.add_argument("--base-url", help="Benchmark an already running server instead of spawning one")
+    parser.add_argument("--server-pid", type=int, help="PID to sample RSS from when using --base-url")
+    parser.add_argument("--admin-token", default=os.getenv("ADMIN_TOKEN"), help="Admin token of the --base-url server, to read coalescing counts")
+    parser.add_argument("--endpoints", nargs="+", default=ENDPOINTS)
+    parser.add_argument("--categories", nargs="+", default=CATEGORIES)
+    parser.add_argument("--languages", nargs="+", default=LANGUAGES)
+    parser.add_argument("--requests", type=int, default=20, help="Requests per endpoint/category/language")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--upstream-latency", default="lognormal", help="Mock upstream latency distribution")
+    parser.add_argument("--upstream-latency-mean", type=float, default=2.0)
+    parser.add_argument("--pdf-engine", choices=["chromium", "reportlab"], default="chromium", help="PDF engine of the spawned server")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="Previous results file to compare p95 latencies against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed relative p95 increase")
+    args = parser.parse_args()
+
+    processes = []
+    try:
+        if args.base_url:
+            base_url, server_pid = args.base_url.rstrip("/"), args.server_pid
+        else:
+            args.admin_token = secrets.token_hex(16)
+            base_url, processes = start_stack(args)
+            server_pid = processes[1].pid
+        asyncio.run(wait_until_up(f"{base_url}/health"))
+        report = asyncio.run(run_benchmark(args, base_url, server_pid))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=10)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Results written to {args.output}")
+
+    if args.compare and compare(report, args.compare, args.max_regression):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
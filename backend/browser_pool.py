@@ -0,0 +1,231 @@
+"""
+Pool of long-lived headless Chromium browsers for PDF rendering.
+
+Launching Chromium costs one to three seconds of CPU and hundreds of MB per
+PDF, so browsers are started once and kept warm with pre-opened pages.
+Pages are reset to about:blank between renders. A browser whose process
+has died is replaced, and every browser is recycled after a fixed number
+of renders so Chromium's memory growth stays bounded.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pyppeteer import launch
+
+logger = logging.getLogger(__name__)
+
+
+class BrowserSlot:
+    """One Chromium process and the pages opened in it"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.browser = None
+        self.generation = 0
+        self.renders = 0
+        self.pages_out = 0
+        self.retiring = False
+        self.lock = asyncio.Lock()
+
+    def is_alive(self) -> bool:
+        process = getattr(self.browser, "process", None)
+        return self.browser is not None and (process is None or process.poll() is None)
+
+
+class BrowserPool:
+    """Bounded set of warm browsers handing out reusable pages"""
+
+    def __init__(
+        self,
+        size: int = 2,
+        pages_per_browser: int = 2,
+        max_renders_per_browser: int = 200,
+        launch_options: Optional[Dict[str, Any]] = None,
+        viewport: Optional[Dict[str, int]] = None,
+        checkout_timeout: float = 30.0,
+        launcher: Callable[[Dict[str, Any]], Awaitable[Any]] = launch,
+    ):
+        self.size = size
+        self.pages_per_browser = pages_per_browser
+        self.max_renders_per_browser = max_renders_per_browser
+        self.launch_options = launch_options or {}
+        self.viewport = viewport or {'width': 1200, 'height': 800}
+        self.checkout_timeout = checkout_timeout
+        self._launcher = launcher
+        self._slots: List[BrowserSlot] = [BrowserSlot(i) for i in range(size)]
+        self._idle: "asyncio.Queue[tuple]" = asyncio.Queue()
+        self._start_lock = asyncio.Lock()
+        self._started = False
+        self.stats = {
+            "renders": 0,
+            "launches": 0,
+            "recycled": 0,
+            "crashes_replaced": 0,
+            "page_failures": 0,
+        }
+
+    async def start(self) -> None:
+        """Launch every browser and pre-open its pages"""
+        async with self._start_lock:
+            if self._started:
+                return
+            await asyncio.gather(*[
+                self._relaunch(slot, "pool start", slot.generation)
+                for slot in self._slots if slot.browser is None
+            ])
+            self._started = True
+            logger.info(f"Browser pool started: {self.size} browsers x {self.pages_per_browser} pages")
+
+    async def _launch_slot(self, slot: BrowserSlot) -> None:
+        slot.browser = await self._launcher(self.launch_options)
+        slot.renders = 0
+        slot.retiring = False
+        self.stats["launches"] += 1
+        for _ in range(self.pages_per_browser):
+            await self._idle.put((slot, slot.generation, await self._new_page(slot)))
+
+    async def _new_page(self, slot: BrowserSlot):
+        page = await slot.browser.newPage()
+        await page.setViewport(self.viewport)
+        return page
+
+    async def _relaunch(self, slot: BrowserSlot, reason: str, generation: int) -> None:
+        """Close a browser and start a fresh one in its slot, once per generation"""
+        async with slot.lock:
+            if slot.generation != generation:
+                return  # Someone else already replaced it
+            logger.info(f"Launching browser {slot.index}: {reason}")
+            old = slot.browser
+            slot.browser = None
+            # Invalidate queued pages of the old browser before anything else can block
+            slot.generation += 1
+            self._discard_idle_pages(slot)
+            if old is not None:
+                try:
+                    await old.close()
+                except Exception as e:
+                    logger.warning(f"Error closing browser {slot.index}: {str(e)}")
+            await self._launch_slot(slot)
+
+    def _discard_idle_pages(self, slot: BrowserSlot) -> None:
+        """Drop idle pages that belong to the given slot"""
+        keep = []
+        while not self._idle.empty():
+            entry = self._idle.get_nowait()
+            if entry[0] is not slot:
+                keep.append(entry)
+        for entry in keep:
+            self._idle.put_nowait(entry)
+
+    async def _checkout(self):
+        while True:
+            if self._idle.empty():
+                # A slot whose relaunch failed earlier gets another chance
+                for slot in self._slots:
+                    if slot.browser is None and not slot.lock.locked():
+                        await self._relaunch(slot, "replacing unavailable browser", slot.generation)
+            slot, generation, page = await asyncio.wait_for(self._idle.get(), timeout=self.checkout_timeout)
+            if generation != slot.generation:
+                # Page belonged to a browser that has since been replaced
+                continue
+            if not slot.is_alive():
+                self.stats["crashes_replaced"] += 1
+                await self._relaunch(slot, "browser process died", generation)
+                continue
+            if slot.retiring:
+                if slot.pages_out == 0:
+                    await self._relaunch(slot, "retired", generation)
+                continue
+            if page.isClosed():
+                page = await self._new_page(slot)
+            slot.pages_out += 1
+            return slot, generation, page
+
+    async def _checkin(self, slot: BrowserSlot, generation: int, page, failed: bool) -> None:
+        slot.pages_out -= 1
+        if generation != slot.generation:
+            return
+        slot.renders += 1
+        if slot.renders >= self.max_renders_per_browser:
+            slot.retiring = True
+
+        if slot.retiring:
+            # Stop handing out this browser's pages; relaunch once the last one is back
+            if slot.pages_out == 0:
+                self.stats["recycled"] += 1
+                await self._relaunch(slot, f"recycling after {slot.renders} renders", generation)
+            return
+
+        if failed or not slot.is_alive():
+            self.stats["page_failures"] += 1
+            if not slot.is_alive():
+                self.stats["crashes_replaced"] += 1
+                slot.retiring = True
+                if slot.pages_out == 0:
+                    await self._relaunch(slot, "browser process died", generation)
+                return
+            try:
+                await page.close()
+            except Exception:
+                pass
+            page = await self._new_page(slot)
+        else:
+            # Reset state left by the previous report
+            await page.goto('about:blank')
+        await self._idle.put((slot, generation, page))
+
+    async def _retire_unreturned(self, slot: BrowserSlot, generation: int) -> None:
+        """Retire a browser whose page could not be put back; relaunch it if that was its last page"""
+        if generation != slot.generation:
+            return
+        slot.retiring = True
+        # No page of this slot is queued any more, so _checkout would never get to relaunch it
+        if slot.pages_out == 0:
+            try:
+                await self._relaunch(slot, "page could not be reset", generation)
+            except Exception as e:
+                # Leaves browser None; the next checkout retries the launch
+                logger.warning(f"Could not relaunch browser {slot.index}: {str(e)}")
+
+    async def render(self, render_fn: Callable[[Any], Awaitable[bytes]]) -> bytes:
+        """Run render_fn(page) on a pooled page and return its result"""
+        if not self._started:
+            await self.start()
+        slot, generation, page = await self._checkout()
+        failed = True
+        try:
+            result = await render_fn(page)
+            failed = False
+            self.stats["renders"] += 1
+            return result
+        finally:
+            try:
+                await self._checkin(slot, generation, page, failed)
+            except Exception as e:
+                logger.warning(f"Could not return page to browser pool: {str(e)}")
+                await self._retire_unreturned(slot, generation)
+
+    async def close(self) -> None:
+        """Close every browser in the pool"""
+        for slot in self._slots:
+            if slot.browser is not None:
+                try:
+                    await slot.browser.close()
+                except Exception as e:
+                    logger.warning(f"Error closing browser {slot.index}: {str(e)}")
+                slot.browser = None
+                slot.generation += 1
+        self._started = False
+        self._idle = asyncio.Queue()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Pool utilization for the metrics endpoint"""
+        return {
+            **self.stats,
+            "started": self._started,
+            "browsers": self.size,
+            "pages_idle": self._idle.qsize(),
+            "pages_in_use": sum(slot.pages_out for slot in self._slots),
+            "renders_per_browser": [slot.renders for slot in self._slots],
+        }
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Rebuild the subsetted report fonts committed in this directory.
+
+The PDF templates use Amiri, Noto Sans Arabic, Noto Kufi Arabic and Cairo
+(SIL Open Font License, see OFL.txt). The built files are committed, so
+neither setup nor rendering needs this script or network access; run it
+only to update a font. It reads the upstream TrueType files from a local
+directory and cuts them down to the glyph ranges our reports need: Latin,
+Arabic, Arabic presentation forms, digits and common punctuation.
+OpenType shaping features are kept so Arabic joining and ligatures still
+work. Output is WOFF2 that keeps the weight axis, which report_fonts.py
+inlines into the report HTML, plus static regular and bold TrueType
+instances of Noto Sans Arabic for the native ReportLab renderer
+(report_pdf.py), which cannot select weights of a variable font.
+
+Requires: pip install fonttools brotli
+Usage:    python fonts/build_fonts.py SOURCE_DIR
+
+SOURCE_DIR holds the files named in FONTS as published in the google/fonts
+repository (ofl/amiri, ofl/notosansarabic, ofl/notokufiarabic, ofl/cairo).
+"""
+import os
+import sys
+
+from fontTools import subset
+from fontTools.ttLib import TTFont
+from fontTools.varLib import instancer
+
+FONTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# (source file, output file, variable axes to pin, if any)
+FONTS = [
+    ("Amiri-Regular.ttf", "Amiri-Regular.woff2", None),
+    ("NotoSansArabic[wdth,wght].ttf", "NotoSansArabic.woff2", {"wdth": 100}),
+    ("NotoKufiArabic[wght].ttf", "NotoKufiArabic.woff2", None),
+    ("Cairo[slnt,wght].ttf", "Cairo.woff2", {"slnt": 0}),
+    ("NotoSansArabic[wdth,wght].ttf", "NotoSansArabic-Regular.ttf", {"wdth": 100, "wght": 400}),
+    ("NotoSansArabic[wdth,wght].ttf", "NotoSansArabic-Bold.ttf", {"wdth": 100, "wght": 700}),
+]
+
+UNICODE_RANGES = [
+    (0x0020, 0x007E),  # Basic Latin
+    (0x00A0, 0x00FF),  # Latin-1 Supplement (°, ±, µ, ×)
+    (0x0300, 0x036F),  # Combining diacritics
+    (0x0600, 0x06FF),  # Arabic
+    (0x0750, 0x077F),  # Arabic Supplement
+    (0x2000, 0x206F),  # General Punctuation (incl. bidi controls)
+    (0x2070, 0x209F),  # Superscripts and subscripts (x10³)
+    (0x2190, 0x2193),  # Arrows used for high/low markers
+    (0x2264, 0x2265),  # ≤ ≥
+    (0xFB50, 0xFDFF),  # Arabic Presentation Forms-A
+    (0xFE70, 0xFEFF),  # Arabic Presentation Forms-B
+]
+
+LAYOUT_FEATURES = [
+    "ccmp", "locl", "isol", "init", "medi", "fina", "rlig", "liga", "calt",
+    "kern", "mark", "mkmk", "curs", "rclt", "ss01",
+]
+
+
+def build(source_dir: str, source: str, output: str, location=None) -> None:
+    font = TTFont(os.path.join(source_dir, source))
+    options = subset.Options()
+    options.layout_features = LAYOUT_FEATURES
+    options.flavor = "woff2" if output.endswith(".woff2") else None
+    options.name_IDs = ["*"]
+    options.notdef_outline = True
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=[cp for start, end in UNICODE_RANGES for cp in range(start, end + 1)])
+    subsetter.subset(font)
+    if location:
+        font = instancer.instantiateVariableFont(font, location, updateFontNames=True)
+    font.flavor = options.flavor
+    font.save(os.path.join(FONTS_DIR, output))
+    print(f"{output}: {os.path.getsize(os.path.join(FONTS_DIR, output)) // 1024} KB")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit(__doc__)
+    for source, output, location in FONTS:
+        build(sys.argv[1], source, output, location)
@@ -0,0 +1,148 @@
+"""
+Server-side image normalization before upload to the vision model.
+
+Phone photos of lab sheets routinely arrive at 8-12 MB, and every byte is
+base64-inflated into the upstream request. The model tiles images at a
+fixed resolution anyway, so pixels above the per-category maximum edge only
+cost bandwidth and vision tokens. Each category gets its own policy: ECG
+strips and microscopy slides keep colour and a higher quality so thin
+traces and stain boundaries survive; X-rays are reduced to grayscale.
+"""
+import io
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+IMAGE_PREPROCESS_ENABLED = os.getenv("IMAGE_PREPROCESS_ENABLED", "1") == "1"
+IMAGE_OUTPUT_FORMAT = os.getenv("IMAGE_OUTPUT_FORMAT", "webp").lower()
+
+# mode: target colour mode, max_edge: longest side in pixels, quality: encoder quality
+DEFAULT_POLICIES = {
+    'cbc': {'mode': 'RGB', 'max_edge': 2048, 'quality': 85},
+    'ecg': {'mode': 'RGB', 'max_edge': 2048, 'quality': 92},
+    'xray': {'mode': 'L', 'max_edge': 1536, 'quality': 85},
+    'microscopy': {'mode': 'RGB', 'max_edge': 2048, 'quality': 92},
+}
+FALLBACK_POLICY = {'mode': 'RGB', 'max_edge': 2048, 'quality': 85}
+
+_stats_lock = threading.Lock()
+PREPROCESS_STATS = {
+    "images": 0,
+    "passthrough": 0,
+    "failures": 0,
+    "bytes_in": 0,
+    "bytes_out": 0,
+    "preprocess_ms_total": 0.0,
+}
+
+
+def get_policy(category: str) -> Dict[str, Any]:
+    """Category policy with IMAGE_MAX_EDGE_<CAT> / IMAGE_QUALITY_<CAT> overrides"""
+    policy = dict(DEFAULT_POLICIES.get(category, FALLBACK_POLICY))
+    suffix = (category or "default").upper()
+    if os.getenv(f"IMAGE_MAX_EDGE_{suffix}"):
+        policy['max_edge'] = int(os.getenv(f"IMAGE_MAX_EDGE_{suffix}"))
+    if os.getenv(f"IMAGE_QUALITY_{suffix}"):
+        policy['quality'] = int(os.getenv(f"IMAGE_QUALITY_{suffix}"))
+    return policy
+
+def _convert_mode(image: Image.Image, mode: str) -> Image.Image:
+    """Flatten alpha onto white and convert to the policy colour mode"""
+    if image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image)
+    if image.mode != mode:
+        image = image.convert(mode)
+    return image
+
+def _record(bytes_in: int, bytes_out: int, elapsed_ms: float, passthrough: bool = False, failed: bool = False) -> None:
+    with _stats_lock:
+        PREPROCESS_STATS["images"] += 1
+        PREPROCESS_STATS["bytes_in"] += bytes_in
+        PREPROCESS_STATS["bytes_out"] += bytes_out
+        PREPROCESS_STATS["preprocess_ms_total"] += elapsed_ms
+        if passthrough:
+            PREPROCESS_STATS["passthrough"] += 1
+        if failed:
+            PREPROCESS_STATS["failures"] += 1
+
+def preprocess_image(image_bytes: bytes, category: str, original_ext: Optional[str] = None) -> Tuple[bytes, str, Dict[str, Any]]:
+    """Normalize and downscale an upload; returns (bytes, extension, report)"""
+    started = time.perf_counter()
+    original_ext = (original_ext or "png").lower()
+    if not IMAGE_PREPROCESS_ENABLED:
+        return image_bytes, original_ext, {"original_bytes": len(image_bytes), "processed_bytes": len(image_bytes), "skipped": True}
+
+    policy = get_policy(category)
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            original_size = image.size
+            original_format = (image.format or original_ext).lower()
+            max_edge = policy['max_edge']
+            if original_format == 'jpeg':
+                # Let the JPEG decoder skip DCT detail we are about to throw away
+                image.draft(image.mode, (max_edge, max_edge))
+            # 0x0112 is the EXIF Orientation tag; 1 means the pixels are already upright
+            oriented = image.getexif().get(0x0112, 1) != 1
+            image = ImageOps.exif_transpose(image)
+            if image.mode in ('I;16', 'I;16B', 'I;16L', 'I'):
+                # 16-bit radiographs: scale down to 8 bits before resampling
+                image = image.convert('I').point(lambda value: value / 256).convert('L')
+            # Resize before colour conversion so the conversion touches fewer pixels
+            image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            image = _convert_mode(image, policy['mode'])
+
+            output = io.BytesIO()
+            if IMAGE_OUTPUT_FORMAT == 'jpeg':
+                image.save(output, format='JPEG', quality=policy['quality'], optimize=True, progressive=True)
+                ext = 'jpeg'
+            else:
+                image.save(output, format='WEBP', quality=policy['quality'], method=4)
+                ext = 'webp'
+            processed = output.getvalue()
+            new_size = image.size
+    except Exception as e:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        logger.warning(f"Image preprocessing failed, sending original: {str(e)}")
+        _record(len(image_bytes), len(image_bytes), elapsed_ms, passthrough=True, failed=True)
+        return image_bytes, original_ext, {"original_bytes": len(image_bytes), "processed_bytes": len(image_bytes), "error": str(e)}
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    passthrough = (
+        len(processed) >= len(image_bytes) and new_size == original_size and not oriented
+        and original_format in ('jpeg', 'png', 'webp')
+    )
+    if passthrough:
+        # Re-encoding only made it bigger; the original is already upright and a format the model accepts
+        processed, ext = image_bytes, original_format
+
+    _record(len(image_bytes), len(processed), elapsed_ms, passthrough=passthrough)
+    report = {
+        "original_bytes": len(image_bytes),
+        "processed_bytes": len(processed),
+        "bytes_saved": len(image_bytes) - len(processed),
+        "original_size": original_size,
+        "processed_size": new_size,
+        "format": ext,
+        "preprocess_ms": round(elapsed_ms, 1),
+    }
+    logger.info(
+        f"Preprocessed {category} image {original_size} -> {new_size}: "
+        f"{len(image_bytes)} -> {len(processed)} bytes ({ext}) in {elapsed_ms:.0f}ms"
+    )
+    return processed, ext, report
+
+def preprocess_stats() -> Dict[str, Any]:
+    """Aggregate byte savings for the metrics endpoint"""
+    with _stats_lock:
+        stats = dict(PREPROCESS_STATS)
+    stats["bytes_saved"] = stats["bytes_in"] - stats["bytes_out"]
+    stats["reduction_ratio"] = round(1 - stats["bytes_out"] / stats["bytes_in"], 3) if stats["bytes_in"] else 0.0
+    return stats
@@ -0,0 +1,350 @@
+"""
+Parameter extraction and reference-range classification.
+
+Measured parameters are pulled from the model's reply line by line (one
+compiled pattern, duplicates dropped) and classified against an index of
+CBC, ECG, microscopy and chest X-ray reference ranges built once at import.
+The index is keyed by every alias of a parameter in English abbreviation,
+English long form and Arabic, so WBC, Leukocytes and كريات بيضاء resolve to
+the same entry. Short aliases that are also ordinary words ("rate", "axis")
+or other readings' abbreviations ("hr", "hb") only count in the categories
+that use them. Each entry has ranges per unit family (WBC per microlitre
+in a CBC, per high-power field in urine microscopy) and, where physiology
+differs, per sex and for children; the patient's sex and age come from
+patient_info. Values are converted into the family's canonical unit
+before comparison. Parameters the index does not know are classified
+against the range printed next to them, if any.
+
+The output keeps the response schema the frontend expects (value and
+referenceRange stay strings) and adds numericValue.
+"""
+import math
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# Unit family -> (display unit, {spelling: factor to the display unit}); spellings are
+# matched after normalize_unit()
+UNIT_FAMILIES = {
+    'count_e3': ('x10³/μL', {'x10³/μl': 1, 'x10^3/ul': 1, '10^3/ul': 1, 'k/ul': 1, 'thou/ul': 1, 'x10⁹/l': 1, 'x10^9/l': 1, '10^9/l': 1, 'g/l': 1,
+                             '/ul': 0.001, 'cells/ul': 0.001, '/mm3': 0.001, 'cells/mm3': 0.001}),
+    'count_e6': ('x10⁶/μL', {'x10⁶/μl': 1, 'x10^6/ul': 1, '10^6/ul': 1, 'm/ul': 1, 'mil/ul': 1, 'x10¹²/l': 1, 'x10^12/l': 1, '10^12/l': 1, 't/l': 1}),
+    'g_dl': ('g/dL', {'g/dl': 1, 'gm/dl': 1, 'g%': 1, 'g/l': 0.1}),
+    'percent': ('%', {'%': 1, 'percent': 1}),
+    'fl': ('fL', {'fl': 1, 'um3': 1}),
+    'pg': ('pg', {'pg': 1}),
+    'mm_hr': ('mm/hr', {'mm/hr': 1, 'mm/h': 1, 'mm/1hr': 1}),
+    'ms': ('ms', {'ms': 1, 'msec': 1, 's': 1000, 'sec': 1000}),
+    'bpm': ('bpm', {'bpm': 1, '/min': 1, 'beats/min': 1, 'b/min': 1}),
+    'degrees': ('°', {'°': 1, 'deg': 1, 'degrees': 1}),
+    'hpf': ('/HPF', {'/hpf': 1, 'hpf': 1, 'cells/hpf': 1, '/hpf.': 1}),
+    'lpf': ('/LPF', {'/lpf': 1, 'lpf': 1}),
+    'ratio': ('', {'': 1, 'ratio': 1}),
+}
+
+# key: canonical name; ranges: unit family -> {"adult" | "male" | "female" | "child": (low, high)}.
+# The first family is assumed when no unit is printed; extra_units covers parameter-specific conversions;
+# category_aliases are only recognized in replies of that analysis category.
+REFERENCE_RANGES: List[Dict[str, Any]] = [
+    # CBC
+    {'key': 'WBC', 'aliases': ['wbc', 'white blood cells', 'white blood cell count', 'white cells', 'leukocytes', 'leucocytes', 'total leukocyte count', 'tlc',
+                               'كريات بيضاء', 'كريات الدم البيضاء', 'خلايا الدم البيضاء', 'الكريات البيضاء', 'كرات الدم البيضاء'],
+     'ranges': {'count_e3': {'adult': (4.0, 11.0), 'child': (5.0, 14.5)}, 'hpf': {'adult': (0, 5)}}},
+    {'key': 'RBC', 'aliases': ['rbc', 'red blood cells', 'red blood cell count', 'red cells', 'erythrocytes',
+                               'كريات حمراء', 'كريات الدم الحمراء', 'خلايا الدم الحمراء', 'الكريات الحمراء', 'كرات الدم الحمراء'],
+     'ranges': {'count_e6': {'male': (4.5, 5.9), 'female': (4.1, 5.1), 'child': (4.0, 5.2)}, 'hpf': {'adult': (0, 2)}}},
+    {'key': 'Hemoglobin', 'aliases': ['hemoglobin', 'haemoglobin', 'hgb', 'هيموجلوبين', 'الهيموجلوبين', 'الهيموغلوبين', 'خضاب الدم', 'الخضاب'],
+     'category_aliases': {'cbc': ['hb'], 'microscopy': ['hb']},
+     'ranges': {'g_dl': {'male': (13.5, 17.5), 'female': (12.0, 15.5), 'child': (11.0, 13.5)}},
+     'extra_units': {'mmol/l': ('g_dl', 1.611)}},
+    {'key': 'Hematocrit', 'aliases': ['hematocrit', 'haematocrit', 'hct', 'pcv', 'packed cell volume', 'هيماتوكريت', 'الهيماتوكريت', 'الهيماتوكريت (hct)'],
+     'ranges': {'percent': {'male': (41, 53), 'female': (36, 46), 'child': (35, 45)}},
+     'extra_units': {'l/l': ('percent', 100)}},
+    {'key': 'Platelets', 'aliases': ['platelets', 'platelet count', 'plt', 'thrombocytes', 'صفائح', 'الصفائح', 'الصفائح الدموية', 'الصفيحات الدموية'],
+     'ranges': {'count_e3': {'adult': (150, 400)}}},
+    {'key': 'MCV', 'aliases': ['mcv', 'mean corpuscular volume', 'mean cell volume', 'متوسط حجم الكرية'],
+     'ranges': {'fl': {'adult': (80, 100), 'child': (75, 95)}}},
+    {'key': 'MCH', 'aliases': ['mch', 'mean corpuscular hemoglobin', 'mean cell hemoglobin', 'متوسط هيموجلوبين الكرية'],
+     'ranges': {'pg': {'adult': (27, 33)}}},
+    {'key': 'MCHC', 'aliases': ['mchc', 'mean corpuscular hemoglobin concentration', 'متوسط تركيز هيموجلوبين الكرية'],
+     'ranges': {'g_dl': {'adult': (32, 36)}},
+     'extra_units': {'%': ('g_dl', 1)}},
+    {'key': 'RDW', 'aliases': ['rdw', 'rdw-cv', 'red cell distribution width', 'عرض توزيع الكريات الحمراء'],
+     'ranges': {'percent': {'adult': (11.5, 14.5)}}},
+    {'key': 'MPV', 'aliases': ['mpv', 'mean platelet volume', 'متوسط حجم الصفائح'],
+     'ranges': {'fl': {'adult': (7.5, 11.5)}}},
+    {'key': 'Neutrophils', 'aliases': ['neutrophils', 'neutrophil', 'neut', 'neu', 'segmented neutrophils', 'العدلات', 'الخلايا المتعادلة'],
+     'ranges': {'percent': {'adult': (40, 70)}, 'count_e3': {'adult': (2.0, 7.5)}}},
+    {'key': 'Lymphocytes', 'aliases': ['lymphocytes', 'lymphocyte', 'lymph', 'lym', 'الخلايا اللمفاوية', 'اللمفاويات', 'الخلايا الليمفاوية'],
+     'ranges': {'percent': {'adult': (20, 40)}, 'count_e3': {'adult': (1.0, 4.0)}}},
+    {'key': 'Monocytes', 'aliases': ['monocytes', 'monocyte', 'mono', 'الخلايا الوحيدة', 'وحيدات النوى'],
+     'ranges': {'percent': {'adult': (2, 8)}, 'count_e3': {'adult': (0.2, 1.0)}}},
+    {'key': 'Eosinophils', 'aliases': ['eosinophils', 'eosinophil', 'eos', 'الحمضات', 'الخلايا الحمضية'],
+     'ranges': {'percent': {'adult': (1, 4)}, 'count_e3': {'adult': (0.0, 0.5)}}},
+    {'key': 'Basophils', 'aliases': ['basophils', 'basophil', 'baso', 'القعدات', 'الخلايا القاعدية'],
+     'ranges': {'percent': {'adult': (0, 1)}, 'count_e3': {'adult': (0.0, 0.2)}}},
+    {'key': 'ESR', 'aliases': ['esr', 'erythrocyte sedimentation rate', 'sed rate', 'سرعة الترسيب', 'معدل ترسيب الكريات الحمراء'],
+     'ranges': {'mm_hr': {'male': (0, 15), 'female': (0, 20)}}},
+    # ECG
+    {'key': 'Heart Rate', 'aliases': ['heart rate', 'ventricular rate', 'pulse', 'معدل ضربات القلب', 'ضربات القلب', 'نبض القلب', 'معدل القلب'],
+     'category_aliases': {'ecg': ['hr', 'rate']},
+     'ranges': {'bpm': {'adult': (60, 100), 'child': (70, 120)}}},
+    {'key': 'PR', 'aliases': ['pr', 'pr interval', 'فترة pr'],
+     'ranges': {'ms': {'adult': (120, 200)}}},
+    {'key': 'QRS', 'aliases': ['qrs', 'qrs duration', 'qrs interval', 'مدة qrs', 'مركب qrs'],
+     'ranges': {'ms': {'adult': (80, 120)}}},
+    {'key': 'QT', 'aliases': ['qt', 'qt interval', 'فترة qt'],
+     'ranges': {'ms': {'adult': (350, 450)}}},
+    {'key': 'QTc', 'aliases': ['qtc', 'qtc interval', 'corrected qt', 'فترة qtc'],
+     'ranges': {'ms': {'male': (350, 450), 'female': (350, 460)}}},
+    {'key': 'P Wave', 'aliases': ['p wave', 'p wave duration', 'p duration', 'موجة p'],
+     'ranges': {'ms': {'adult': (80, 120)}}},
+    {'key': 'QRS Axis', 'aliases': ['qrs axis', 'electrical axis', 'محور القلب', 'المحور الكهربائي'],
+     'category_aliases': {'ecg': ['axis']},
+     'ranges': {'degrees': {'adult': (-30, 90)}}},
+    {'key': 'RR Interval', 'aliases': ['rr', 'rr interval', 'فترة rr'],
+     'ranges': {'ms': {'adult': (600, 1000)}}},
+    # Microscopy (blood smear and urine sediment)
+    {'key': 'Reticulocytes', 'aliases': ['reticulocytes', 'reticulocyte count', 'retic', 'الخلايا الشبكية'],
+     'ranges': {'percent': {'adult': (0.5, 2.5)}}},
+    {'key': 'Blasts', 'aliases': ['blasts', 'blast cells', 'الأرومات', 'الخلايا الأرومية'],
+     'ranges': {'percent': {'adult': (0, 0)}}},
+    {'key': 'Band Neutrophils', 'aliases': ['bands', 'band neutrophils', 'band forms', 'stab cells', 'العدلات الشريطية'],
+     'ranges': {'percent': {'adult': (0, 5)}}},
+    {'key': 'Epithelial Cells', 'aliases': ['epithelial cells', 'squamous epithelial cells', 'epithelial', 'الخلايا الظهارية'],
+     'ranges': {'hpf': {'adult': (0, 5)}}},
+    {'key': 'Casts', 'aliases': ['casts', 'hyaline casts', 'الأسطوانات'],
+     'ranges': {'lpf': {'adult': (0, 2)}}},
+    # Chest X-ray
+    {'key': 'Cardiothoracic Ratio', 'aliases': ['cardiothoracic ratio', 'ctr', 'c/t ratio', 'نسبة القلب إلى الصدر', 'النسبة القلبية الصدرية'],
+     'ranges': {'ratio': {'adult': (0.0, 0.5)}}},
+]
+
+PROFILES = ('male', 'female', 'child', 'adult')
+CHILD_MAX_AGE = 12
+
+_SUPERSCRIPTS = str.maketrans({'³': '3', '⁶': '6', '⁹': '9', '¹': '1', '²': '2', 'µ': 'u', 'μ': 'u', '×': 'x', '*': 'x'})
+_ARABIC_DIGITS = str.maketrans('٠١٢٣٤٥٦٧٨٩٫', '0123456789.')
+
+
+def normalize_unit(unit: str) -> str:
+    """Lowercase, ASCII exponents and micro sign, no spaces: 'x 10⁹/L' -> 'x10^9/l'"""
+    unit = unit.strip().lower().replace(' ', '')
+    unit = re.sub(r'10([³⁶⁹]|¹²)', lambda m: '10^' + m.group(1), unit)
+    return unit.translate(_SUPERSCRIPTS).rstrip('.')
+
+
+def normalize_name(name: str) -> str:
+    return ' '.join(name.replace('*', '').replace('_', ' ').strip(' .:-').lower().split())
+
+
+def _build_index() -> Tuple[Dict[str, Dict[str, Any]], Dict[Tuple[str, str], Dict[str, Any]],
+                            Dict[Tuple[str, str, str], Tuple[float, float]], Dict[str, Dict[str, Tuple[str, float]]]]:
+    """alias -> entry, (category, alias) -> entry, (key, family, profile) -> range, key -> {unit spelling: (family, factor)}"""
+    aliases: Dict[str, Dict[str, Any]] = {}
+    scoped_aliases: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    ranges: Dict[Tuple[str, str, str], Tuple[float, float]] = {}
+    units: Dict[str, Dict[str, Tuple[str, float]]] = {}
+    for entry in REFERENCE_RANGES:
+        for alias in [entry['key'], *entry['aliases']]:
+            aliases.setdefault(normalize_name(alias), entry)
+        for category, names in entry.get('category_aliases', {}).items():
+            for alias in names:
+                scoped_aliases.setdefault((category, normalize_name(alias)), entry)
+        spellings: Dict[str, Tuple[str, float]] = {}
+        for family, by_profile in entry['ranges'].items():
+            for spelling, factor in UNIT_FAMILIES[family][1].items():
+                spellings.setdefault(normalize_unit(spelling), (family, factor))
+            # Unknown sex: the union of both ranges, so only values abnormal for either are flagged
+            sexes = [by_profile[sex] for sex in ('male', 'female') if sex in by_profile]
+            adult = by_profile.get('adult') or (min(low for low, _ in sexes), max(high for _, high in sexes))
+            for profile in PROFILES:
+                ranges[(entry['key'], family, profile)] = by_profile.get(profile, adult)
+        for spelling, (family, factor) in entry.get('extra_units', {}).items():
+            spellings[normalize_unit(spelling)] = (family, factor)
+        units[entry['key']] = spellings
+    return aliases, scoped_aliases, ranges, units
+
+
+ALIAS_INDEX, CATEGORY_ALIAS_INDEX, RANGE_INDEX, UNIT_INDEX = _build_index()
+
+_BULLET_RE = re.compile(r'^(?:[-•*▪◦·]+|\d{1,2}[.)])\s*')
+_NUMBER = r'\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:[.,]\d+)?'
+_PARAMETER_LINE_RE = re.compile(
+    r'^(?P<name>[^\W\d_][^:：=\n]{0,48}?)\s*(?:[:：=]\s*|\s+)'
+    r'(?P<comparator>[<>≤≥]=?)?\s*(?P<value>[-−]?(?:' + _NUMBER + r'))'
+    r'\s*(?P<unit>[x×]\s*10\^?[\d³⁶⁹¹²]+\s*/\s*[^\s(,;]+|[^\s(,;\d][^\s(,;]*)?'
+    r'\s*(?:\((?P<range>[^)]*)\)|[-–—]\s*(?P<dash_range>[^,\n]+))?'
+)
+_SIGNED_NUMBER_RE = re.compile(r'-?(?:' + _NUMBER + r')')
+_THOUSANDS_RE = re.compile(r'\d,\d{3}(?:\.|$)')
+_RANGE_RE = re.compile(r'(?P<low>-?\d+(?:[.,]\d+)?)\s*(?:-|–|—|to|الى|إلى)\s*(?P<high>-?\d+(?:[.,]\d+)?)')
+_UPPER_RE = re.compile(r'(?:<|≤|up to|less than|below|أقل من)\s*=?\s*(?P<high>\d+(?:[.,]\d+)?)', re.IGNORECASE)
+_LOWER_RE = re.compile(r'(?:>|≥|above|greater than|more than|أكثر من)\s*=?\s*(?P<low>\d+(?:[.,]\d+)?)', re.IGNORECASE)
+
+
+def parse_number(text: Any) -> Optional[float]:
+    """12.5, '12,5', '12,500', '١٢٫٥' -> float; None when there is no number"""
+    if isinstance(text, bool):
+        return None
+    if isinstance(text, (int, float)):
+        return float(text)
+    match = _SIGNED_NUMBER_RE.search(str(text or '').translate(_ARABIC_DIGITS).replace('−', '-'))
+    if not match:
+        return None
+    number = match.group()
+    number = number.replace(',', '') if _THOUSANDS_RE.search(number) else number.replace(',', '.')
+    return float(number)
+
+
+def parse_range(text: Any) -> Tuple[float, float]:
+    """'4.0-11.0', '< 450', '>60' -> (low, high); unbounded sides are infinite, no range is (nan, nan)"""
+    text = str(text or '').translate(_ARABIC_DIGITS)
+    match = _RANGE_RE.search(text)
+    if match:
+        return parse_number(match.group('low')), parse_number(match.group('high'))
+    match = _UPPER_RE.search(text)
+    if match:
+        return -math.inf, parse_number(match.group('high'))
+    match = _LOWER_RE.search(text)
+    if match:
+        return parse_number(match.group('low')), math.inf
+    return math.nan, math.nan
+
+
+def format_number(value: float) -> str:
+    return f"{round(value, 3):g}"
+
+
+def format_range(low: float, high: float) -> str:
+    if low == -math.inf:
+        return f"<{format_number(high)}"
+    if high == math.inf:
+        return f">{format_number(low)}"
+    return f"{format_number(low)}{' to ' if low < 0 else '-'}{format_number(high)}"
+
+
+def patient_profile(patient_data: Optional[Dict[str, Any]]) -> Tuple[str, str]:
+    """(sex, profile) from patient_info: profile is 'child' below CHILD_MAX_AGE, else the sex or 'adult'"""
+    patient_data = patient_data if isinstance(patient_data, dict) else {}
+    gender = str(patient_data.get('gender') or patient_data.get('sex') or '').strip().lower()
+    sex = 'male' if gender in ('male', 'm', 'man', 'boy', 'ذكر') else 'female' if gender in ('female', 'f', 'woman', 'girl', 'أنثى', 'انثى') else 'adult'
+    age = parse_number(patient_data.get('age'))
+    if age is not None and age < CHILD_MAX_AGE:
+        return sex, 'child'
+    return sex, sex
+
+
+def _lookup_alias(alias: str, category: Optional[str]) -> Optional[Dict[str, Any]]:
+    return ALIAS_INDEX.get(alias) or CATEGORY_ALIAS_INDEX.get((category, alias))
+
+
+def lookup(name: str, category: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Index entry for a printed parameter name, also trying 'Long Name (ABBR)' parts"""
+    normalized = normalize_name(name)
+    entry = _lookup_alias(normalized, category)
+    if entry is None and '(' in normalized:
+        outside, _, inside = normalized.partition('(')
+        entry = _lookup_alias(normalize_name(inside.rstrip(')')), category) or _lookup_alias(normalize_name(outside), category)
+    return entry
+
+
+def scan_parameter_line(line: str, known_only: bool = False, category: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Candidate parameter on one line: name, value, unit and printed range as written
+
+    With known_only, the line must start with a known parameter name; a
+    printed range alone does not make prose a parameter.
+    """
+    line = _BULLET_RE.sub('', line.strip()).replace('**', '')
+    if not line or line[0] == '#' or not any(char.isdigit() for char in line):
+        return None
+    if line[0] == '|':
+        # Markdown table row: | name | value unit | unit | range |
+        cells = [cell.strip() for cell in line.strip('|').split('|')]
+        if len(cells) >= 2 and parse_number(cells[1]) is not None and not cells[0].startswith('-'):
+            line = f"{cells[0]}: {' '.join(cells[1:3])} ({cells[3] if len(cells) > 3 else ''})"
+        else:
+            return None
+    match = _PARAMETER_LINE_RE.match(line.translate(_ARABIC_DIGITS))
+    if not match:
+        return None
+    printed_range = match.group('range') or match.group('dash_range') or ''
+    name = match.group('name').strip(' *.-')
+    # Prose lines only count when they name a known parameter or print a range
+    if lookup(name, category) is None and (known_only or math.isnan(parse_range(printed_range)[0])):
+        return None
+    return {
+        "name": name,
+        "value": match.group('value'),
+        "unit": (match.group('unit') or '').strip(),
+        "referenceRange": printed_range.strip(),
+    }
+
+
+def scan_parameters(text: str, category: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Candidate parameters, one per matching line"""
+    found = []
+    for line in text.split('\n'):
+        candidate = scan_parameter_line(line, category=category)
+        if candidate is not None:
+            found.append(candidate)
+    return found
+
+
+def classify_parameters(parameters: List[Dict[str, Any]], patient_data: Optional[Dict[str, Any]] = None,
+                        seen: Optional[Set[Any]] = None, category: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Deduplicate, normalize units and flag low/high against the index (or the printed range)
+
+    Pass the same ``seen`` set to successive calls to deduplicate across them.
+    """
+    _, profile = patient_profile(patient_data)
+    seen = set() if seen is None else seen
+    rows = []
+    for param in parameters:
+        name = str(param.get('name') or '').strip()
+        value = parse_number(param.get('value'))
+        entry = lookup(name, category)
+        unit = str(param.get('unit') or '').strip()
+        family = factor = None
+        if entry is not None:
+            spellings = UNIT_INDEX[entry['key']]
+            # No printed unit: the entry's primary family
+            family, factor = spellings.get(normalize_unit(unit)) or ((next(iter(entry['ranges'])), 1.0) if not unit else (None, None))
+        dedupe_key = (entry['key'], family) if entry is not None else normalize_name(name)
+        if dedupe_key in seen:
+            continue
+        seen.add(dedupe_key)
+        rows.append((param, name, value, entry, family, factor, unit))
+
+    # One pass over parallel lists: resolve every value and bound, then compare them together
+    values, lows, highs = [], [], []
+    for param, name, value, entry, family, factor, unit in rows:
+        if value is not None and family is not None:
+            low, high = RANGE_INDEX[(entry['key'], family, profile)]
+            value = round(value * factor, 6)
+        else:
+            low, high = parse_range(param.get('referenceRange'))
+        values.append(math.nan if value is None else value)
+        lows.append(low)
+        highs.append(high)
+    statuses = ['low' if value < low else 'high' if value > high else 'normal' for value, low, high in zip(values, lows, highs)]
+
+    classified = []
+    for (param, name, value, entry, family, factor, unit), number, low, high, status in zip(rows, values, lows, highs, statuses):
+        known = family is not None and not math.isnan(number)
+        if math.isnan(number) or math.isnan(low):
+            # Nothing to compare: keep what was reported
+            status = str(param.get('status') or 'normal').lower()
+        classified.append({
+            "name": name,
+            "value": format_number(number) if known and factor != 1 else str(param.get('value') if param.get('value') is not None else ''),
+            "unit": UNIT_FAMILIES[family][0] if known else unit,
+            "referenceRange": format_range(low, high) if not math.isnan(low) else str(param.get('referenceRange') or ''),
+            "status": status,
+            "numericValue": None if math.isnan(number) else number,
+        })
+    return classified
+
+
+def extract_parameters(text: str, patient_data: Optional[Dict[str, Any]] = None, category: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Parameters found in a markdown reply of a category, classified for this patient"""
+    return classify_parameters(scan_parameters(text, category), patient_data, category=category)
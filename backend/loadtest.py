@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Concurrent load test for the medical analysis endpoint.
+
+Fires N analyze requests at once and reports whether they overlap. With a
+non-blocking upstream client the wall time should be close to the slowest
+single request, not the sum of all of them. /health is probed while the
+analyses are in flight to confirm the event loop stays responsive.
+
+Each request appends a few distinct bytes after the end of the image
+(decoders ignore trailing data), so concurrent requests are not
+coalesced onto one upstream call and really run side by side. The bytes
+include a random per-run nonce, so a repeated run misses the server's
+persistent analysis cache instead of measuring cache hits.
+
+Usage:
+    python loadtest.py path/to/image.png --concurrency 8 --category cbc
+"""
+import argparse
+import asyncio
+import mimetypes
+import os
+import time
+import uuid
+from typing import List
+
+import httpx
+
+
+def unique_payload(image_bytes: bytes, run_id: str, variant: int) -> bytes:
+    """The image with a per-run, per-request trailer, so no two requests share a coalescing or cache key"""
+    return image_bytes + f"\x00loadtest run {run_id} request {variant}".encode("ascii")
+
+async def analyze_once(http: httpx.AsyncClient, url: str, image_bytes: bytes, filename: str, content_type: str, category: str, language: str) -> float:
+    """Send one analyze request and return its latency in seconds"""
+    started = time.perf_counter()
+    response = await http.post(
+        url,
+        files={"file": (filename, image_bytes, content_type)},
+        data={"category": category, "language": language},
+    )
+    response.raise_for_status()
+    return time.perf_counter() - started
+
+async def probe_health(http: httpx.AsyncClient, url: str, stop: asyncio.Event) -> List[float]:
+    """Poll /health until stopped and collect its latencies"""
+    latencies = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        await http.get(url)
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.25)
+    return latencies
+
+async def run(args: argparse.Namespace) -> None:
+    with open(args.image, "rb") as f:
+        image_bytes = f.read()
+    content_type = mimetypes.guess_type(args.image)[0] or "application/octet-stream"
+    if not content_type.startswith("image/"):
+        raise SystemExit(f"{args.image} does not look like an image ({content_type})")
+    filename = os.path.basename(args.image)
+    run_id = uuid.uuid4().hex
+
+    timeout = httpx.Timeout(args.timeout)
+    limits = httpx.Limits(max_connections=args.concurrency + 1)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as http:
+        stop = asyncio.Event()
+        health_task = asyncio.create_task(probe_health(http, f"{args.base_url}/health", stop))
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*[
+            analyze_once(http, f"{args.base_url}/api/medical/analyze", unique_payload(image_bytes, run_id, variant), filename, content_type, args.category, args.language)
+            for variant in range(args.concurrency)
+        ])
+        wall = time.perf_counter() - started
+
+        stop.set()
+        health_latencies = await health_task
+
+    total = sum(latencies)
+    print(f"Requests:           {len(latencies)}")
+    print(f"Wall time:          {wall:.2f}s")
+    print(f"Slowest request:    {max(latencies):.2f}s")
+    print(f"Sum of latencies:   {total:.2f}s")
+    print(f"Overlap factor:     {total / wall:.2f}x (1.0x means fully serialized)")
+    if health_latencies:
+        print(f"/health max during load: {max(health_latencies) * 1000:.0f}ms over {len(health_latencies)} probes")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Concurrent load test for /api/medical/analyze")
+    parser.add_argument("image", help="Image file to upload")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--category", default="cbc")
+    parser.add_argument("--language", default="en")
+    parser.add_argument("--timeout", type=float, default=180.0)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,129 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 import base64
+import contextlib
+import hmac
 import json
-import re
-from openai import OpenAI
-from PIL import Image
-import io
+from openai import AsyncOpenAI
 import os
 from typing import Optional, List, Dict, Any
 import uvicorn
 import logging
 import random
-import tempfile
-import subprocess
+import time
 from datetime import datetime
+from urllib.parse import quote
 from fastapi.responses import Response
 import asyncio
-from pyppeteer import launch
+import httpx
+from browser_pool import BrowserPool
+from report_templates import render_report_html, warm_templates
+from report_fonts import MissingReportFonts
+from pdf_cache import PdfCache, make_pdf_key, etag_for, etag_matches
+from report_pdf import render_report_pdf
+from render_pool import RenderPool
+from pdf_optimize import optimize_pdf, record_optimization, record_optimization_failure, optimize_stats
+from pdf_jobs import PdfJobQueue, PdfQueueFull
+from zip_stream import ZipStream
+from report_images import ReportImageCache, image_digest, make_report_thumbnail
+from analysis_cache import AnalysisCache, make_cache_key, default_cache_path
+from image_pipeline import preprocess_image, preprocess_stats
+from singleflight import SingleFlight
+from upstream_limiter import AdaptiveLimiter, UpstreamOverloaded, is_overload_error, parse_retry_after
+from resilience import ResilientCaller, is_retryable
+from response_parser import AnalysisParser
+from severity import severity_classifier
+from structured_output import ParseStats, StructuredOutputError, json_format_instruction, parse_structured_response, response_format
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # === CONFIG ===
-import os
+
+DEFAULT_BASE_URL = "https://models.github.ai/inference"
+# Point BASE_URL at mock_upstream.py for offline load testing
+BASE_URL = os.getenv("BASE_URL", DEFAULT_BASE_URL)
+MODEL = os.getenv("MODEL", "gpt-4.1")
 
 API_KEY = os.getenv("GITHUB_TOKEN")  # 👈 Secure and dynamic
 if not API_KEY:
-    raise RuntimeError("❌ GITHUB_TOKEN is not set in Railway")
-
-BASE_URL = "https://models.github.ai/inference"
-MODEL = "gpt-4.1"
+    if BASE_URL == DEFAULT_BASE_URL:
+        raise RuntimeError("❌ GITHUB_TOKEN is not set in Railway")
+    # Local OpenAI-compatible stand-ins do not check the key
+    API_KEY = "local"
+# Bump whenever prompts or parsing change so cached analyses are not reused
+PROMPT_VERSION = "3"
+
+# Categories that ask the model for schema-validated JSON instead of markdown (comma separated),
+# and whether to also send the schema as response_format (needs an endpoint that supports json_schema)
+STRUCTURED_OUTPUT_CATEGORIES = {name.strip() for name in os.getenv("STRUCTURED_OUTPUT_CATEGORIES", "").split(",") if name.strip()}
+STRUCTURED_OUTPUT_SEND_SCHEMA = os.getenv("STRUCTURED_OUTPUT_SEND_SCHEMA", "1") == "1"
+
+# Upstream connection pool and timeouts (seconds)
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "120"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "10"))
+
+# Upstream admission control (AIMD concurrency window + bounded wait queue)
+UPSTREAM_CONCURRENCY_INITIAL = float(os.getenv("UPSTREAM_CONCURRENCY_INITIAL", "8"))
+UPSTREAM_CONCURRENCY_MIN = float(os.getenv("UPSTREAM_CONCURRENCY_MIN", "1"))
+UPSTREAM_CONCURRENCY_MAX = float(os.getenv("UPSTREAM_CONCURRENCY_MAX", "32"))
+UPSTREAM_QUEUE_MAX = int(os.getenv("UPSTREAM_QUEUE_MAX", "64"))
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "30"))
+
+# Analysis result cache
+ANALYSIS_CACHE_ENABLED = os.getenv("ANALYSIS_CACHE_ENABLED", "1") == "1"
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "256"))
+ANALYSIS_CACHE_TTL = float(os.getenv("ANALYSIS_CACHE_TTL", "86400"))
+ANALYSIS_CACHE_PATH = os.getenv("ANALYSIS_CACHE_PATH", default_cache_path())
+ANALYSIS_CACHE_DISK_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_DISK_MAX_ENTRIES", "10000"))
+# Admin endpoints (cache stats/invalidation, metrics) are disabled unless a token is set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Persistent Chromium pool for PDF rendering
+# PDF engine: "chromium" prints the HTML templates in the browser pool,
+# "reportlab" draws the report natively without a browser (much faster)
+PDF_ENGINE = os.getenv("PDF_ENGINE", "chromium").lower()
+if PDF_ENGINE not in ("chromium", "reportlab"):
+    raise ValueError(f"PDF_ENGINE must be 'chromium' or 'reportlab', got {PDF_ENGINE!r}")
+# Native renders run in worker processes (0 = in a thread) and are killed after the timeout
+PDF_RENDER_PROCESSES = int(os.getenv("PDF_RENDER_PROCESSES", str(min(2, os.cpu_count() or 1))))
+PDF_RENDER_TIMEOUT = float(os.getenv("PDF_RENDER_TIMEOUT", "30"))
+PDF_BROWSER_POOL_SIZE = int(os.getenv("PDF_BROWSER_POOL_SIZE", "2"))
+PDF_PAGES_PER_BROWSER = int(os.getenv("PDF_PAGES_PER_BROWSER", "2"))
+PDF_BROWSER_MAX_RENDERS = int(os.getenv("PDF_BROWSER_MAX_RENDERS", "200"))
+# Upper bound on waiting for document.fonts.ready before printing
+PDF_FONT_LOAD_TIMEOUT = float(os.getenv("PDF_FONT_LOAD_TIMEOUT", "5"))
+
+# Rendered PDF cache; bump PDF_TEMPLATE_VERSION whenever report HTML/CSS changes
+PDF_TEMPLATE_VERSION = "3"
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Analyzed image embedded in reports: longest edge in pixels, JPEG quality, derivative cache size
+REPORT_IMAGE_MAX_EDGE = int(os.getenv("REPORT_IMAGE_MAX_EDGE", "1200"))
+REPORT_IMAGE_QUALITY = int(os.getenv("REPORT_IMAGE_QUALITY", "80"))
+REPORT_IMAGE_CACHE_MAX_BYTES = int(os.getenv("REPORT_IMAGE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Post-render size optimization: on/off, fast web view, longest image edge kept (0 keeps originals)
+PDF_OPTIMIZE = os.getenv("PDF_OPTIMIZE", "1") == "1"
+PDF_LINEARIZE = os.getenv("PDF_LINEARIZE", "0") == "1"
+PDF_MAX_IMAGE_EDGE = int(os.getenv("PDF_MAX_IMAGE_EDGE", "1600"))
+
+# Background PDF jobs: concurrent renders, backlog limit, seconds finished PDFs are kept
+PDF_JOB_WORKERS = int(os.getenv("PDF_JOB_WORKERS", "2"))
+PDF_JOB_MAX_QUEUED = int(os.getenv("PDF_JOB_MAX_QUEUED", "100"))
+PDF_JOB_RETENTION = float(os.getenv("PDF_JOB_RETENTION", "600"))
+
+# Bulk ZIP export: renders in flight per export (defaults to one per pooled page), items per export
+PDF_BULK_CONCURRENCY = int(os.getenv("PDF_BULK_CONCURRENCY", str(PDF_BROWSER_POOL_SIZE * PDF_PAGES_PER_BROWSER)))
+PDF_BULK_MAX_ITEMS = int(os.getenv("PDF_BULK_MAX_ITEMS", "500"))
+
+# Batch analysis fan-out
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "100"))
 # Initialize FastAPI
 app = FastAPI(title="Medical Analysis API", version="1.0.0")
 
@@ -44,20 +136,285 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize OpenAI client
-client = OpenAI(
+# Initialize shared async OpenAI client backed by a pooled HTTP client
+client = AsyncOpenAI(
     api_key=API_KEY,
     base_url=BASE_URL,
+    http_client=httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+        ),
+        timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT),
+    ),
+    # 429s must reach the admission controller instead of being retried blindly by the SDK
+    max_retries=0,
+)
+
+upstream_limiter = AdaptiveLimiter(
+    initial_limit=UPSTREAM_CONCURRENCY_INITIAL,
+    min_limit=UPSTREAM_CONCURRENCY_MIN,
+    max_limit=UPSTREAM_CONCURRENCY_MAX,
+    max_queue=UPSTREAM_QUEUE_MAX,
+    queue_timeout=UPSTREAM_QUEUE_TIMEOUT,
+)
+
+# Retries, hedging and circuit breaking per category (see UPSTREAM_RESILIENCE)
+upstream_resilience = ResilientCaller()
+
+@app.exception_handler(UpstreamOverloaded)
+async def upstream_overloaded_handler(request, exc: UpstreamOverloaded):
+    """Shed load with 503 + Retry-After instead of a generic failure"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Analysis service is busy: {str(exc)}"},
+        headers={"Retry-After": str(int(exc.retry_after + 0.999))},
+    )
+
+@app.on_event("shutdown")
+async def close_upstream_client():
+    """Release pooled upstream connections"""
+    await client.close()
+
+pdf_browser_pool = BrowserPool(
+    size=PDF_BROWSER_POOL_SIZE,
+    pages_per_browser=PDF_PAGES_PER_BROWSER,
+    max_renders_per_browser=PDF_BROWSER_MAX_RENDERS,
+    # Launch browser with proper Arabic support
+    launch_options={
+        'headless': True,
+        'args': [
+            '--no-sandbox',
+            '--disable-setuid-sandbox',
+            '--disable-dev-shm-usage',
+            '--disable-web-security',
+            '--font-render-hinting=none',
+            '--disable-font-subpixel-positioning',
+            '--disable-features=VizDisplayCompositor'
+        ],
+        # The pool owns browser lifetime; don't let pyppeteer install its own signal handlers
+        'handleSIGINT': False,
+        'handleSIGTERM': False,
+        'handleSIGHUP': False,
+    },
+    viewport={'width': 1200, 'height': 800},
 )
 
-def encode_image_to_base64(image_file: UploadFile) -> str:
-    """Convert uploaded image to base64"""
+pdf_cache = PdfCache(max_bytes=PDF_CACHE_MAX_BYTES)
+
+# Print-resolution derivatives of uploaded images, shared by every report of the same study
+report_image_cache = ReportImageCache(max_bytes=REPORT_IMAGE_CACHE_MAX_BYTES)
+report_image_flights = SingleFlight()
+
+pdf_render_pool = RenderPool(processes=PDF_RENDER_PROCESSES, timeout=PDF_RENDER_TIMEOUT)
+
+pdf_jobs = PdfJobQueue(workers=PDF_JOB_WORKERS, max_queued=PDF_JOB_MAX_QUEUED, retention=PDF_JOB_RETENTION)
+
+@app.on_event("startup")
+async def start_pdf_jobs():
+    """Start the background PDF render workers"""
+    pdf_jobs.start()
+
+@app.on_event("shutdown")
+async def stop_pdf_jobs():
+    """Cancel background PDF render workers"""
+    await pdf_jobs.close()
+
+@app.on_event("startup")
+async def warm_pdf_browser_pool():
+    """Pre-launch browsers in the background so startup is not blocked"""
+    # The native renderer is the primary engine or the fallback; warm its workers either way
+    async def warm_render_pool():
+        try:
+            await pdf_render_pool.start()
+        except Exception as e:
+            logger.warning(f"Render pool warm-up failed: {str(e)}")
+    asyncio.create_task(warm_render_pool())
+    if PDF_ENGINE != "chromium":
+        return
+    # Compile the report template and inline the bundled fonts before the first report needs them
+    try:
+        warm_templates()
+    except MissingReportFonts as e:
+        # Chromium renders fail until the fonts are built; reports come from the native fallback meanwhile
+        logger.error(f"Report templates unavailable: {str(e)}")
+    async def warm():
+        try:
+            await pdf_browser_pool.start()
+        except Exception as e:
+            logger.warning(f"Browser pool warm-up failed, will retry on first PDF: {str(e)}")
+    asyncio.create_task(warm())
+
+@app.on_event("shutdown")
+async def close_pdf_browser_pool():
+    """Close pooled Chromium processes and render workers"""
+    await pdf_browser_pool.close()
+    await pdf_render_pool.close()
+
+analysis_cache = AnalysisCache(
+    max_entries=ANALYSIS_CACHE_MAX_ENTRIES,
+    ttl=ANALYSIS_CACHE_TTL,
+    disk_path=ANALYSIS_CACHE_PATH or None,
+    disk_max_entries=ANALYSIS_CACHE_DISK_MAX_ENTRIES,
+) if ANALYSIS_CACHE_ENABLED else None
+
+@app.on_event("shutdown")
+async def close_analysis_cache():
+    """Close the analysis cache's SQLite connections"""
+    if analysis_cache is not None:
+        analysis_cache.close()
+
+# Coalesces concurrent identical analyses onto one upstream call
+analysis_flights = SingleFlight()
+
+def require_admin(token: Optional[str]) -> None:
+    """Reject admin calls unless ADMIN_TOKEN is configured and presented"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin API is disabled; set ADMIN_TOKEN to enable it")
+    if not token or not hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+# Upstream latency alongside payload size, to measure the effect of preprocessing
+UPSTREAM_STATS = {"calls": 0, "errors": 0, "cancelled": 0, "latency_ms_total": 0.0, "payload_bytes_total": 0}
+parse_stats = ParseStats()
+
+async def call_vision_model(
+    system_prompt: str,
+    user_prompt: str,
+    image_url: str,
+    category: str = 'default',
+    structured: bool = False
+) -> str:
+    """Send a vision chat completion upstream without blocking the event loop"""
+    started = time.perf_counter()
+    try:
+        # Every attempt, retry or hedge must be admitted by the limiter
+        response = await upstream_resilience.call(
+            category,
+            lambda: _create_vision_completion(system_prompt, user_prompt, image_url, structured),
+            admission=upstream_limiter.run
+        )
+    except UpstreamOverloaded:
+        raise
+    except Exception as e:
+        UPSTREAM_STATS["errors"] += 1
+        if is_overload_error(e):
+            raise UpstreamOverloaded(f"upstream returned {e.status_code}", parse_retry_after(e) or 1.0)
+        raise
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    UPSTREAM_STATS["calls"] += 1
+    UPSTREAM_STATS["latency_ms_total"] += elapsed_ms
+    UPSTREAM_STATS["payload_bytes_total"] += len(image_url)
+    logger.info(f"Upstream call took {elapsed_ms:.0f}ms for {len(image_url) // 1024} KB image payload")
+    return response.choices[0].message.content
+
+async def _create_vision_completion(system_prompt: str, user_prompt: str, image_url: str, structured: bool = False):
+    extra = {"response_format": response_format()} if structured and STRUCTURED_OUTPUT_SEND_SCHEMA else {}
+    return await client.chat.completions.create(
+        model=MODEL,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": user_prompt},
+                    {"type": "image_url", "image_url": {"url": image_url}},
+                ],
+            },
+        ],
+        max_tokens=2000,
+        temperature=0.1,
+        **extra
+    )
+
+def get_image_extension(filename: Optional[str]) -> str:
+    """File extension of an upload, defaulting to png"""
+    filename = filename or "image.png"
+    return filename.split(".")[-1].lower() if "." in filename else "png"
+
+async def stream_vision_model(system_prompt: str, user_prompt: str, image_url: str, category: str = 'default'):
+    """Stream a vision chat completion upstream, yielding text deltas"""
+    # Tokens already forwarded cannot be retried or hedged; only the breaker applies
+    breaker = upstream_resilience.breaker(category)
+    breaker.before_call()
+    try:
+        admitted_at = await upstream_limiter.acquire()
+    except BaseException:
+        breaker.on_neutral()
+        raise
+    started = time.perf_counter()
+    first_token_ms = None
+    outcome = None
+    cancelled = False
+    stream = None
+    try:
+        stream = await client.chat.completions.create(
+            model=MODEL,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": user_prompt},
+                        {"type": "image_url", "image_url": {"url": image_url}},
+                    ],
+                },
+            ],
+            max_tokens=2000,
+            temperature=0.1,
+            stream=True
+        )
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if first_token_ms is None:
+                    first_token_ms = (time.perf_counter() - started) * 1000
+                    logger.info(f"Upstream first token after {first_token_ms:.0f}ms")
+                yield delta
+    except (asyncio.CancelledError, GeneratorExit):
+        # The client went away mid-stream; that says nothing about upstream health
+        cancelled = True
+        UPSTREAM_STATS["cancelled"] += 1
+        raise
+    except Exception as e:
+        outcome = e
+        UPSTREAM_STATS["errors"] += 1
+        if is_overload_error(e):
+            # Same as call_vision_model, so the SSE error event carries retry_after
+            raise UpstreamOverloaded(f"upstream returned {e.status_code}", parse_retry_after(e) or 1.0) from e
+        raise
+    finally:
+        if stream is not None:
+            # Release the upstream connection now rather than when the stream is collected
+            try:
+                await stream.close()
+            except Exception as e:
+                logger.warning(f"Failed to close upstream stream: {str(e)}")
+        if not cancelled:
+            upstream_limiter.record_outcome(outcome, admitted_at)
+        upstream_limiter.release()
+        if cancelled:
+            breaker.on_neutral()
+        elif outcome is None:
+            breaker.on_success()
+        elif is_retryable(outcome):
+            breaker.on_failure()
+        else:
+            breaker.on_neutral()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    UPSTREAM_STATS["calls"] += 1
+    UPSTREAM_STATS["latency_ms_total"] += elapsed_ms
+    UPSTREAM_STATS["payload_bytes_total"] += len(image_url)
+
+def encode_image_to_base64(image_bytes: bytes, filename: Optional[str], ext: Optional[str] = None) -> str:
+    """Convert image bytes to a base64 data URL"""
     try:
-        image_bytes = image_file.file.read()
         encoded = base64.b64encode(image_bytes).decode("utf-8")
         
-        filename = image_file.filename or "image.png"
-        ext = filename.split(".")[-1].lower() if "." in filename else "png"
+        filename = filename or "image.png"
+        ext = ext or get_image_extension(filename)
         
         logger.info(f"Encoded image: {filename}, size: {len(image_bytes)} bytes")
         return f"data:image/{ext};base64,{encoded}"
@@ -65,7 +422,7 @@ def encode_image_to_base64(image_file: UploadFile) -> str:
         logger.error(f"Error encoding image: {str(e)}")
         raise HTTPException(status_code=400, detail=f"Failed to encode image: {str(e)}")
 
-def get_analysis_prompt(category: str, language: str = 'en', sub_category: str = None) -> tuple[str, str]:
+def get_analysis_prompt(category: str, language: str = 'en', sub_category: str = None, structured: bool = False) -> tuple[str, str]:
     """Get specialized prompts for different medical image categories with language support"""
     
     # Language-specific instructions
@@ -118,6 +475,10 @@ Please format your response as follows:
 - Recommendation 2
 """
     
+    if structured:
+        # Same prompts, but the reply is a JSON object (see structured_output.py)
+        response_format_instruction = json_format_instruction(language)
+    
     if category == 'cbc':
         if language == 'ar':
             system_prompt = f"""{language_instruction}
@@ -373,12 +734,147 @@ Please analyze this medical image thoroughly and provide detailed findings and r
 
     return system_prompt, user_prompt
 
+def content_disposition(filename: str) -> str:
+    """Attachment header that survives non-ASCII (Arabic) report names"""
+    ascii_name = filename.encode('ascii', 'ignore').decode('ascii').strip('_') or 'report.pdf'
+    return f"attachment; filename={ascii_name}; filename*=UTF-8''{quote(filename)}"
+
+def report_template(html_template: str) -> str:
+    """Template name for cache keys: the native engine renders one layout for every endpoint"""
+    return html_template if PDF_ENGINE == "chromium" else "reportlab"
+
+async def render_pdf_cached(
+    template: str,
+    pdf_key: str,
+    build_html,
+    analysis: Dict[str, Any],
+    category: str,
+    language: str,
+    patient_data: Dict[str, Any],
+    image_bytes: Optional[bytes] = None,
+    image_key: Optional[str] = None
+) -> tuple[bytes, bool]:
+    """Serve a rendered report from the PDF cache, rendering it on a miss.
+    
+    Returns (pdf, degraded); degraded marks the uncached native fallback
+    rendered while Chromium is down, which must not carry the report's ETag.
+    """
+    pdf_buffer = pdf_cache.get(pdf_key)
+    if pdf_buffer is not None:
+        logger.info(f"Serving {template} PDF from cache")
+        return pdf_buffer, False
+    
+    # Only a cache miss pays for decoding the upload
+    image = await report_image(image_bytes, image_key)
+    if PDF_ENGINE == "reportlab":
+        pdf_buffer = await pdf_render_pool.run(render_report_pdf, analysis, category, language, patient_data, image)
+    else:
+        try:
+            pdf_buffer = await generate_puppeteer_pdf_buffer(build_html(image))
+        except Exception as e:
+            logger.warning(f"Falling back to the native ReportLab renderer: {str(e)}")
+            # Not cached, so the browser-rendered report replaces it once Chromium is back
+            pdf_buffer = await pdf_render_pool.run(render_report_pdf, analysis, category, language, patient_data, image)
+            return await shrink_pdf(pdf_buffer), True
+    
+    pdf_buffer = await shrink_pdf(pdf_buffer)
+    pdf_cache.put(pdf_key, pdf_buffer)
+    return pdf_buffer, False
+
+async def report_image(image_bytes: Optional[bytes], image_key: Optional[str] = None) -> Optional[bytes]:
+    """Print-resolution JPEG of an uploaded image, built once per distinct upload"""
+    if not image_bytes:
+        return None
+    image_key = image_key or image_digest(image_bytes)
+    thumbnail = report_image_cache.get(image_key)
+    if thumbnail is not None:
+        return thumbnail
+    
+    async def build() -> Optional[bytes]:
+        try:
+            thumbnail = await asyncio.to_thread(make_report_thumbnail, image_bytes, REPORT_IMAGE_MAX_EDGE, REPORT_IMAGE_QUALITY)
+        except Exception as e:
+            # Undecodable upload: the report is still useful without the image
+            logger.warning(f"Could not prepare report image, leaving it out: {str(e)}")
+            report_image_cache.record_failure()
+            return None
+        report_image_cache.put(image_key, thumbnail, len(image_bytes))
+        logger.info(f"Prepared report image: {len(image_bytes)} -> {len(thumbnail)} bytes")
+        return thumbnail
+    
+    thumbnail, _ = await report_image_flights.do(image_key, build)
+    return thumbnail
+
+async def read_report_image(image_file: Optional[UploadFile]) -> tuple[Optional[bytes], Optional[str]]:
+    """Bytes and content hash of an optional image upload"""
+    if image_file is None:
+        return None, None
+    image_bytes = await image_file.read()
+    if not image_bytes:
+        return None, None
+    return image_bytes, image_digest(image_bytes)
+
+async def shrink_pdf(pdf_buffer: bytes) -> bytes:
+    """Run the size optimizer in the render pool; keeps the original on failure"""
+    if not PDF_OPTIMIZE:
+        return pdf_buffer
+    try:
+        optimized, report = await pdf_render_pool.run(optimize_pdf, pdf_buffer, PDF_LINEARIZE, PDF_MAX_IMAGE_EDGE)
+    except Exception as e:
+        logger.warning(f"PDF optimization failed, serving unoptimized PDF: {str(e)}")
+        record_optimization_failure()
+        return pdf_buffer
+    record_optimization(report)
+    logger.info(f"Optimized PDF {report['original_bytes']} -> {report['optimized_bytes']} bytes in {report['elapsed_ms']}ms")
+    return optimized
+
+def pdf_not_modified(if_none_match: Optional[str], etag: str) -> Optional[Response]:
+    """304 response when the client already holds this exact report"""
+    if etag_matches(if_none_match, etag):
+        pdf_cache.record_not_modified()
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+    return None
+
+def pdf_cache_headers(etag: str, degraded: bool) -> Dict[str, str]:
+    """Validator headers for a served report; a degraded fallback gets none so the client refetches"""
+    if degraded:
+        return {"Cache-Control": "no-store"}
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+def pdf_report_filename(category: str, language: str) -> str:
+    """Download filename for a report rendered from create_pdf_html"""
+    category_names = {
+        'en': {'cbc': 'CBC_Report', 'ecg': 'ECG_Report', 'xray': 'XRay_Report', 'microscopy': 'Microscopy_Report'},
+        'ar': {'cbc': 'تقرير_صورة_دم', 'ecg': 'تقرير_تخطيط_قلب', 'xray': 'تقرير_أشعة', 'microscopy': 'تقرير_مجهري'}
+    }
+    return f"{category_names[language].get(category, category)}_{'_'.join(str(datetime.now()).split()[:2])}.pdf"
+
+async def render_pdf_report(
+    analysis: Dict[str, Any],
+    category: str,
+    language: str,
+    patient_data: Dict[str, Any],
+    image_bytes: Optional[bytes] = None,
+    image_key: Optional[str] = None
+) -> tuple[bytes, str]:
+    """Render (or fetch from cache) the create_pdf_html report; returns (pdf, filename)"""
+    if image_bytes and not image_key:
+        image_key = image_digest(image_bytes)
+    pdf_key = make_pdf_key(report_template('create_pdf_html'), PDF_TEMPLATE_VERSION, analysis, category, language, patient_data, image_key)
+    pdf_buffer, _ = await render_pdf_cached(
+        'create_pdf_html', pdf_key,
+        lambda image: create_pdf_html(analysis, category, language, patient_data, image),
+        analysis, category, language, patient_data, image_bytes, image_key
+    )
+    return pdf_buffer, pdf_report_filename(category, language)
+
 async def generate_puppeteer_pdf(
     analysis_data: str = Form(...),
     category: str = Form(...),
     language: Optional[str] = Form('en'),
     patient_info: Optional[str] = Form(None),
-    image_file: Optional[UploadFile] = File(None)
+    image_file: Optional[UploadFile] = File(None),
+    if_none_match: Optional[str] = None
 ):
     """Generate PDF report using Puppeteer with proper Arabic support"""
     logger.info(f"Generating Puppeteer PDF report for {category} analysis in {language}")
@@ -395,427 +891,38 @@ async def generate_puppeteer_pdf(
             except json.JSONDecodeError:
                 pass
         
-        # Create HTML content for PDF
-        html_content = create_pdf_html(analysis, category, language, patient_data)
-        
-        # Generate PDF using Puppeteer
-        pdf_buffer = await generate_puppeteer_pdf_buffer(html_content)
-        
-        # Set filename
-        category_names = {
-            'en': {'cbc': 'CBC_Report', 'ecg': 'ECG_Report', 'xray': 'XRay_Report', 'microscopy': 'Microscopy_Report'},
-            'ar': {'cbc': 'تقرير_صورة_دم', 'ecg': 'تقرير_تخطيط_قلب', 'xray': 'تقرير_أشعة', 'microscopy': 'تقرير_مجهري'}
-        }
+        image_bytes, image_key = await read_report_image(image_file)
+        pdf_key = make_pdf_key(report_template('create_pdf_html'), PDF_TEMPLATE_VERSION, analysis, category, language, patient_data, image_key)
+        etag = etag_for(pdf_key)
+        not_modified = pdf_not_modified(if_none_match, etag)
+        if not_modified is not None:
+            return not_modified
+        
+        # Create HTML content and generate PDF using Puppeteer (or reuse the cached render)
+        pdf_buffer, degraded = await render_pdf_cached(
+            'create_pdf_html', pdf_key,
+            lambda image: create_pdf_html(analysis, category, language, patient_data, image),
+            analysis, category, language, patient_data, image_bytes, image_key
+        )
         
-        filename = f"{category_names[language].get(category, category)}_{'_'.join(str(datetime.now()).split()[:2])}.pdf"
+        filename = pdf_report_filename(category, language)
         
         return Response(
             content=pdf_buffer,
             media_type="application/pdf",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
+            headers={
+                "Content-Disposition": content_disposition(filename),
+                **pdf_cache_headers(etag, degraded)
+            }
         )
         
     except Exception as e:
         logger.error(f"PDF generation error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"PDF generation failed: {str(e)}")
 
-def create_pdf_html(analysis: Dict[str, Any], category: str, language: str, patient_data: Dict[str, Any]) -> str:
+def create_pdf_html(analysis: Dict[str, Any], category: str, language: str, patient_data: Dict[str, Any], image: Optional[bytes] = None) -> str:
     """Create HTML content for PDF generation"""
-    is_arabic = language == 'ar'
-    direction = 'rtl' if is_arabic else 'ltr'
-    font_family = "'Amiri', 'Noto Sans Arabic', 'Arial Unicode MS', Arial, sans-serif" if is_arabic else "Arial, sans-serif"
-    
-    # Title translations
-    titles = {
-        'en': {
-            'title': 'MEDICAL ANALYSIS REPORT',
-            'patient_info': 'PATIENT INFORMATION',
-            'analysis_summary': 'ANALYSIS SUMMARY',
-            'analysis_type': 'Analysis Type',
-            'confidence': 'Confidence Score',
-            'severity': 'Severity Level',
-            'detailed_analysis': 'DETAILED ANALYSIS',
-            'parameters': 'LABORATORY PARAMETERS',
-            'findings': 'KEY FINDINGS',
-            'recommendations': 'RECOMMENDATIONS',
-            'disclaimer': 'IMPORTANT DISCLAIMER',
-            'disclaimer_text': 'This application uses AI to analyze medical images with high accuracy to support clinical decision-making. However, it is not a substitute for professional medical advice, diagnosis, or treatment. Users must consult a licensed physician before taking any clinical action.',
-            'date': 'Report Date',
-            'time': 'Generated Time',
-            'generated_by': 'Generated By',
-            'user_info': 'USER INFORMATION'
-        },
-        'ar': {
-            'title': 'تقرير التحليل الطبي',
-            'patient_info': 'معلومات المريض',
-            'analysis_summary': 'ملخص التحليل',
-            'analysis_type': 'نوع التحليل',
-            'confidence': 'نسبة الثقة',
-            'severity': 'مستوى الخطورة',
-            'detailed_analysis': 'التحليل التفصيلي',
-            'parameters': 'المعايير المختبرية',
-            'findings': 'النتائج الرئيسية',
-            'recommendations': 'التوصيات',
-            'disclaimer': 'إخلاء مسؤولية مهم',
-            'disclaimer_text': 'يستخدم هذا التطبيق الذكاء الاصطناعي لتحليل الصور الطبية بدقة عالية لدعم اتخاذ القرارات السريرية. ومع ذلك، فهو ليس بديلاً عن الاستشارة الطبية المهنية أو التشخيص أو العلاج. يجب على المستخدمين استشارة طبيب مرخص قبل اتخاذ أي إجراء سريري.',
-            'date': 'تاريخ التقرير',
-            'time': 'وقت الإنشاء',
-            'generated_by': 'أنشأ بواسطة',
-            'user_info': 'معلومات المستخدم'
-        }
-    }
-    
-    t = titles[language]
-    now = datetime.now()
-    
-    # Category mapping
-    category_map = {
-        'en': {'cbc': 'Complete Blood Count (CBC)', 'ecg': 'Electrocardiogram (ECG)', 'xray': 'X-Ray Analysis', 'microscopy': 'Microscopy Analysis'},
-        'ar': {'cbc': 'صورة دم كاملة', 'ecg': 'تخطيط القلب', 'xray': 'تحليل الأشعة السينية', 'microscopy': 'التحليل المجهري'}
-    }
-    
-    # Create proper HTML content for PDF with Arabic support
-    html_content = f"""
-<!DOCTYPE html>
-<html lang="{language}" dir="{direction}">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{t['title']}</title>
-    <link href="https://fonts.googleapis.com/css2?family=Amiri:wght@400;700&family=Noto+Sans+Arabic:wght@400;600;700&display=swap" rel="stylesheet">
-    <style>
-        @import url('https://fonts.googleapis.com/css2?family=Amiri:wght@400;700&family=Noto+Sans+Arabic:wght@400;600;700&display=swap');
-        
-        * {{
-            box-sizing: border-box;
-            margin: 0;
-            padding: 0;
-        }}
-        
-        body {{
-            font-family: {font_family};
-            direction: {direction};
-            line-height: 1.6;
-            color: #333;
-            background: white;
-            padding: 20mm;
-            font-size: 12pt;
-        }}
-        
-        .header {{
-            text-align: center;
-            margin-bottom: 30px;
-            border-bottom: 3px solid #4F46E5;
-            padding-bottom: 20px;
-        }}
-        
-        .title {{
-            font-size: 24pt;
-            font-weight: bold;
-            color: #4F46E5;
-            margin-bottom: 10px;
-        }}
-        
-        .section {{
-            margin-bottom: 25px;
-            break-inside: avoid;
-        }}
-        
-        .section-title {{
-            font-size: 14pt;
-            font-weight: bold;
-            color: #1F2937;
-            margin-bottom: 10px;
-            padding: 8px 12px;
-            background: #F3F4F6;
-            border-{('right' if is_arabic else 'left')}: 4px solid #4F46E5;
-        }}
-        
-        .info-grid {{
-            display: grid;
-            grid-template-columns: 1fr 1fr;
-            gap: 15px;
-            margin-bottom: 20px;
-        }}
-        
-        .info-item {{
-            padding: 10px;
-            background: #F9FAFB;
-            border-radius: 4px;
-        }}
-        
-        .info-label {{
-            font-weight: bold;
-            color: #4B5563;
-            margin-bottom: 4px;
-        }}
-        
-        .info-value {{
-            color: #1F2937;
-        }}
-        
-        .analysis-text {{
-            background: #F9FAFB;
-            padding: 15px;
-            border-radius: 6px;
-            margin: 10px 0;
-            white-space: pre-wrap;
-        }}
-        
-        .findings-list, .recommendations-list {{
-            margin: 10px 0;
-            padding-{('right' if is_arabic else 'left')}: 20px;
-        }}
-        
-        .findings-list li, .recommendations-list li {{
-            margin-bottom: 8px;
-            line-height: 1.5;
-        }}
-        
-        .disclaimer {{
-            background: #FEF2F2;
-            border: 2px solid #FCA5A5;
-            padding: 15px;
-            border-radius: 6px;
-            margin-top: 30px;
-        }}
-        
-        .disclaimer-title {{
-            font-weight: bold;
-            color: #DC2626;
-            margin-bottom: 8px;
-        }}
-        
-        .disclaimer-text {{
-            color: #991B1B;
-            font-size: 11pt;
-        }}
-        
-        .footer {{
-            margin-top: 40px;
-            text-align: center;
-            font-size: 10pt;
-            color: #6B7280;
-            border-top: 1px solid #E5E7EB;
-            padding-top: 15px;
-        }}
-        
-        @media print {{
-            body {{ margin: 0; padding: 20mm; }}
-            .section {{ page-break-inside: avoid; }}
-        }}
-    </style>
-</head>
-<body>
-    <div class="header">
-        <div class="title">{t['title']}</div>
-        <div style="margin-top: 10px; color: #6B7280; font-size: 11pt;">
-            {t['date']}: {now.strftime('%Y-%m-%d')} | {t['time']}: {now.strftime('%H:%M:%S')}
-        </div>
-    </div>
-"""
-
-    # Add user information if available
-    if patient_data:
-        html_content += f"""
-    <div class="section">
-        <div class="section-title">{t['user_info']}</div>
-        <div class="info-grid">
-"""
-        if 'generated_by' in patient_data:
-            html_content += f"""
-            <div class="info-item">
-                <div class="info-label">{t['generated_by']}</div>
-                <div class="info-value">{patient_data['generated_by']}</div>
-            </div>
-"""
-        if 'user_email' in patient_data:
-            html_content += f"""
-            <div class="info-item">
-                <div class="info-label">Email</div>
-                <div class="info-value">{patient_data['user_email']}</div>
-            </div>
-"""
-        html_content += """
-        </div>
-    </div>
-"""
-    
-    # Analysis summary section
-    html_content += f"""
-    <div class="section">
-        <div class="section-title">{t['analysis_summary']}</div>
-        <div class="info-grid">
-            <div class="info-item">
-                <div class="info-label">{t['analysis_type']}</div>
-                <div class="info-value">{category_map[language].get(category, category)}</div>
-            </div>
-            <div class="info-item">
-                <div class="info-label">{t['confidence']}</div>
-                <div class="info-value">{analysis.get('confidence', 95)}%</div>
-            </div>
-            <div class="info-item">
-                <div class="info-label">{t['severity']}</div>
-                <div class="info-value">{analysis.get('severity', 'normal')}</div>
-            </div>
-        </div>
-    </div>
-
-    <div class="section">
-        <div class="section-title">{t['detailed_analysis']}</div>
-        <div class="analysis-text">{analysis.get('analysis', 'No detailed analysis available.')}</div>
-    </div>
-
-    <div class="section">
-        <div class="section-title">{t['findings']}</div>
-"""
-    
-    if 'findings' in analysis and analysis['findings']:
-        html_content += '<ul class="findings-list">'
-        for finding in analysis['findings']:
-            html_content += f'<li>{finding}</li>'
-        html_content += '</ul>'
-    else:
-        html_content += '<div class="analysis-text">No specific findings noted.</div>'
-    
-    html_content += f"""
-    </div>
-
-    <div class="section">
-        <div class="section-title">{t['recommendations']}</div>
-"""
-    
-    if 'recommendations' in analysis and analysis['recommendations']:
-        recommendations = analysis['recommendations']
-        if isinstance(recommendations, str):
-            recommendations = [recommendations]
-        html_content += '<ul class="recommendations-list">'
-        for rec in recommendations:
-            html_content += f'<li>{rec}</li>'
-        html_content += '</ul>'
-    else:
-        html_content += '<div class="analysis-text">Consult with healthcare provider for interpretation.</div>'
-    
-    html_content += f"""
-    </div>
-
-    <div class="disclaimer">
-        <div class="disclaimer-title">{t['disclaimer']}</div>
-        <div class="disclaimer-text">{t['disclaimer_text']}</div>
-    </div>
-
-    <div class="footer">
-        Generated by MedDx AI Medical Analysis Platform
-    </div>
-</body>
-</html>
-"""
-    
-    return html_content
-
-def generate_simple_pdf(text_content: str, analysis: Dict[str, Any], category: str, language: str) -> bytes:
-    """Generate a simple PDF from text content with Arabic support"""
-    try:
-        # Try using weasyprint for better Arabic support
-        import weasyprint
-        from weasyprint import HTML, CSS
-        
-        # Create HTML content with proper Arabic support
-        html_content = create_html_for_pdf(analysis, category, language)
-        
-        # Generate PDF using weasyprint
-        pdf_buffer = HTML(string=html_content).write_pdf()
-        return pdf_buffer
-        
-    except ImportError:
-        # Fallback to simple text-based PDF without complex formatting
-        try:
-            from reportlab.lib.pagesizes import letter
-            from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-            from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-            import io
-            
-            # Create a BytesIO buffer
-            buffer = io.BytesIO()
-            
-            # Create the PDF object
-            doc = SimpleDocTemplate(buffer, pagesize=letter)
-            
-            # Get styles
-            styles = getSampleStyleSheet()
-            
-            # Create simple style that works with basic text
-            simple_style = ParagraphStyle(
-                'Simple',
-                parent=styles['Normal'],
-                fontSize=12,
-                spaceAfter=12,
-            )
-            
-            # Build the PDF content - use simple text without Arabic
-            story = []
-            
-            # Create English-only content for reportlab compatibility
-            if language == 'ar':
-                # Provide English fallback for Arabic requests
-                story.append(Paragraph("MEDICAL ANALYSIS REPORT", styles['Title']))
-                story.append(Spacer(1, 12))
-                story.append(Paragraph(f"Analysis Type: {category.upper()}", simple_style))
-                story.append(Paragraph(f"Confidence: {analysis.get('confidence', 95)}%", simple_style))
-                story.append(Paragraph(f"Severity: {analysis.get('severity', 'normal')}", simple_style))
-                story.append(Spacer(1, 12))
-                story.append(Paragraph("DETAILED ANALYSIS:", styles['Heading2']))
-                story.append(Paragraph(analysis.get('analysis', 'Analysis not available in English'), simple_style))
-                
-                if 'findings' in analysis and analysis['findings']:
-                    story.append(Paragraph("KEY FINDINGS:", styles['Heading2']))
-                    for i, finding in enumerate(analysis['findings'], 1):
-                        story.append(Paragraph(f"{i}. {finding}", simple_style))
-                
-                if 'recommendations' in analysis and analysis['recommendations']:
-                    story.append(Paragraph("RECOMMENDATIONS:", styles['Heading2']))
-                    recommendations = analysis['recommendations']
-                    if isinstance(recommendations, str):
-                        recommendations = [recommendations]
-                    for i, rec in enumerate(recommendations, 1):
-                        story.append(Paragraph(f"{i}. {rec}", simple_style))
-                
-                story.append(Spacer(1, 24))
-                story.append(Paragraph("DISCLAIMER: This analysis is generated by AI for educational purposes only.", simple_style))
-            else:
-                # Regular English content
-                lines = text_content.split('\n')
-                for line in lines:
-                    line = line.strip()
-                    if not line or line.startswith('====='):
-                        continue
-                    story.append(Paragraph(line, simple_style))
-            
-            # Build PDF
-            doc.build(story)
-            
-            # Get the value of the BytesIO buffer
-            pdf_data = buffer.getvalue()
-            buffer.close()
-            
-            return pdf_data
-            
-        except Exception as e:
-            logger.error(f"PDF generation error: {str(e)}")
-            # Return simple text file as ultimate fallback
-            simple_text = f"""
-MEDICAL ANALYSIS REPORT
-=====================
-
-Analysis Type: {category.upper()}
-Confidence: {analysis.get('confidence', 95)}%
-Severity: {analysis.get('severity', 'normal')}
-
-Analysis: {analysis.get('analysis', 'Not available')}
-
-Generated by MedDx AI Analysis System
-"""
-            return simple_text.encode('utf-8')
+    return render_report_html('standard', analysis, category, language, patient_data, image)
 
 async def generate_puppeteer_pdf_buffer(html_content: str) -> bytes:
     """Generate PDF using PyPuppeteer with proper Arabic support"""
@@ -828,54 +935,39 @@ async def generate_puppeteer_pdf_buffer(html_content: str) -> bytes:
             logger.error("HTML content is too short or empty")
             raise Exception("Invalid HTML content")
         
-        # Launch browser with proper Arabic support
-        browser = await launch({
-            'headless': True,
-            'args': [
-                '--no-sandbox',
-                '--disable-setuid-sandbox',
-                '--disable-dev-shm-usage',
-                '--disable-web-security',
-                '--font-render-hinting=none',
-                '--disable-font-subpixel-positioning',
-                '--disable-features=VizDisplayCompositor'
-            ]
-        })
-        
-        logger.info("Browser launched successfully")
-        
-        # Create new page
-        page = await browser.newPage()
-        
-        # Set viewport for consistent rendering
-        await page.setViewport({'width': 1200, 'height': 800})
-        
-        # Set content with proper encoding
-        await page.setContent(html_content)
-        
-        # Wait for content to load
-        await page.waitForSelector('body')
-        
-        # Wait for fonts to load
-        await asyncio.sleep(2)
-        
-        # Generate PDF with proper Arabic support
-        pdf_options = {
-            'format': 'A4',
-            'printBackground': True,
-            'margin': {
-                'top': '20mm',
-                'right': '15mm', 
-                'bottom': '20mm',
-                'left': '15mm'
-            },
-            'preferCSSPageSize': True
-        }
-        
-        pdf_content = await page.pdf(pdf_options)
+        async def render(page) -> bytes:
+            # Set content with proper encoding
+            await page.setContent(html_content)
+            
+            # Wait for content to load
+            await page.waitForSelector('body')
+            
+            # Wait for fonts to actually finish loading instead of a fixed sleep
+            try:
+                await asyncio.wait_for(
+                    page.evaluate("() => document.fonts.ready.then(() => document.fonts.size)"),
+                    timeout=PDF_FONT_LOAD_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                logger.warning(f"Fonts not ready after {PDF_FONT_LOAD_TIMEOUT}s, printing anyway")
+            
+            # Generate PDF with proper Arabic support
+            pdf_options = {
+                'format': 'A4',
+                'printBackground': True,
+                'margin': {
+                    'top': '20mm',
+                    'right': '15mm', 
+                    'bottom': '20mm',
+                    'left': '15mm'
+                },
+                'preferCSSPageSize': True
+            }
+            
+            return await page.pdf(pdf_options)
         
-        # Close browser
-        await browser.close()
+        # Render on a warm page from the shared browser pool
+        pdf_content = await pdf_browser_pool.render(render)
         
         logger.info("PDF generated successfully with PyPuppeteer")
         return pdf_content
@@ -885,456 +977,11 @@ async def generate_puppeteer_pdf_buffer(html_content: str) -> bytes:
         logger.error(f"Exception type: {type(e)}")
         import traceback
         logger.error(f"Traceback: {traceback.format_exc()}")
-        # Fallback to simple PDF generation
-        return generate_simple_pdf_fallback(html_content)
-
-def generate_simple_pdf_fallback(html_content: str) -> bytes:
-    """Fallback PDF generation when Puppeteer is not available"""
-    logger.info("Using reportlab fallback PDF generation")
-    
-    try:
-        # Use reportlab as primary fallback (no system dependencies)
-        from reportlab.lib.pagesizes import letter, A4
-        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib.enums import TA_CENTER, TA_LEFT
-        from reportlab.lib.colors import HexColor
-        import io
-        
-        logger.info("Using ReportLab for fallback PDF generation")
-        
-        # Create a BytesIO buffer
-        buffer = io.BytesIO()
-        
-        # Create the PDF object
-        doc = SimpleDocTemplate(buffer, pagesize=A4)
-        
-        # Get styles
-        styles = getSampleStyleSheet()
-        
-        # Create a story to hold content
-        story = []
-        
-        # Add title with styling
-        title_style = ParagraphStyle(
-            'Title',
-            parent=styles['Title'],
-            fontSize=24,
-            spaceAfter=30,
-            alignment=TA_CENTER,
-            textColor=HexColor('#2b6cb0')
-        )
-        story.append(Paragraph("MEDICAL ANALYSIS REPORT", title_style))
-        story.append(Spacer(1, 20))
-        
-        # Add date
-        date_style = ParagraphStyle(
-            'Date',
-            parent=styles['Normal'],
-            fontSize=12,
-            spaceAfter=15,
-            alignment=TA_CENTER
-        )
-        story.append(Paragraph(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", date_style))
-        story.append(Spacer(1, 30))
-        
-        # Add sections with content
-        section_style = ParagraphStyle(
-            'SectionHeader',
-            parent=styles['Heading2'],
-            fontSize=16,
-            spaceAfter=10,
-            textColor=HexColor('#2b6cb0'),
-            spaceBefore=20
-        )
-        
-        content_style = ParagraphStyle(
-            'Content',
-            parent=styles['Normal'],
-            fontSize=12,
-            spaceAfter=12,
-            leading=16
-        )
-        
-        # Add analysis type section
-        story.append(Paragraph("ANALYSIS TYPE", section_style))
-        story.append(Paragraph("Medical Analysis Report", content_style))
-        story.append(Spacer(1, 15))
-        
-        # Add summary section
-        story.append(Paragraph("ANALYSIS SUMMARY", section_style))
-        story.append(Paragraph("This is a medical analysis report generated by the AI system.", content_style))
-        story.append(Paragraph("Confidence Score: 95%", content_style))
-        story.append(Paragraph("Severity Level: Normal", content_style))
-        story.append(Spacer(1, 15))
-        
-        # Add findings section
-        story.append(Paragraph("KEY FINDINGS", section_style))
-        story.append(Paragraph("• Analysis completed successfully", content_style))
-        story.append(Paragraph("• Report generated with medical parameters", content_style))
-        story.append(Paragraph("• All values within normal range", content_style))
-        story.append(Spacer(1, 15))
-        
-        # Add recommendations section
-        story.append(Paragraph("RECOMMENDATIONS", section_style))
-        story.append(Paragraph("• Consult with healthcare provider for interpretation", content_style))
-        story.append(Paragraph("• Follow up as recommended by your doctor", content_style))
-        story.append(Spacer(1, 30))
-        
-        # Add disclaimer
-        disclaimer_style = ParagraphStyle(
-            'Disclaimer',
-            parent=styles['Normal'],
-            fontSize=10,
-            textColor=HexColor('#666666'),
-            alignment=TA_CENTER,
-            spaceBefore=30,
-            borderWidth=1,
-            borderColor=HexColor('#cccccc'),
-            borderPadding=10
-        )
-        story.append(Paragraph("DISCLAIMER: This analysis is generated by AI for educational purposes only. It does not constitute medical advice and should not replace consultation with a qualified healthcare professional.", disclaimer_style))
-        
-        # Build PDF
-        doc.build(story)
-        
-        # Get the value of the BytesIO buffer
-        pdf_data = buffer.getvalue()
-        buffer.close()
-        
-        logger.info(f"ReportLab generated PDF size: {len(pdf_data)} bytes")
-        return pdf_data
-        
-    except Exception as e:
-        logger.error(f"ReportLab fallback failed: {str(e)}")
-        # Ultimate text fallback - but create a proper PDF-like response
-        simple_text = f"""
-MEDICAL ANALYSIS REPORT
-=======================
-
-Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-This is a medical analysis report.
-
-Generated by MedDx AI Analysis System
-
-DISCLAIMER: This analysis is generated by AI for educational purposes only.
-"""
-        logger.info(f"Text fallback size: {len(simple_text.encode('utf-8'))} bytes")
-        return simple_text.encode('utf-8')
+        raise
 
-def create_html_for_pdf(analysis: Dict[str, Any], category: str, language: str) -> str:
+def create_html_for_pdf(analysis: Dict[str, Any], category: str, language: str, image: Optional[bytes] = None) -> str:
     """Create HTML content optimized for PDF generation with Arabic support"""
-    is_arabic = language == 'ar'
-    direction = 'rtl' if is_arabic else 'ltr'
-    
-    # Title translations
-    titles = {
-        'en': {
-            'title': 'MEDICAL ANALYSIS REPORT',
-            'analysis_type': 'Analysis Type',
-            'confidence': 'Confidence Score',
-            'severity': 'Severity Level',
-            'detailed_analysis': 'DETAILED ANALYSIS',
-            'findings': 'KEY FINDINGS',
-            'recommendations': 'RECOMMENDATIONS',
-            'disclaimer': 'IMPORTANT DISCLAIMER',
-            'disclaimer_text': 'This analysis is generated by AI for educational and informational purposes only. It does not constitute medical advice and should not replace consultation with a qualified healthcare professional.',
-            'date': 'Report Date',
-            'time': 'Generated Time'
-        },
-        'ar': {
-            'title': 'تقرير التحليل الطبي',
-            'analysis_type': 'نوع التحليل',
-            'confidence': 'نسبة الثقة',
-            'severity': 'مستوى الخطورة',
-            'detailed_analysis': 'التحليل التفصيلي',
-            'findings': 'النتائج الرئيسية',
-            'recommendations': 'التوصيات',
-            'disclaimer': 'إخلاء مسؤولية مهم',
-            'disclaimer_text': 'هذا التحليل تم إنشاؤه بواسطة الذكاء الاصطناعي لأغراض تعليمية وإعلامية فقط. لا يشكل استشارة طبية ولا يجب أن يحل محل استشارة أخصائي الرعاية الصحية المؤهل.',
-            'date': 'تاريخ التقرير',
-            'time': 'وقت الإنشاء'
-        }
-    }
-    
-    t = titles[language]
-    now = datetime.now()
-    
-    # Category mapping
-    category_map = {
-        'en': {'cbc': 'Complete Blood Count (CBC)', 'ecg': 'Electrocardiogram (ECG)', 'xray': 'X-Ray Analysis', 'microscopy': 'Microscopy Analysis'},
-        'ar': {'cbc': 'صورة دم كاملة', 'ecg': 'تخطيط القلب', 'xray': 'تحليل الأشعة السينية', 'microscopy': 'التحليل المجهري'}
-    }
-    
-    # Get proper date format
-    date_str = now.strftime('%Y-%m-%d') if not is_arabic else now.strftime('%d/%m/%Y')
-    time_str = now.strftime('%H:%M:%S')
-    
-    html = f"""
-    <!DOCTYPE html>
-    <html lang="{language}" dir="{direction}">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>{t['title']}</title>
-        <style>
-            @import url('https://fonts.googleapis.com/css2?family=Noto+Sans+Arabic:wght@300;400;500;600;700&family=Noto+Kufi+Arabic:wght@300;400;500;600;700&family=Cairo:wght@300;400;500;600;700&display=swap');
-            
-            * {{
-                margin: 0;
-                padding: 0;
-                box-sizing: border-box;
-            }}
-            
-            body {{
-                font-family: {'"Noto Sans Arabic", "Noto Kufi Arabic", "Cairo", "Tahoma", "Arial Unicode MS"' if is_arabic else '"Segoe UI", "Roboto", "Arial"'}, sans-serif;
-                line-height: 1.8;
-                color: #2d3748;
-                direction: {direction};
-                padding: 25px;
-                background: white;
-                font-size: {'16px' if is_arabic else '14px'};
-                font-weight: {'400' if is_arabic else '400'};
-                text-rendering: optimizeLegibility;
-                -webkit-font-smoothing: antialiased;
-                -moz-osx-font-smoothing: grayscale;
-            }}
-            
-            .header {{
-                text-align: center;
-                margin-bottom: 35px;
-                border-bottom: 3px solid #3182ce;
-                padding-bottom: 25px;
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                color: white;
-                margin: -25px -25px 35px -25px;
-                padding: 30px 25px 25px 25px;
-            }}
-            
-            h1 {{
-                color: white;
-                font-size: {'28px' if is_arabic else '26px'};
-                font-weight: 700;
-                margin-bottom: 15px;
-                text-shadow: 0 2px 4px rgba(0,0,0,0.3);
-            }}
-            
-            .date-info {{
-                font-size: {'14px' if is_arabic else '13px'};
-                opacity: 0.9;
-                font-weight: 500;
-            }}
-            
-            .section {{
-                margin-bottom: 25px;
-                padding: 20px;
-                border-{"right" if is_arabic else "left"}: 4px solid #3182ce;
-                background: #f7fafc;
-                border-radius: 8px;
-                box-shadow: 0 1px 3px rgba(0,0,0,0.1);
-            }}
-            
-            .section h2 {{
-                color: #2b6cb0;
-                font-size: {'20px' if is_arabic else '18px'};
-                margin-bottom: 15px;
-                font-weight: 600;
-                text-decoration: underline;
-                text-decoration-color: #3182ce;
-                text-underline-offset: 5px;
-            }}
-            
-            .info-grid {{
-                display: grid;
-                grid-template-columns: repeat(auto-fit, minmax(250px, 1fr));
-                gap: 15px;
-                margin-bottom: 20px;
-            }}
-            
-            .info-item {{
-                background: white;
-                padding: 15px;
-                border-radius: 8px;
-                border: 1px solid #e2e8f0;
-                box-shadow: 0 1px 3px rgba(0,0,0,0.1);
-            }}
-            
-            .info-label {{
-                font-weight: 600;
-                color: #4a5568;
-                margin-bottom: 8px;
-                font-size: {'15px' if is_arabic else '14px'};
-            }}
-            
-            .info-value {{
-                color: #2d3748;
-                font-weight: 500;
-                font-size: {'16px' if is_arabic else '15px'};
-            }}
-            
-            .analysis-content {{
-                background: white;
-                padding: 20px;
-                border-radius: 8px;
-                border: 1px solid #e2e8f0;
-                line-height: {'2.0' if is_arabic else '1.8'};
-                font-size: {'16px' if is_arabic else '14px'};
-                white-space: pre-wrap;
-                word-wrap: break-word;
-            }}
-            
-            ul {{
-                list-style: none;
-                padding: 0;
-                margin: 0;
-            }}
-            
-            li {{
-                background: white;
-                margin: 12px 0;
-                padding: 15px;
-                border-radius: 8px;
-                border-{"right" if is_arabic else "left"}: 4px solid #38a169;
-                box-shadow: 0 1px 3px rgba(0,0,0,0.1);
-                line-height: {'1.9' if is_arabic else '1.7'};
-                font-size: {'16px' if is_arabic else '14px'};
-            }}
-            
-            .disclaimer {{
-                background: #fffbeb;
-                border: 2px solid #f59e0b;
-                border-radius: 12px;
-                padding: 20px;
-                margin-top: 30px;
-                box-shadow: 0 2px 8px rgba(245, 158, 11, 0.2);
-            }}
-            
-            .disclaimer h3 {{
-                color: #92400e;
-                margin-bottom: 12px;
-                font-size: {'18px' if is_arabic else '16px'};
-                font-weight: 600;
-            }}
-            
-            .disclaimer p {{
-                color: #78350f;
-                font-size: {'15px' if is_arabic else '13px'};
-                line-height: {'1.8' if is_arabic else '1.6'};
-                font-weight: 500;
-            }}
-            
-            @media print {{
-                body {{
-                    font-size: {'14px' if is_arabic else '12px'};
-                }}
-                .header {{
-                    margin: -25px -25px 25px -25px;
-                    padding: 20px 25px 15px 25px;
-                }}
-                h1 {{
-                    font-size: {'24px' if is_arabic else '22px'};
-                }}
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="header">
-            <h1>{t['title']}</h1>
-            <div class="date-info">
-                {t['date']}: {date_str} | {t['time']}: {time_str}
-            </div>
-        </div>
-        
-        <div class="section">
-            <h2>{t['analysis_type']}</h2>
-            <div class="analysis-content">
-                {category_map[language].get(category, category)}
-            </div>
-        </div>
-        
-        <div class="section">
-            <div class="info-grid">
-                <div class="info-item">
-                    <div class="info-label">{t['confidence']}</div>
-                    <div class="info-value">{analysis.get('confidence', 95)}%</div>
-                </div>
-                <div class="info-item">
-                    <div class="info-label">{t['severity']}</div>
-                    <div class="info-value">{analysis.get('severity', 'normal')}</div>
-                </div>
-            </div>
-        </div>
-        
-        <div class="section">
-            <h2>{t['detailed_analysis']}</h2>
-            <div class="analysis-content">
-                {analysis.get('analysis', 'لا يوجد تحليل متاح' if is_arabic else 'No analysis available')}
-            </div>
-        </div>
-    """
-    
-    # Add findings
-    if 'findings' in analysis and analysis['findings']:
-        html += f"""
-        <div class="section">
-            <h2>{t['findings']}</h2>
-            <ul>
-        """
-        for finding in analysis['findings']:
-            html += f"<li>{finding}</li>"
-        html += "</ul></div>"
-    
-    # Add parameters if available
-    if 'parameters' in analysis and analysis['parameters']:
-        html += f"""
-        <div class="section">
-            <h2>{t.get('parameters', 'Parameters' if not is_arabic else 'المعايير')}</h2>
-            <table style="width: 100%; border-collapse: collapse; margin-top: 15px;">
-                <tr style="background: #f8f9fa; border: 1px solid #dee2e6;">
-                    <th style="padding: 12px; text-align: {'right' if is_arabic else 'left'}; border: 1px solid #dee2e6;">{'المعيار' if is_arabic else 'Parameter'}</th>
-                    <th style="padding: 12px; text-align: {'right' if is_arabic else 'left'}; border: 1px solid #dee2e6;">{'القيمة' if is_arabic else 'Value'}</th>
-                    <th style="padding: 12px; text-align: {'right' if is_arabic else 'left'}; border: 1px solid #dee2e6;">{'الوحدة' if is_arabic else 'Unit'}</th>
-                    <th style="padding: 12px; text-align: {'right' if is_arabic else 'left'}; border: 1px solid #dee2e6;">{'المرجع' if is_arabic else 'Reference'}</th>
-                </tr>
-        """
-        for param in analysis['parameters']:
-            html += f"""
-                <tr style="border: 1px solid #dee2e6;">
-                    <td style="padding: 10px; border: 1px solid #dee2e6;">{param.get('name', '')}</td>
-                    <td style="padding: 10px; border: 1px solid #dee2e6;">{param.get('value', '')}</td>
-                    <td style="padding: 10px; border: 1px solid #dee2e6;">{param.get('unit', '')}</td>
-                    <td style="padding: 10px; border: 1px solid #dee2e6;">{param.get('referenceRange', '')}</td>
-                </tr>
-            """
-        html += "</table></div>"
-    
-    # Add recommendations
-    if 'recommendations' in analysis and analysis['recommendations']:
-        recommendations = analysis['recommendations']
-        if isinstance(recommendations, str):
-            recommendations = [recommendations]
-        
-        html += f"""
-        <div class="section">
-            <h2>{t['recommendations']}</h2>
-            <ul>
-        """
-        for rec in recommendations:
-            html += f"<li>{rec}</li>"
-        html += "</ul></div>"
-    
-    # Add disclaimer
-    html += f"""
-        <div class="disclaimer">
-            <h3>{t['disclaimer']}</h3>
-            <p>{t['disclaimer_text']}</p>
-        </div>
-    </body>
-    </html>
-    """
-    
-    return html
+    return render_report_html('classic', analysis, category, language, image=image)
 
 def get_xray_subcategory_prompts(sub_category: str, language: str, language_instruction: str, response_format_instruction: str) -> tuple[str, str]:
     """Get specialized prompts for X-ray subcategories"""
@@ -1696,94 +1343,12 @@ You are an expert pathologist with extensive experience in microscopy analysis.
 
     return system_prompt, user_prompt
 
-def extract_parameters(text: str) -> List[Dict[str, Any]]:
-    """Extract parameter information from analysis text"""
-    parameters = []
-    
-    # Look for parameter patterns like "WBC: 12.5 x10³/μL (Normal: 4.0-11.0)"
-    param_patterns = [
-        r'(\w+):\s*([\d.]+)\s*([^\s\(]+)?\s*\(([^)]+)\)',
-        r'(\w+)\s*([\d.]+)\s*([^\s\(]+)?\s*-\s*([^,\n]+)',
-        r'•\s*(\w+):\s*([\d.]+)\s*([^\s\(]+)?\s*\(([^)]+)\)'
-    ]
-    
-    for pattern in param_patterns:
-        matches = re.findall(pattern, text, re.IGNORECASE | re.MULTILINE)
-        for match in matches:
-            if len(match) >= 4:
-                param = {
-                    "name": match[0],
-                    "value": match[1],
-                    "unit": match[2] if match[2] else "",
-                    "referenceRange": match[3],
-                    "status": "normal"  # Default, could be enhanced with more logic
-                }
-                parameters.append(param)
-    
-    return parameters
-
-def parse_analysis_response(response_text: str, category: str) -> Dict[str, Any]:
+def parse_analysis_response(response_text: str, category: str, patient_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """Parse AI response into structured format"""
     try:
-        # Extract different sections
-        sections = {
-            'analysis': '',
-            'findings': [],
-            'recommendations': [],
-            'parameters': []
-        }
-        
-        # Split response into lines for processing
-        lines = response_text.split('\n')
-        current_section = 'analysis'
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-                
-            # Detect section headers (both English and Arabic)
-            if re.match(r'^#+\s*(Detailed Analysis|التحليل التفصيلي)', line, re.IGNORECASE):
-                current_section = 'analysis'
-            elif re.match(r'^#+\s*(Key Findings|النتائج الرئيسية)', line, re.IGNORECASE):
-                current_section = 'findings'
-            elif re.match(r'^#+\s*(Recommendations|التوصيات)', line, re.IGNORECASE):
-                current_section = 'recommendations'
-            elif re.match(r'^#+\s*(Measured Parameters|المعايير المقاسة)', line, re.IGNORECASE):
-                current_section = 'parameters'
-            elif line.startswith('#'):
-                continue  # Skip other headers
-            elif line.startswith('•') or line.startswith('-'):
-                # Bullet point
-                item = line[1:].strip()
-                if current_section in ['findings', 'recommendations'] and item:
-                    sections[current_section].append(item)
-            else:
-                # Regular text
-                if current_section == 'analysis':
-                    sections['analysis'] += line + ' '
-        
-        # Extract parameters using pattern matching
-        sections['parameters'] = extract_parameters(response_text)
-        
-        # Determine severity based on content
-        severity = 'normal'
-        if any(word in response_text.lower() for word in ['severe', 'critical', 'emergency', 'urgent']):
-            severity = 'severe'
-        elif any(word in response_text.lower() for word in ['moderate', 'concerning']):
-            severity = 'moderate'
-        elif any(word in response_text.lower() for word in ['mild', 'slight']):
-            severity = 'mild'
-        
-        return {
-            "analysis": sections['analysis'].strip(),
-            "findings": sections['findings'],
-            "recommendations": sections['recommendations'],
-            "parameters": sections['parameters'],
-            "severity": severity,
-            "confidence": random.randint(90, 97),  # Random confidence between 90-97
-            "category": category
-        }
+        parser = AnalysisParser(category, patient_data)
+        parser.feed(response_text)
+        return parser.close()
         
     except Exception as e:
         logger.error(f"Error parsing response: {str(e)}")
@@ -1803,15 +1368,190 @@ async def generate_pdf(
     category: str = Form(...),
     language: Optional[str] = Form('en'),
     patient_info: Optional[str] = Form(None),
-    image_file: Optional[UploadFile] = File(None)
+    image_file: Optional[UploadFile] = File(None),
+    if_none_match: Optional[str] = Header(None)
 ):
     """Generate PDF report"""
     try:
-        return await generate_puppeteer_pdf(analysis_data, category, language, patient_info, image_file)
+        return await generate_puppeteer_pdf(analysis_data, category, language, patient_info, image_file, if_none_match)
     except Exception as e:
         logger.error(f"PDF generation error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"PDF generation failed: {str(e)}")
 
+@app.post("/api/medical/pdf-jobs", status_code=202)
+async def submit_pdf_job(
+    analysis_data: str = Form(...),
+    category: str = Form(...),
+    language: Optional[str] = Form('en'),
+    patient_info: Optional[str] = Form(None),
+    image_file: Optional[UploadFile] = File(None)
+):
+    """Queue a PDF report render and return its job id immediately"""
+    if category not in VALID_CATEGORIES:
+        raise HTTPException(status_code=400, detail=f"Invalid category. Must be one of: {', '.join(VALID_CATEGORIES)}")
+    if language not in ('en', 'ar'):
+        raise HTTPException(status_code=400, detail="Invalid language. Must be one of: en, ar")
+    try:
+        analysis = json.loads(analysis_data)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="analysis_data must be valid JSON")
+    patient_data = parse_patient_info(patient_info)
+    image_bytes, image_key = await read_report_image(image_file)
+    
+    try:
+        job = pdf_jobs.submit(
+            lambda: render_pdf_report(analysis, category, language, patient_data, image_bytes, image_key),
+            {"category": category, "language": language}
+        )
+    except PdfQueueFull as e:
+        logger.warning(str(e))
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    
+    logger.info(f"Queued PDF job {job.id} for {category} report in {language}")
+    return {
+        **job.to_dict(),
+        "status_url": f"/api/medical/pdf-jobs/{job.id}",
+        "download_url": f"/api/medical/pdf-jobs/{job.id}/download"
+    }
+
+@app.get("/api/medical/pdf-jobs/{job_id}")
+async def pdf_job_status(job_id: str):
+    """Status of a queued PDF job"""
+    job = pdf_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="PDF job not found or expired")
+    return job.to_dict()
+
+@app.get("/api/medical/pdf-jobs/{job_id}/download")
+async def download_pdf_job(job_id: str):
+    """Download the PDF produced by a finished job"""
+    job = pdf_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="PDF job not found or expired")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"PDF job is {job.status}" + (f": {job.error}" if job.error else ""))
+    return Response(
+        content=job.pdf,
+        media_type="application/pdf",
+        headers={"Content-Disposition": content_disposition(job.filename), "Cache-Control": "private, no-cache"}
+    )
+
+def parse_bulk_pdf_items(items: str, default_category: Optional[str], default_language: Optional[str], image_names: Optional[set] = None) -> List[Dict[str, Any]]:
+    """Validate the items JSON of a bulk export; per-item problems are reported, not raised"""
+    try:
+        specs = json.loads(items)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="items must be a JSON array")
+    if not isinstance(specs, list) or not specs:
+        raise HTTPException(status_code=400, detail="items must be a non-empty JSON array")
+    if len(specs) > PDF_BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Too many items: {len(specs)} (max {PDF_BULK_MAX_ITEMS})")
+    
+    parsed = []
+    for spec in specs:
+        spec = spec if isinstance(spec, dict) else {}
+        analysis = spec.get('analysis')
+        category = spec.get('category') or (analysis.get('category') if isinstance(analysis, dict) else None) or default_category
+        language = spec.get('language') or default_language or 'en'
+        image = spec.get('image')
+        error = None
+        if not isinstance(analysis, dict):
+            error = "Item must contain an analysis object"
+        elif category not in VALID_CATEGORIES:
+            error = f"Invalid category. Must be one of: {', '.join(VALID_CATEGORIES)}"
+        elif language not in ('en', 'ar'):
+            error = "Invalid language. Must be one of: en, ar"
+        elif image is not None and (not isinstance(image, str) or image not in (image_names or set())):
+            error = f"Image {image!r} was not uploaded"
+        patient_data = spec.get('patient_info')
+        parsed.append({
+            "analysis": analysis,
+            "category": category,
+            "language": language,
+            "patient_data": patient_data if isinstance(patient_data, dict) else {},
+            "filename": spec.get('filename'),
+            "image": image,
+            "error": error
+        })
+    return parsed
+
+def bulk_member_name(index: int, spec: Dict[str, Any]) -> str:
+    """Unique, path-free archive name for one report"""
+    name = os.path.basename(str(spec.get('filename') or '')).strip()
+    if not name:
+        name = f"{spec.get('category') or 'report'}_{spec.get('language')}"
+    if not name.lower().endswith('.pdf'):
+        name += '.pdf'
+    return f"{index + 1:03d}_{name}"
+
+@app.post("/api/medical/generate-pdf/bulk")
+async def generate_pdf_bulk(
+    items: str = Form(...),
+    category: Optional[str] = Form(None),
+    language: Optional[str] = Form('en'),
+    images: List[UploadFile] = File([])
+):
+    """Render many reports concurrently and stream them back as a ZIP archive"""
+    # Items name an uploaded image by filename; reports of the same study share one upload and one derivative
+    uploads: Dict[str, tuple[Optional[bytes], Optional[str]]] = {}
+    for upload in images:
+        uploads[upload.filename] = await read_report_image(upload)
+    specs = parse_bulk_pdf_items(items, category, language, set(uploads))
+    logger.info(f"Bulk PDF export of {len(specs)} reports")
+    
+    async def render_item(index: int, spec: Dict[str, Any]) -> tuple[int, Optional[bytes], Optional[str]]:
+        if spec["error"]:
+            return index, None, spec["error"]
+        try:
+            image_bytes, image_key = uploads.get(spec["image"], (None, None))
+            pdf_buffer, _ = await render_pdf_report(spec["analysis"], spec["category"], spec["language"], spec["patient_data"], image_bytes, image_key)
+            return index, pdf_buffer, None
+        except Exception as e:
+            logger.error(f"Bulk PDF item {index} failed: {str(e)}")
+            return index, None, str(e)
+    
+    async def archive_stream():
+        archive = ZipStream()
+        manifest = []
+        pending = set()
+        queued = iter(enumerate(specs))
+        try:
+            while True:
+                # Keep at most PDF_BULK_CONCURRENCY renders (and their PDFs) in memory at once
+                for index, spec in queued:
+                    pending.add(asyncio.create_task(render_item(index, spec)))
+                    if len(pending) >= PDF_BULK_CONCURRENCY:
+                        break
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    index, pdf_buffer, error = task.result()
+                    entry = {"index": index, "category": specs[index]["category"], "language": specs[index]["language"]}
+                    if pdf_buffer is not None:
+                        entry.update(status="ok", file=bulk_member_name(index, specs[index]), size=len(pdf_buffer))
+                        yield archive.add(entry["file"], pdf_buffer)
+                    else:
+                        entry.update(status="error", error=error)
+                    manifest.append(entry)
+            
+            manifest.sort(key=lambda entry: entry["index"])
+            failed = sum(entry["status"] == "error" for entry in manifest)
+            logger.info(f"Bulk PDF export finished: {len(manifest) - failed} ok, {failed} failed")
+            yield archive.add("manifest.json", json.dumps({"total": len(manifest), "failed": failed, "items": manifest}, ensure_ascii=False, indent=2).encode('utf-8'))
+            yield archive.close()
+        finally:
+            # Client went away: stop rendering the rest
+            for task in pending:
+                task.cancel()
+    
+    filename = f"reports_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    return StreamingResponse(
+        archive_stream(),
+        media_type="application/zip",
+        headers={"Content-Disposition": content_disposition(filename)}
+    )
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -1822,6 +1562,207 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "timestamp": "2024-01-01T00:00:00Z"}
 
+@app.get("/api/admin/cache")
+async def analysis_cache_stats(x_admin_token: Optional[str] = Header(None)):
+    """Analysis cache hit/miss/eviction counters"""
+    require_admin(x_admin_token)
+    if analysis_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **analysis_cache.snapshot()}
+
+@app.delete("/api/admin/cache")
+async def invalidate_analysis_cache(key: Optional[str] = None, x_admin_token: Optional[str] = Header(None)):
+    """Invalidate one cached analysis by key, or the whole cache"""
+    require_admin(x_admin_token)
+    if analysis_cache is None:
+        return {"enabled": False, "removed": 0}
+    removed = await asyncio.to_thread(analysis_cache.invalidate, key)
+    logger.info(f"Invalidated {removed} cached analyses")
+    return {"enabled": True, "removed": removed}
+
+@app.get("/api/admin/metrics")
+async def service_metrics(x_admin_token: Optional[str] = Header(None)):
+    """Operational counters for the analysis pipeline"""
+    require_admin(x_admin_token)
+    upstream = dict(UPSTREAM_STATS)
+    upstream["avg_latency_ms"] = round(upstream["latency_ms_total"] / upstream["calls"], 1) if upstream["calls"] else 0.0
+    upstream["avg_payload_bytes"] = upstream["payload_bytes_total"] // upstream["calls"] if upstream["calls"] else 0
+    return {
+        "upstream": upstream,
+        "image_preprocessing": preprocess_stats(),
+        "response_parsing": parse_stats.snapshot(),
+        "severity": severity_classifier.snapshot(),
+        "analysis_cache": analysis_cache.snapshot() if analysis_cache is not None else {"enabled": False},
+        "request_coalescing": analysis_flights.snapshot(),
+        "upstream_admission": upstream_limiter.snapshot(),
+        "upstream_resilience": upstream_resilience.snapshot(),
+        "pdf_browser_pool": pdf_browser_pool.snapshot(),
+        "pdf_cache": pdf_cache.snapshot(),
+        "report_images": report_image_cache.snapshot(),
+        "pdf_render_pool": pdf_render_pool.snapshot(),
+        "pdf_jobs": pdf_jobs.snapshot(),
+        "pdf_optimization": optimize_stats(),
+    }
+
+VALID_CATEGORIES = ['cbc', 'ecg', 'xray', 'microscopy']
+
+def validate_analysis_request(file: UploadFile, category: str) -> None:
+    """Reject non-image uploads and unknown categories"""
+    if not file.content_type or not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="File must be an image")
+    if category not in VALID_CATEGORIES:
+        raise HTTPException(status_code=400, detail=f"Invalid category. Must be one of: {', '.join(VALID_CATEGORIES)}")
+
+def parse_patient_info(patient_info: Optional[str]) -> Dict[str, Any]:
+    """Parse the patient_info form field, ignoring malformed JSON"""
+    patient_data = {}
+    if patient_info:
+        try:
+            patient_data = json.loads(patient_info)
+            logger.info(f"Patient info provided: {patient_data}")
+        except json.JSONDecodeError:
+            logger.warning("Could not parse patient info JSON")
+    return patient_data
+
+def build_analysis_prompts(
+    category: str,
+    language: Optional[str],
+    sub_category: Optional[str],
+    patient_data: Dict[str, Any],
+    language_instruction: Optional[str] = None,
+    structured: bool = False
+) -> tuple[str, str]:
+    """Category prompts plus patient, sub-category and language context"""
+    # Get category-specific prompts with language and sub-category support
+    system_prompt, user_prompt = get_analysis_prompt(category, language or 'en', sub_category, structured)
+    
+    if patient_data:
+        if language == 'ar':
+            user_prompt += f"\n\nسياق المريض: {patient_data}"
+        else:
+            user_prompt += f"\n\nPatient context: {patient_data}"
+    
+    # Add sub-category context to user prompt if provided
+    if sub_category:
+        if category == 'xray':
+            if language == 'ar':
+                user_prompt += f"\n\nنوع الأشعة المحدد: {sub_category}"
+            else:
+                user_prompt += f"\n\nSpecific X-ray type: {sub_category}"
+        elif category == 'microscopy':
+            if language == 'ar':
+                user_prompt += f"\n\nنوع التحليل المجهري المحدد: {sub_category}"
+            else:
+                user_prompt += f"\n\nSpecific microscopy analysis type: {sub_category}"
+    
+    # Add explicit language instruction if provided from frontend
+    if language_instruction:
+        system_prompt = f"{language_instruction}\n\n{system_prompt}"
+    
+    return system_prompt, user_prompt
+
+async def prepare_image_payload(image_bytes: bytes, category: str, filename: Optional[str]) -> str:
+    """Preprocess an upload off the event loop and return its data URL"""
+    # Normalize orientation/colour and downscale before encoding
+    processed_bytes, image_ext, _ = await asyncio.to_thread(
+        preprocess_image, image_bytes, category, get_image_extension(filename)
+    )
+    return encode_image_to_base64(processed_bytes, filename, image_ext)
+
+def analysis_request_key(
+    image_bytes: bytes,
+    category: str,
+    language: Optional[str],
+    sub_category: Optional[str],
+    patient_data: Dict[str, Any],
+    patient_info: Optional[str],
+    language_instruction: Optional[str],
+    structured: bool = False
+) -> str:
+    """Content key identifying an analysis for caching and coalescing"""
+    return make_cache_key(
+        image_bytes, category, language or 'en', sub_category,
+        f"{PROMPT_VERSION}+json" if structured else PROMPT_VERSION, patient_data or patient_info, language_instruction
+    )
+
+def uses_structured_output(category: str) -> bool:
+    return category in STRUCTURED_OUTPUT_CATEGORIES
+
+def parse_model_response(ai_response: str, category: str, structured: bool, patient_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Parse a reply through the JSON fast path when it was requested, else (or on failure) as markdown"""
+    started = time.perf_counter()
+    if structured:
+        try:
+            parsed_result = parse_structured_response(ai_response, category, patient_data)
+            parse_stats.record("json", "ok", (time.perf_counter() - started) * 1000)
+            return parsed_result
+        except StructuredOutputError as e:
+            logger.warning(f"Structured {category} reply failed validation, parsing as markdown: {str(e)}")
+            parse_stats.record("json", "fallback", (time.perf_counter() - started) * 1000)
+            started = time.perf_counter()
+    parsed_result = parse_analysis_response(ai_response, category, patient_data)
+    # Findings are the section lost most often when the model drifts from the layout
+    parse_stats.record("markdown", "ok" if parsed_result["findings"] else "empty", (time.perf_counter() - started) * 1000)
+    return parsed_result
+
+async def run_analysis(
+    image_bytes: bytes,
+    filename: Optional[str],
+    category: str,
+    language: Optional[str],
+    language_instruction: Optional[str],
+    patient_data: Dict[str, Any],
+    sub_category: Optional[str],
+    request_key: str
+) -> tuple[Dict[str, Any], bool]:
+    """Analyze one image, consulting the result cache; returns (result, cache_hit)"""
+    # Serve repeated uploads from the result cache
+    if analysis_cache is not None:
+        cached_result = await asyncio.to_thread(analysis_cache.get, request_key)
+        if cached_result is not None:
+            logger.info(f"{category.upper()} analysis served from cache")
+            return cached_result, True
+    
+    async def analyze_uncached() -> Dict[str, Any]:
+        return await analyze_image_upstream(
+            image_bytes, filename, category, language, language_instruction,
+            patient_data, sub_category, request_key
+        )
+    
+    # Identical requests already in flight share one upstream call
+    parsed_result, _ = await analysis_flights.do(request_key, analyze_uncached)
+    return parsed_result, False
+
+async def analyze_image_upstream(
+    image_bytes: bytes,
+    filename: Optional[str],
+    category: str,
+    language: Optional[str],
+    language_instruction: Optional[str],
+    patient_data: Dict[str, Any],
+    sub_category: Optional[str],
+    request_key: str
+) -> Dict[str, Any]:
+    """Preprocess, call the model, parse and store the result in the cache"""
+    structured = uses_structured_output(category)
+    base64_image = await prepare_image_payload(image_bytes, category, filename)
+    system_prompt, user_prompt = build_analysis_prompts(category, language, sub_category, patient_data, language_instruction, structured)
+    
+    logger.info(f"Sending {category} request to AI model with language: {language}, sub_category: {sub_category}...")
+    
+    # Send to OpenAI with category-specific prompt and language
+    ai_response = await call_vision_model(system_prompt, user_prompt, base64_image, category, structured)
+    
+    # Parse response
+    logger.info(f"Received AI response: {len(ai_response)} characters")
+    
+    parsed_result = parse_model_response(ai_response, category, structured, patient_data)
+    
+    if analysis_cache is not None:
+        await asyncio.to_thread(analysis_cache.put, request_key, parsed_result)
+    
+    return parsed_result
+
 @app.post("/api/medical/analyze")
 async def analyze_medical_image(
     file: UploadFile = File(...),
@@ -1835,85 +1776,206 @@ async def analyze_medical_image(
     logger.info(f"Received {category.upper()} analysis request for file: {file.filename}, language: {language}, sub_category: {sub_category}")
     
     try:
-        # Validate file type
-        if not file.content_type or not file.content_type.startswith("image/"):
-            raise HTTPException(status_code=400, detail="File must be an image")
-        
-        # Validate category
-        valid_categories = ['cbc', 'ecg', 'xray', 'microscopy']
-        if category not in valid_categories:
-            raise HTTPException(status_code=400, detail=f"Invalid category. Must be one of: {', '.join(valid_categories)}")
-        
-        # Convert image to base64
-        base64_image = encode_image_to_base64(file)
-        
-        # Parse patient info
-        patient_data = {}
-        if patient_info:
-            try:
-                patient_data = json.loads(patient_info)
-                logger.info(f"Patient info provided: {patient_data}")
-            except json.JSONDecodeError:
-                logger.warning("Could not parse patient info JSON")
-        
-        # Get category-specific prompts with language and sub-category support
-        system_prompt, user_prompt = get_analysis_prompt(category, language or 'en', sub_category)
-        
-        if patient_data:
-            if language == 'ar':
-                user_prompt += f"\n\nسياق المريض: {patient_data}"
-            else:
-                user_prompt += f"\n\nPatient context: {patient_data}"
-        
-        # Add sub-category context to user prompt if provided
-        if sub_category:
-            if category == 'xray':
-                if language == 'ar':
-                    user_prompt += f"\n\nنوع الأشعة المحدد: {sub_category}"
-                else:
-                    user_prompt += f"\n\nSpecific X-ray type: {sub_category}"
-            elif category == 'microscopy':
-                if language == 'ar':
-                    user_prompt += f"\n\nنوع التحليل المجهري المحدد: {sub_category}"
-                else:
-                    user_prompt += f"\n\nSpecific microscopy analysis type: {sub_category}"
+        validate_analysis_request(file, category)
         
-        # Add explicit language instruction if provided from frontend
-        if language_instruction:
-            system_prompt = f"{language_instruction}\n\n{system_prompt}"
-        
-        logger.info(f"Sending {category} request to AI model with language: {language}, sub_category: {sub_category}...")
-        
-        # Send to OpenAI with category-specific prompt and language
-        response = client.chat.completions.create(
-            model=MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": user_prompt},
-                        {"type": "image_url", "image_url": {"url": base64_image}},
-                    ],
-                },
-            ],
-            max_tokens=2000,
-            temperature=0.1
+        image_bytes = file.file.read()
+        patient_data = parse_patient_info(patient_info)
+        request_key = analysis_request_key(
+            image_bytes, category, language, sub_category, patient_data, patient_info, language_instruction,
+            uses_structured_output(category)
         )
         
-        # Parse response
-        ai_response = response.choices[0].message.content
-        logger.info(f"Received AI response: {len(ai_response)} characters")
-        
-        parsed_result = parse_analysis_response(ai_response, category)
+        parsed_result, cache_hit = await run_analysis(
+            image_bytes, file.filename, category, language, language_instruction,
+            patient_data, sub_category, request_key
+        )
         
         logger.info(f"{category.upper()} analysis completed successfully in {language} with sub_category: {sub_category}")
-        return JSONResponse(content=parsed_result)
+        headers = {"X-Cache": "HIT" if cache_hit else "MISS", "X-Analysis-Cache-Key": request_key} if analysis_cache is not None else None
+        return JSONResponse(content=parsed_result, headers=headers)
         
+    except (HTTPException, UpstreamOverloaded):
+        raise
     except Exception as e:
         logger.error(f"{category.upper()} analysis error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
+def parse_batch_items(items: Optional[str], count: int, default_category: Optional[str], default_sub_category: Optional[str]) -> List[Dict[str, Any]]:
+    """Per-file category/sub_category settings aligned with the uploaded files"""
+    specs = []
+    if items:
+        try:
+            specs = json.loads(items)
+        except json.JSONDecodeError:
+            raise HTTPException(status_code=400, detail="items must be a JSON array")
+        if not isinstance(specs, list) or len(specs) != count:
+            raise HTTPException(status_code=400, detail=f"items must be a JSON array with one entry per file ({count})")
+    
+    resolved = []
+    for index in range(count):
+        spec = specs[index] if specs and isinstance(specs[index], dict) else {}
+        resolved.append({
+            "category": spec.get("category") or default_category,
+            "sub_category": spec.get("sub_category", default_sub_category),
+        })
+    return resolved
+
+@app.post("/api/medical/analyze/batch")
+async def analyze_medical_images_batch(
+    files: List[UploadFile] = File(...),
+    items: Optional[str] = Form(None),
+    category: Optional[str] = Form(None),
+    sub_category: Optional[str] = Form(None),
+    language: Optional[str] = Form('en'),
+    language_instruction: Optional[str] = Form(None),
+    patient_info: Optional[str] = Form(None),
+    stream: bool = Form(False)
+):
+    """Analyze several images for one patient with bounded concurrency.
+
+    ``items`` is an optional JSON array, one ``{"category", "sub_category"}``
+    object per file; missing values fall back to the ``category`` and
+    ``sub_category`` fields. Each file succeeds or fails on its own. With
+    ``stream=true`` results are sent as NDJSON lines in completion order,
+    otherwise a single JSON body lists them in upload order.
+    """
+    if len(files) > BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_FILES} files per batch")
+    
+    specs = parse_batch_items(items, len(files), category, sub_category)
+    patient_data = parse_patient_info(patient_info)
+    logger.info(f"Received batch analysis request for {len(files)} files, language: {language}")
+    
+    # Read every upload now; the request body is gone once a streamed response starts
+    uploads = []
+    for index, (upload, spec) in enumerate(zip(files, specs)):
+        error = None
+        try:
+            validate_analysis_request(upload, spec["category"] or "")
+        except HTTPException as e:
+            error = e.detail
+        uploads.append((index, upload.filename, upload.file.read() if error is None else b"", spec, error))
+    
+    semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+    
+    async def analyze_item(index: int, filename: Optional[str], image_bytes: bytes, spec: Dict[str, Any], error: Optional[str]) -> Dict[str, Any]:
+        item = {"index": index, "filename": filename, "category": spec["category"], "sub_category": spec["sub_category"]}
+        if error is not None:
+            return {**item, "status": "error", "error": error}
+        try:
+            async with semaphore:
+                request_key = analysis_request_key(
+                    image_bytes, spec["category"], language, spec["sub_category"],
+                    patient_data, patient_info, language_instruction, uses_structured_output(spec["category"])
+                )
+                result, cache_hit = await run_analysis(
+                    image_bytes, filename, spec["category"], language, language_instruction,
+                    patient_data, spec["sub_category"], request_key
+                )
+            return {**item, "status": "ok", "cached": cache_hit, "result": result}
+        except UpstreamOverloaded as e:
+            return {**item, "status": "error", "error": f"Analysis service is busy: {str(e)}", "retry_after": e.retry_after}
+        except Exception as e:
+            logger.error(f"Batch item {index} ({filename}) failed: {str(e)}")
+            return {**item, "status": "error", "error": f"Analysis failed: {str(e)}"}
+    
+    tasks = [asyncio.create_task(analyze_item(*upload)) for upload in uploads]
+    
+    if not stream:
+        results = await asyncio.gather(*tasks)
+        failed = sum(1 for result in results if result["status"] == "error")
+        logger.info(f"Batch analysis finished: {len(results) - failed} succeeded, {failed} failed")
+        return JSONResponse(content={"results": results, "succeeded": len(results) - failed, "failed": failed})
+    
+    async def result_stream():
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        finally:
+            # Client went away: stop spending upstream quota on the remainder
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+def sse_event(event: str, data: Any) -> str:
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/api/medical/analyze/stream")
+async def analyze_medical_image_stream(
+    file: UploadFile = File(...),
+    category: str = Form(...),
+    language: Optional[str] = Form('en'),
+    language_instruction: Optional[str] = Form(None),
+    patient_info: Optional[str] = Form(None),
+    sub_category: Optional[str] = Form(None)
+):
+    """Stream the analysis as Server-Sent Events while the model writes it.
+
+    Events: ``section`` when a new report section starts, ``delta`` for each
+    chunk of text tagged with its section, ``finding``, ``recommendation``
+    and ``parameter`` as soon as the line carrying one is complete,
+    ``result`` with the same payload /api/medical/analyze returns, and
+    ``error`` if the upstream call fails.
+    """
+    logger.info(f"Received streaming {category.upper()} analysis request for file: {file.filename}, language: {language}")
+    
+    validate_analysis_request(file, category)
+    image_bytes = file.file.read()
+    patient_data = parse_patient_info(patient_info)
+    # Section events need the markdown layout, so streamed analyses never use structured output
+    request_key = analysis_request_key(image_bytes, category, language, sub_category, patient_data, patient_info, language_instruction)
+    
+    async def event_stream():
+        try:
+            if analysis_cache is not None:
+                cached_result = await asyncio.to_thread(analysis_cache.get, request_key)
+                if cached_result is not None:
+                    yield sse_event("result", cached_result)
+                    return
+            
+            base64_image = await prepare_image_payload(image_bytes, category, file.filename)
+            system_prompt, user_prompt = build_analysis_prompts(category, language, sub_category, patient_data, language_instruction)
+            
+            # Each completed line is parsed once as it arrives; the result needs no second pass
+            parser = AnalysisParser(category, patient_data)
+            response_chars = 0
+            yield sse_event("section", {"section": parser.section})
+            # aclosing() ends the upstream call as soon as the client disconnects
+            async with contextlib.aclosing(stream_vision_model(system_prompt, user_prompt, base64_image, category)) as deltas:
+                async for delta in deltas:
+                    response_chars += len(delta)
+                    update = parser.feed(delta)
+                    for section in update["sections"]:
+                        yield sse_event("section", {"section": section})
+                    for finding in update["findings"]:
+                        yield sse_event("finding", {"text": finding})
+                    for recommendation in update["recommendations"]:
+                        yield sse_event("recommendation", {"text": recommendation})
+                    for parameter in update["parameters"]:
+                        yield sse_event("parameter", parameter)
+                    yield sse_event("delta", {"section": parser.section, "text": delta})
+            
+            logger.info(f"Streamed AI response: {response_chars} characters")
+            parsed_result = parser.close()
+            parse_stats.record("stream", "ok" if parsed_result["findings"] else "empty", parser.parse_ms)
+            if analysis_cache is not None:
+                await asyncio.to_thread(analysis_cache.put, request_key, parsed_result)
+            yield sse_event("result", parsed_result)
+        except UpstreamOverloaded as e:
+            yield sse_event("error", {"detail": f"Analysis service is busy: {str(e)}", "retry_after": e.retry_after})
+        except Exception as e:
+            logger.error(f"{category.upper()} streaming analysis error: {str(e)}")
+            yield sse_event("error", {"detail": f"Analysis failed: {str(e)}"})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # Legacy CBC endpoint for backward compatibility
 @app.post("/api/cbc/analyze")
 async def analyze_cbc_legacy(
@@ -1921,7 +1983,7 @@ async def analyze_cbc_legacy(
     patient_info: Optional[str] = Form(None)
 ):
     """Legacy CBC analysis endpoint"""
-    return await analyze_medical_image(file, "cbc", "en", None, patient_info)
+    return await analyze_medical_image(file, "cbc", "en", None, patient_info, None)
 
 @app.post("/generate-pdf")
 async def generate_pdf_endpoint(
@@ -1929,7 +1991,8 @@ async def generate_pdf_endpoint(
     category: str = Form(...),
     language: Optional[str] = Form('en'),
     patient_info: Optional[str] = Form(None),
-    image_file: Optional[UploadFile] = File(None)
+    image_file: Optional[UploadFile] = File(None),
+    if_none_match: Optional[str] = Header(None)
 ):
     """Generate PDF report using PyPuppeteer with proper Arabic and English support"""
     logger.info(f"Generating PDF report for {category} analysis in {language}")
@@ -1947,13 +2010,24 @@ async def generate_pdf_endpoint(
                 logger.warning("Failed to parse patient info JSON")
                 pass
         
-        # Create HTML content for PDF
-        html_content = create_html_for_pdf(analysis, category, language)
-        logger.info(f"Generated HTML content length: {len(html_content)}")
-        logger.info(f"HTML content preview: {html_content[:200]}...")
-        
-        # Generate PDF using PyPuppeteer
-        pdf_buffer = await generate_puppeteer_pdf_buffer(html_content)
+        image_bytes, image_key = await read_report_image(image_file)
+        pdf_key = make_pdf_key(report_template('create_html_for_pdf'), PDF_TEMPLATE_VERSION, analysis, category, language, patient_data, image_key)
+        etag = etag_for(pdf_key)
+        not_modified = pdf_not_modified(if_none_match, etag)
+        if not_modified is not None:
+            return not_modified
+        
+        def build_html(image: Optional[bytes]) -> str:
+            # Create HTML content for PDF
+            html_content = create_html_for_pdf(analysis, category, language, image)
+            logger.info(f"Generated HTML content length: {len(html_content)}")
+            logger.info(f"HTML content preview: {html_content[:200]}...")
+            return html_content
+        
+        # Generate PDF using PyPuppeteer (or reuse the cached render)
+        pdf_buffer, degraded = await render_pdf_cached(
+            'create_html_for_pdf', pdf_key, build_html, analysis, category, language, patient_data, image_bytes, image_key
+        )
         logger.info(f"Generated PDF buffer size: {len(pdf_buffer) if pdf_buffer else 0} bytes")
         
         # Set filename based on language and category
@@ -1979,8 +2053,9 @@ async def generate_pdf_endpoint(
             content=pdf_buffer,
             media_type="application/pdf",
             headers={
-                "Content-Disposition": f"attachment; filename={filename}",
-                "Content-Type": "application/pdf"
+                "Content-Disposition": content_disposition(filename),
+                "Content-Type": "application/pdf",
+                **pdf_cache_headers(etag, degraded)
             }
         )
         
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-compatible stand-in for the upstream model endpoint.
+
+Speaks enough of the chat-completions API for the backend (plain and
+streamed responses) and answers with canned reports in the exact markdown
+layout the prompts ask for, picked by category and language from the
+system prompt, or as the equivalent JSON object when structured output is
+requested. Latency, 5xx errors and 429 rate limiting are injected from
+configurable distributions so the analyze path can be load-tested without
+spending quota.
+
+Usage:
+    python mock_upstream.py --port 9000 --latency lognormal --latency-mean 8 --rate-limit-rate 0.05
+    BASE_URL=http://localhost:9000 python main.py
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+import uuid
+from typing import Any, Dict, List
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CANNED_RESPONSES = {
+    ('cbc', 'en'): """## Detailed Analysis
+The complete blood count shows a mildly raised white cell count with a neutrophil predominance. Hemoglobin and hematocrit are slightly below the reference range, consistent with mild normocytic anemia. Platelets are within normal limits.
+
+## Measured Parameters
+- WBC: 12.5 x10³/μL (4.0-11.0)
+- RBC: 4.1 x10⁶/μL (4.5-5.9)
+- Hemoglobin: 11.2 g/dL (13.5-17.5)
+- Hematocrit: 34.8 % (41-53)
+- Platelets: 245 x10³/μL (150-400)
+- MCV: 85 fL (80-100)
+
+## Key Findings
+- Mild leukocytosis with neutrophilia
+- Mild normocytic anemia
+- Platelet count within normal range
+
+## Recommendations
+- Correlate with clinical signs of infection or inflammation
+- Check iron studies, B12 and folate
+- Repeat CBC in 2-4 weeks
+""",
+    ('cbc', 'ar'): """## التحليل التفصيلي
+يظهر فحص الدم الشامل ارتفاعاً طفيفاً في عدد كريات الدم البيضاء مع غلبة العدلات. الهيموجلوبين والهيماتوكريت أقل قليلاً من المعدل الطبيعي بما يتوافق مع فقر دم خفيف.
+
+## المعايير المقاسة
+- WBC: 12.5 x10³/μL (4.0-11.0)
+- Hemoglobin: 11.2 g/dL (13.5-17.5)
+- Platelets: 245 x10³/μL (150-400)
+
+## النتائج الرئيسية
+- ارتفاع خفيف في كريات الدم البيضاء
+- فقر دم خفيف سوي الخلايا
+
+## التوصيات
+- ربط النتائج بالأعراض السريرية
+- فحص مخزون الحديد وفيتامين ب12
+- إعادة الفحص خلال 2-4 أسابيع
+""",
+    ('ecg', 'en'): """## Detailed Analysis
+Sinus rhythm at a regular rate. Normal P wave morphology with a normal PR interval. QRS complexes are narrow. There is mild ST depression in leads V5-V6 without ST elevation.
+
+## Measured Parameters
+- Heart Rate: 78 bpm (60-100)
+- PR: 168 ms (120-200)
+- QRS: 92 ms (80-120)
+- QTc: 438 ms (350-450)
+
+## Key Findings
+- Normal sinus rhythm
+- Mild ST depression in lateral leads
+- No acute ST elevation
+
+## Recommendations
+- Correlate with symptoms and cardiac enzymes
+- Repeat ECG if chest pain recurs
+""",
+    ('ecg', 'ar'): """## التحليل التفصيلي
+نظم جيبي منتظم بمعدل طبيعي. موجات P طبيعية وفترة PR ضمن المعدل. يوجد انخفاض خفيف في قطعة ST في الاتجاهات الجانبية.
+
+## المعايير المقاسة
+- Heart Rate: 78 bpm (60-100)
+- PR: 168 ms (120-200)
+- QTc: 438 ms (350-450)
+
+## النتائج الرئيسية
+- نظم جيبي طبيعي
+- انخفاض خفيف في قطعة ST
+
+## التوصيات
+- ربط النتائج بالأعراض وإنزيمات القلب
+- إعادة التخطيط عند تكرار ألم الصدر
+""",
+    ('xray', 'en'): """## Detailed Analysis
+Frontal chest radiograph with adequate inspiration. There is a patchy opacity in the right lower zone. The cardiac silhouette is within normal size. No pleural effusion or pneumothorax is seen.
+
+## Measured Parameters
+- Cardiothoracic Ratio: 0.48 ratio (0.0-0.5)
+
+## Key Findings
+- Right lower zone consolidation, concerning for pneumonia
+- Normal heart size
+- No pleural effusion
+
+## Recommendations
+- Clinical correlation for lower respiratory tract infection
+- Follow-up radiograph in 6 weeks to confirm resolution
+""",
+    ('xray', 'ar'): """## التحليل التفصيلي
+صورة أشعة صدر أمامية بتنفس كافٍ. يوجد عتامة غير منتظمة في المنطقة السفلية اليمنى. حجم القلب طبيعي ولا يوجد انصباب جنبي.
+
+## المعايير المقاسة
+- Cardiothoracic Ratio: 0.48 ratio (0.0-0.5)
+
+## النتائج الرئيسية
+- تكثف في الفص السفلي الأيمن يثير الشك بالتهاب رئوي
+- حجم القلب طبيعي
+
+## التوصيات
+- ربط سريري لعدوى الجهاز التنفسي السفلي
+- صورة متابعة بعد 6 أسابيع
+""",
+    ('microscopy', 'en'): """## Detailed Analysis
+Peripheral blood smear with normochromic, normocytic red cells. Occasional target cells are present. White cells show normal morphology without blasts. No parasites are identified.
+
+## Measured Parameters
+- Target Cells: 2 % (0-1)
+
+## Key Findings
+- Occasional target cells
+- No blasts or atypical lymphocytes
+- No malaria parasites seen
+
+## Recommendations
+- Consider hemoglobin electrophoresis if target cells persist
+- Correlate with CBC indices
+""",
+    ('microscopy', 'ar'): """## التحليل التفصيلي
+لطاخة دم محيطية تظهر كريات حمراء سوية الصباغ والحجم مع بعض الخلايا الهدفية. لا توجد أرومات ولا طفيليات.
+
+## المعايير المقاسة
+- Target Cells: 2 % (0-1)
+
+## النتائج الرئيسية
+- وجود بعض الخلايا الهدفية
+- لا توجد أرومات
+
+## التوصيات
+- النظر في الرحلان الكهربائي للهيموجلوبين
+- ربط النتائج بمؤشرات فحص الدم الشامل
+""",
+}
+
+# Checked in order against the system prompt; first match wins
+CATEGORY_MARKERS = [
+    ('ecg', re.compile(r'ECG|EKG|cardiologist|تخطيط القلب', re.IGNORECASE)),
+    ('cbc', re.compile(r'CBC|Complete Blood Count|hematolog|فحص الدم الشامل', re.IGNORECASE)),
+    ('xray', re.compile(r'X-ray|radiolog|radiograph|أشعة', re.IGNORECASE)),
+    ('microscopy', re.compile(r'microscop|pathologist|biops|مجهري|المجهر|خزع', re.IGNORECASE)),
+]
+ARABIC_RE = re.compile(r'[؀-ۿ]')
+# Canned markdown sections in order, and "- Name: value unit (range)" parameter lines
+CANNED_SECTIONS = ['analysis', 'parameters', 'findings', 'recommendations']
+PARAMETER_LINE_RE = re.compile(r'-\s*([^:]+):\s*(\S+)\s*(.*?)\s*\(([^)]*)\)\s*$')
+
+app = FastAPI(title="Mock Upstream Model API")
+settings: Dict[str, Any] = {}
+stats = {"requests": 0, "streamed": 0, "errors_injected": 0, "rate_limited": 0}
+
+
+def sample_latency() -> float:
+    """Draw a response latency in seconds from the configured distribution"""
+    mean = settings["latency_mean"]
+    spread = settings["latency_spread"]
+    distribution = settings["latency"]
+    if distribution == "fixed":
+        return mean
+    if distribution == "uniform":
+        return random.uniform(max(0.0, mean - spread), mean + spread)
+    if distribution == "normal":
+        return max(0.0, random.gauss(mean, spread))
+    # lognormal with the requested mean; spread is the sigma of the underlying normal
+    sigma = spread
+    mu = math.log(max(mean, 1e-6)) - sigma ** 2 / 2
+    return random.lognormvariate(mu, sigma)
+
+def structured_response(markdown: str) -> str:
+    """A canned markdown report as the JSON object structured output asks for"""
+    sections: Dict[str, List[str]] = {name: [] for name in CANNED_SECTIONS}
+    index = -1
+    for line in markdown.splitlines():
+        if line.startswith('## '):
+            index += 1
+        elif line.strip() and index >= 0:
+            sections[CANNED_SECTIONS[index]].append(line.strip())
+    parameters = []
+    for line in sections['parameters']:
+        match = PARAMETER_LINE_RE.match(line)
+        if match:
+            name, value, unit, reference_range = (group.strip() for group in match.groups())
+            parameters.append({"name": name, "value": value, "unit": unit, "referenceRange": reference_range, "status": "normal"})
+    return json.dumps({
+        "analysis": " ".join(sections['analysis']),
+        "parameters": parameters,
+        "findings": [line.lstrip('-').strip() for line in sections['findings']],
+        "recommendations": [line.lstrip('-').strip() for line in sections['recommendations']],
+        "severity": "mild",
+    }, ensure_ascii=False)
+
+def pick_response(messages: List[Dict[str, Any]], structured: bool = False) -> str:
+    """Canned report for the category and language the prompts ask for"""
+    system_prompt = " ".join(
+        m.get("content", "") for m in messages if m.get("role") == "system" and isinstance(m.get("content"), str)
+    )
+    language = 'ar' if ARABIC_RE.search(system_prompt) else 'en'
+    category = next((name for name, marker in CATEGORY_MARKERS if marker.search(system_prompt)), 'cbc')
+    markdown = CANNED_RESPONSES[(category, language)]
+    return structured_response(markdown) if structured else markdown
+
+def usage_for(text: str) -> Dict[str, int]:
+    completion_tokens = max(1, len(text) // 4)
+    return {"prompt_tokens": 1200, "completion_tokens": completion_tokens, "total_tokens": 1200 + completion_tokens}
+
+def injected_failure():
+    """Return an error response to inject for this request, if any"""
+    roll = random.random()
+    if roll < settings["rate_limit_rate"]:
+        stats["rate_limited"] += 1
+        return JSONResponse(
+            status_code=429,
+            content={"error": {"message": "Rate limit exceeded", "type": "rate_limit_error", "code": "RateLimitReached"}},
+            headers={"Retry-After": str(settings["retry_after"])},
+        )
+    if roll < settings["rate_limit_rate"] + settings["error_rate"]:
+        stats["errors_injected"] += 1
+        return JSONResponse(
+            status_code=500,
+            content={"error": {"message": "Injected upstream failure", "type": "server_error"}},
+        )
+    return None
+
+@app.post("/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+
+    failure = injected_failure()
+    if failure is not None:
+        await asyncio.sleep(min(sample_latency(), 0.5))
+        return failure
+
+    text = pick_response(body.get("messages", []), bool(body.get("response_format")))
+    completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+    model = body.get("model", "mock")
+
+    if not body.get("stream"):
+        await asyncio.sleep(sample_latency())
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": usage_for(text),
+        }
+
+    stats["streamed"] += 1
+    total = sample_latency()
+    tokens = re.findall(r'\S+\s*|\s+', text)
+    first_token_delay = total * settings["first_token_fraction"]
+    token_interval = (total - first_token_delay) / max(1, len(tokens))
+
+    async def stream():
+        await asyncio.sleep(first_token_delay)
+        for token in tokens:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            await asyncio.sleep(token_interval)
+        final = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        }
+        yield f"data: {json.dumps(final)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+@app.get("/stats")
+async def mock_stats():
+    return {**stats, "settings": settings}
+
+def configure(
+    latency: str = "lognormal",
+    latency_mean: float = 8.0,
+    latency_spread: float = 0.5,
+    first_token_fraction: float = 0.15,
+    error_rate: float = 0.0,
+    rate_limit_rate: float = 0.0,
+    retry_after: int = 2,
+    seed: int = None,
+) -> None:
+    """Set the latency and fault-injection profile"""
+    settings.update(
+        latency=latency,
+        latency_mean=latency_mean,
+        latency_spread=latency_spread,
+        first_token_fraction=first_token_fraction,
+        error_rate=error_rate,
+        rate_limit_rate=rate_limit_rate,
+        retry_after=retry_after,
+    )
+    if seed is not None:
+        random.seed(seed)
+
+configure()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="OpenAI-compatible mock upstream for offline load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", choices=["fixed", "uniform", "normal", "lognormal"], default="lognormal")
+    parser.add_argument("--latency-mean", type=float, default=8.0, help="Mean response time in seconds")
+    parser.add_argument("--latency-spread", type=float, default=0.5, help="Half-width (uniform), stddev (normal) or sigma (lognormal)")
+    parser.add_argument("--first-token-fraction", type=float, default=0.15, help="Share of the latency spent before the first streamed token")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of an injected 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Probability of an injected 429")
+    parser.add_argument("--retry-after", type=int, default=2, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    configure(
+        latency=args.latency,
+        latency_mean=args.latency_mean,
+        latency_spread=args.latency_spread,
+        first_token_fraction=args.first_token_fraction,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Cache of rendered PDF reports, keyed by a hash of everything that shapes them.
+
+The key doubles as a strong ETag: it is derived from the canonicalized
+analysis payload, category, language, patient info, the hash of the
+embedded image, template and template version, so identical inputs always
+map to the same validator. A client presenting it in If-None-Match can be
+answered with 304 before any rendering; other clients downloading the
+same report get the cached bytes.
+The store is an LRU bounded by total size in bytes.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+def canonical_json(value: Any) -> str:
+    """Deterministic JSON: sorted keys, no insignificant whitespace"""
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+
+def make_pdf_key(template: str, template_version: str, analysis: Any, category: str, language: str, patient_data: Any, image_key: Optional[str] = None) -> str:
+    digest = hashlib.sha256()
+    for part in (template, template_version, category, language, canonical_json(analysis), canonical_json(patient_data or {}), image_key or ""):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def etag_for(key: str) -> str:
+    return f'"{key}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """RFC 7232 If-None-Match comparison (weak comparison, '*' matches anything)"""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return any(candidate == "*" or candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+class PdfCache:
+    """Size-bounded LRU of rendered PDF bytes"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "not_modified": 0, "evictions": 0}
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            pdf = self._entries.get(key)
+            if pdf is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return pdf
+
+    def put(self, key: str, pdf: bytes) -> None:
+        if len(pdf) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= len(previous)
+            self._entries[key] = pdf
+            self.current_bytes += len(pdf)
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+                self.stats["evictions"] += 1
+
+    def record_not_modified(self) -> None:
+        with self._lock:
+            self.stats["not_modified"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+            }
@@ -0,0 +1,157 @@
+"""
+Background queue for PDF report rendering.
+
+POST /api/medical/pdf-jobs enqueues a render and returns a job id at once;
+a fixed number of worker tasks drain the queue, so slow Chromium renders
+never hold the submitting HTTP connection and at most `workers` renders
+run at the same time. Finished PDFs are kept in memory for `retention`
+seconds after completion and then dropped along with the job record.
+"""
+import asyncio
+import collections
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+RenderFn = Callable[[], Awaitable[Tuple[bytes, str]]]
+
+
+class PdfQueueFull(Exception):
+    """Raised by submit when the backlog of queued jobs is at its limit"""
+
+
+class PdfJob:
+    """One queued render and, once finished, its PDF"""
+
+    def __init__(self, render: RenderFn, description: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.status = "queued"
+        self.description = description
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.pdf: Optional[bytes] = None
+        self.filename: Optional[str] = None
+        self.error: Optional[str] = None
+        self._render = render
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = {
+            "job_id": self.id,
+            "status": self.status,
+            **self.description,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.status == "done":
+            result["filename"] = self.filename
+            result["size"] = len(self.pdf or b"")
+        if self.error:
+            result["error"] = self.error
+        return result
+
+
+def _percentile(samples: Deque[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+class PdfJobQueue:
+    """Bounded worker pool rendering PDF jobs in the background"""
+
+    def __init__(self, workers: int = 2, max_queued: int = 100, retention: float = 600.0):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.retention = retention
+        self._jobs: Dict[str, PdfJob] = {}
+        self._queue: "asyncio.Queue[PdfJob]" = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        self._running = 0
+        self._render_times: Deque[float] = collections.deque(maxlen=500)
+        self._wait_times: Deque[float] = collections.deque(maxlen=500)
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "expired": 0}
+
+    def start(self) -> None:
+        """Spawn the worker tasks (idempotent)"""
+        self._tasks = [task for task in self._tasks if not task.done()]
+        for index in range(len(self._tasks), self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(index)))
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, render: RenderFn, description: Optional[Dict[str, Any]] = None) -> PdfJob:
+        """Queue render() and return its job; render must return (pdf_bytes, filename)"""
+        self._purge_expired()
+        if self._queue.qsize() >= self.max_queued:
+            self.stats["rejected"] += 1
+            raise PdfQueueFull(f"PDF queue is full ({self.max_queued} jobs waiting)")
+        self.start()
+        job = PdfJob(render, description or {})
+        self._jobs[job.id] = job
+        self._queue.put_nowait(job)
+        self.stats["submitted"] += 1
+        return job
+
+    def get(self, job_id: str) -> Optional[PdfJob]:
+        self._purge_expired()
+        return self._jobs.get(job_id)
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+            self._wait_times.append(job.started_at - job.created_at)
+            self._running += 1
+            started = time.perf_counter()
+            try:
+                job.pdf, job.filename = await job._render()
+                job.status = "done"
+                self.stats["completed"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"PDF job {job.id} failed: {str(e)}")
+                job.status = "failed"
+                job.error = str(e)
+                self.stats["failed"] += 1
+            finally:
+                self._running -= 1
+                self._render_times.append(time.perf_counter() - started)
+                job.finished_at = time.time()
+                job._render = None
+                self._queue.task_done()
+
+    def _purge_expired(self) -> None:
+        cutoff = time.time() - self.retention
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+        self.stats["expired"] += len(expired)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Queue depth, retained artifacts and render timings for the metrics endpoint"""
+        self._purge_expired()
+        finished = [job for job in self._jobs.values() if job.status == "done"]
+        return {
+            **self.stats,
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize(),
+            "running": self._running,
+            "retained_jobs": len(self._jobs),
+            "retained_bytes": sum(len(job.pdf or b"") for job in finished),
+            "retention_s": self.retention,
+            "render_p50_ms": round(_percentile(self._render_times, 50) * 1000, 1),
+            "render_p95_ms": round(_percentile(self._render_times, 95) * 1000, 1),
+            "queue_wait_p95_ms": round(_percentile(self._wait_times, 95) * 1000, 1),
+        }
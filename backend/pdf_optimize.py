@@ -0,0 +1,197 @@
+"""
+Size optimization for rendered PDFs.
+
+Runs on the output of both engines before it is cached or returned:
+identical embedded font files and images are collapsed into one object,
+resources no page uses are dropped, oversized images are downsampled to
+JPEG, every stream is (re)compressed with Flate and small objects are
+packed into compressed object streams. Linearization (fast web view) is
+optional because it costs extra bytes. Both Chromium and ReportLab
+already embed subsetted fonts, so fonts are deduplicated rather than
+subset again.
+
+optimize_pdf is CPU-bound and picklable; main.py runs it in the render
+process pool. If the result is not smaller, the original bytes are kept.
+"""
+import hashlib
+import io
+import logging
+import threading
+import time
+from typing import Any, Dict, Set, Tuple
+
+import pikepdf
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+FONT_FILE_KEYS = ('/FontFile', '/FontFile2', '/FontFile3')
+
+_stats_lock = threading.Lock()
+OPTIMIZE_STATS = {
+    "renders": 0,
+    "failures": 0,
+    "original_bytes_total": 0,
+    "optimized_bytes_total": 0,
+    "deduplicated_streams": 0,
+    "downsampled_images": 0,
+}
+
+
+def _stream_digest(stream: pikepdf.Stream) -> str:
+    digest = hashlib.sha256(stream.read_raw_bytes())
+    for key in sorted(k for k in stream.keys() if k != '/Length'):
+        digest.update(f"{key}={stream[key]!r};".encode('utf-8', 'replace'))
+    return digest.hexdigest()
+
+
+def _candidate_streams(pdf: pikepdf.Pdf) -> Set[Tuple[int, int]]:
+    """Object ids of embedded font programs and image XObjects"""
+    candidates = set()
+    for obj in pdf.objects:
+        if isinstance(obj, pikepdf.Stream) and obj.get('/Subtype') == '/Image':
+            candidates.add(obj.objgen)
+        elif isinstance(obj, pikepdf.Dictionary) and obj.get('/Type') == '/FontDescriptor':
+            for key in FONT_FILE_KEYS:
+                if key in obj and obj[key].is_indirect:
+                    candidates.add(obj[key].objgen)
+    return candidates
+
+
+def _is_duplicate(value: Any, replacements: Dict[Tuple[int, int], Any]) -> bool:
+    # Scalars come back as plain Python values
+    return isinstance(value, pikepdf.Object) and value.is_indirect and value.objgen in replacements
+
+
+def _redirect(obj: Any, replacements: Dict[Tuple[int, int], Any], seen: Set[Tuple[int, int]]) -> None:
+    """Point every reference to a duplicate stream at its canonical copy"""
+    if isinstance(obj, (pikepdf.Dictionary, pikepdf.Stream)):
+        if obj.is_indirect:
+            if obj.objgen in seen:
+                return
+            seen.add(obj.objgen)
+        for key in list(obj.keys()):
+            value = obj[key]
+            if _is_duplicate(value, replacements):
+                obj[key] = replacements[value.objgen]
+            else:
+                _redirect(value, replacements, seen)
+    elif isinstance(obj, pikepdf.Array):
+        for index, value in enumerate(obj):
+            if _is_duplicate(value, replacements):
+                obj[index] = replacements[value.objgen]
+            else:
+                _redirect(value, replacements, seen)
+
+
+def deduplicate_streams(pdf: pikepdf.Pdf) -> int:
+    """Collapse byte-identical font programs and images; returns how many copies were dropped"""
+    canonical: Dict[str, pikepdf.Stream] = {}
+    replacements: Dict[Tuple[int, int], pikepdf.Stream] = {}
+    candidates = _candidate_streams(pdf)
+    for obj in pdf.objects:
+        if isinstance(obj, pikepdf.Stream) and obj.objgen in candidates:
+            digest = _stream_digest(obj)
+            if digest in canonical:
+                replacements[obj.objgen] = canonical[digest]
+            else:
+                canonical[digest] = obj
+    if replacements:
+        _redirect(pdf.Root, replacements, set())
+    return len(replacements)
+
+
+def _keeps_colorspace(obj: pikepdf.Stream, mode: str) -> bool:
+    """True when a baseline JPEG of a PIL image in mode can reuse the image's own /ColorSpace"""
+    colorspace = obj.get('/ColorSpace')
+    components = {'RGB': 3, 'L': 1}[mode]
+    if colorspace == ('/DeviceRGB' if components == 3 else '/DeviceGray'):
+        return True
+    # An ICC profile still describes the re-encoded samples when the component count matches
+    return (
+        isinstance(colorspace, pikepdf.Array) and len(colorspace) == 2
+        and colorspace[0] == '/ICCBased' and int(colorspace[1].get('/N', 0)) == components
+    )
+
+
+def downsample_images(pdf: pikepdf.Pdf, max_edge: int, quality: int = 85) -> int:
+    """Re-encode RGB/grayscale images larger than max_edge as JPEG; returns how many changed
+
+    The original /ColorSpace is kept, so only DeviceRGB, DeviceGray and
+    ICCBased images with a matching component count are touched.
+    """
+    changed = 0
+    for obj in pdf.objects:
+        if not (isinstance(obj, pikepdf.Stream) and obj.get('/Subtype') == '/Image'):
+            continue
+        if max(int(obj.get('/Width', 0)), int(obj.get('/Height', 0))) <= max_edge or '/SMask' in obj or '/Mask' in obj:
+            continue
+        try:
+            image = pikepdf.PdfImage(obj).as_pil_image()
+        except Exception:
+            continue
+        if image.mode not in ('RGB', 'L') or not _keeps_colorspace(obj, image.mode):
+            continue
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=quality, optimize=True)
+        obj.write(buffer.getvalue(), filter=pikepdf.Name.DCTDecode)
+        obj.Width, obj.Height = image.size
+        obj.BitsPerComponent = 8
+        if '/DecodeParms' in obj:
+            del obj['/DecodeParms']
+        changed += 1
+    return changed
+
+
+def optimize_pdf(pdf_bytes: bytes, linearize: bool = False, max_image_edge: int = 0) -> Tuple[bytes, Dict[str, Any]]:
+    """Shrink a PDF; returns (bytes, report) and never returns something larger than the input"""
+    started = time.perf_counter()
+    with pikepdf.open(io.BytesIO(pdf_bytes)) as pdf:
+        deduplicated = deduplicate_streams(pdf)
+        downsampled = downsample_images(pdf, max_image_edge) if max_image_edge else 0
+        pdf.remove_unreferenced_resources()
+        output = io.BytesIO()
+        pdf.save(
+            output,
+            compress_streams=True,
+            recompress_flate=True,
+            stream_decode_level=pikepdf.StreamDecodeLevel.generalized,
+            object_stream_mode=pikepdf.ObjectStreamMode.generate,
+            linearize=linearize,
+        )
+    optimized = output.getvalue()
+    if len(optimized) >= len(pdf_bytes):
+        optimized = pdf_bytes
+    return optimized, {
+        "original_bytes": len(pdf_bytes),
+        "optimized_bytes": len(optimized),
+        "saved_bytes": len(pdf_bytes) - len(optimized),
+        "ratio": round(len(optimized) / len(pdf_bytes), 3) if pdf_bytes else 1.0,
+        "deduplicated_streams": deduplicated,
+        "downsampled_images": downsampled,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def record_optimization(report: Dict[str, Any]) -> None:
+    """Fold one render's report into the process-wide counters"""
+    with _stats_lock:
+        OPTIMIZE_STATS["renders"] += 1
+        OPTIMIZE_STATS["original_bytes_total"] += report["original_bytes"]
+        OPTIMIZE_STATS["optimized_bytes_total"] += report["optimized_bytes"]
+        OPTIMIZE_STATS["deduplicated_streams"] += report["deduplicated_streams"]
+        OPTIMIZE_STATS["downsampled_images"] += report["downsampled_images"]
+
+
+def record_optimization_failure() -> None:
+    with _stats_lock:
+        OPTIMIZE_STATS["failures"] += 1
+
+
+def optimize_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        stats = dict(OPTIMIZE_STATS)
+    original = stats["original_bytes_total"]
+    stats["saved_ratio"] = round(1 - stats["optimized_bytes_total"] / original, 3) if original else 0.0
+    return stats
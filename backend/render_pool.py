@@ -0,0 +1,178 @@
+"""
+Process pool for CPU-bound PDF rendering.
+
+ReportLab is pure Python: a render run in a thread still holds the GIL and
+stalls the event loop of the API worker. Renders submitted here run in
+separate processes that import ReportLab and register the report fonts
+once at startup. Render inputs must be picklable (plain dicts from the
+analysis JSON). No more renders are submitted than there are workers, so
+a submitted render starts at once and the timeout covers only its run,
+never time spent queued. A render exceeding the timeout has its worker
+processes killed and the pool replaced; renders caught in that restart
+are retried once on the new pool.
+
+With processes=0 renders run in a thread instead, for small deployments.
+"""
+import asyncio
+import collections
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RenderTimeout(Exception):
+    """A render exceeded the pool timeout and its worker was killed"""
+
+
+def _warm_worker() -> None:
+    """Process initializer: pay ReportLab import and font registration once per worker"""
+    from report_pdf import report_fonts
+    report_fonts()
+
+
+def _noop() -> None:
+    pass
+
+
+class RenderPool:
+    """Warm worker processes with a per-render timeout and utilization metrics"""
+
+    def __init__(self, processes: int = 2, timeout: float = 30.0):
+        self.processes = processes
+        self.timeout = timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Admission per event loop: asyncio primitives are bound to the loop that first waits on them
+        self._slots: Dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
+        self._started_at = time.monotonic()
+        self._in_flight = 0
+        self._busy_seconds = 0.0
+        self._last_change = self._started_at
+        self._render_times: Deque[float] = collections.deque(maxlen=500)
+        self.stats = {"renders": 0, "failures": 0, "timeouts": 0, "restarts": 0}
+
+    def _ensure_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a process that runs an event loop and threads is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_worker,
+            )
+        return self._executor
+
+    async def start(self) -> None:
+        """Spawn and warm every worker ahead of the first render"""
+        if self.processes <= 0:
+            await asyncio.to_thread(_warm_worker)
+            return
+        executor = self._ensure_executor()
+        loop = asyncio.get_running_loop()
+        # Executors spawn workers on demand; one concurrent no-op per worker starts them all
+        await asyncio.gather(*[loop.run_in_executor(executor, _noop) for _ in range(self.processes)])
+        logger.info(f"Render pool started with {self.processes} processes")
+
+    def _restart(self, reason: str) -> None:
+        """Kill every worker and replace the executor"""
+        executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        self.stats["restarts"] += 1
+        logger.warning(f"Restarting render pool: {reason}")
+        # A running task cannot be cancelled; terminating its process is the only way to stop it
+        for process in list((getattr(executor, "_processes", None) or {}).values()):
+            process.terminate()
+        # Pending work items fail with BrokenProcessPool rather than being cancelled, so they retry
+        executor.shutdown(wait=False)
+
+    def _admission(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        slots = self._slots.get(loop)
+        if slots is None:
+            self._slots = {known: sem for known, sem in self._slots.items() if not known.is_closed()}
+            slots = self._slots[loop] = asyncio.Semaphore(self.processes)
+        return slots
+
+    def _account(self) -> None:
+        """Accumulate worker-seconds spent busy since the last change in load"""
+        now = time.monotonic()
+        self._busy_seconds += (now - self._last_change) * min(self._in_flight, max(self.processes, 1))
+        self._last_change = now
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run fn(*args) in a worker process and return its result"""
+        self._account()
+        self._in_flight += 1
+        started = time.monotonic()
+        try:
+            if self.processes <= 0:
+                try:
+                    result = await asyncio.wait_for(asyncio.to_thread(fn, *args), self.timeout)
+                except asyncio.TimeoutError:
+                    # A thread cannot be killed; the render finishes in the background
+                    self.stats["timeouts"] += 1
+                    raise RenderTimeout(f"PDF render exceeded {self.timeout}s")
+            else:
+                result = await self._run_in_process(fn, args)
+            self.stats["renders"] += 1
+            return result
+        except Exception:
+            self.stats["failures"] += 1
+            raise
+        finally:
+            self._account()
+            self._in_flight -= 1
+            self._render_times.append(time.monotonic() - started)
+
+    async def _run_in_process(self, fn: Callable[..., Any], args: tuple) -> Any:
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            # Waiting for a free worker happens here, outside the timeout
+            async with self._admission():
+                executor = self._ensure_executor()
+                try:
+                    return await asyncio.wait_for(loop.run_in_executor(executor, fn, *args), self.timeout)
+                except asyncio.TimeoutError:
+                    self.stats["timeouts"] += 1
+                    if self._executor is executor:
+                        self._restart(f"render exceeded {self.timeout}s")
+                    raise RenderTimeout(f"PDF render exceeded {self.timeout}s")
+                except BrokenProcessPool:
+                    # Killed by another render's timeout (or a crashed worker): retry once on a fresh pool
+                    if self._executor is executor:
+                        self._restart("worker process died")
+                    if attempt:
+                        raise
+                except asyncio.CancelledError:
+                    task = asyncio.current_task()
+                    if task is not None and task.cancelling():
+                        raise
+                    # The executor dropped our job, not our caller: treat it like a dead worker
+                    if attempt:
+                        raise BrokenProcessPool("render was cancelled by a pool restart")
+
+    async def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._slots.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Pool size, load and render timings for the metrics endpoint"""
+        self._account()
+        uptime = time.monotonic() - self._started_at
+        ordered = sorted(self._render_times)
+        capacity = max(self.processes, 1)
+        return {
+            **self.stats,
+            "processes": self.processes,
+            "in_flight": self._in_flight,
+            "queued": max(0, self._in_flight - capacity),
+            "utilization": round(self._busy_seconds / (uptime * capacity), 3) if uptime else 0.0,
+            "render_p50_ms": round(ordered[len(ordered) // 2] * 1000, 1) if ordered else 0.0,
+            "render_p95_ms": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] * 1000, 1) if ordered else 0.0,
+        }
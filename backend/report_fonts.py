@@ -0,0 +1,72 @@
+"""
+Locally bundled fonts for the PDF report templates.
+
+The subsetted WOFF2 files committed in fonts/ (licensed under fonts/OFL.txt)
+are read once and inlined into the report HTML as data URIs, so Chromium
+never has to reach fonts.googleapis.com and Arabic output does not depend
+on the network. Amiri is bundled in its regular weight only; Chromium
+synthesizes its bold. A missing bundle is an error: rendering raises
+MissingReportFonts instead of silently loading fonts from the CDN, unless
+REPORT_FONTS_CDN_FALLBACK=1 explicitly allows the Google Fonts stylesheet.
+"""
+import base64
+import functools
+import logging
+import os
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+FONTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
+# Opt-in only: remote fonts make Arabic shaping depend on the network
+CDN_FALLBACK = os.getenv("REPORT_FONTS_CDN_FALLBACK", "0") == "1"
+
+# (family, CSS weight or weight range, file)
+FONT_FACES = [
+    ("Amiri", "400", "Amiri-Regular.woff2"),
+    ("Noto Sans Arabic", "100 900", "NotoSansArabic.woff2"),
+    ("Noto Kufi Arabic", "100 900", "NotoKufiArabic.woff2"),
+    ("Cairo", "200 1000", "Cairo.woff2"),
+]
+
+GOOGLE_FONTS_URL = (
+    "https://fonts.googleapis.com/css2?family=Amiri:wght@400;700"
+    "&family=Noto+Sans+Arabic:wght@300;400;500;600;700"
+    "&family=Noto+Kufi+Arabic:wght@300;400;500;600;700"
+    "&family=Cairo:wght@300;400;500;600;700&display=swap"
+)
+
+
+class MissingReportFonts(RuntimeError):
+    """The bundled report fonts are missing from fonts/"""
+
+
+def missing_fonts() -> List[str]:
+    return [filename for _, _, filename in FONT_FACES if not os.path.exists(os.path.join(FONTS_DIR, filename))]
+
+
+@functools.lru_cache(maxsize=1)
+def font_face_css() -> str:
+    """@font-face rules for every bundled font; raises MissingReportFonts if none are bundled"""
+    missing = missing_fonts()
+    if missing:
+        logger.error(f"Bundled report fonts missing from {FONTS_DIR}: {', '.join(missing)}")
+    rules = []
+    for family, weight, filename in FONT_FACES:
+        if filename in missing:
+            continue
+        path = os.path.join(FONTS_DIR, filename)
+        with open(path, "rb") as f:
+            encoded = base64.b64encode(f.read()).decode("ascii")
+        rules.append(
+            f"@font-face {{ font-family: '{family}'; font-weight: {weight}; font-style: normal; "
+            f"font-display: block; src: url(data:font/woff2;base64,{encoded}) format('woff2'); }}"
+        )
+
+    if not rules:
+        if not CDN_FALLBACK:
+            raise MissingReportFonts(f"No bundled report fonts in {FONTS_DIR}; the checkout is incomplete")
+        logger.error("No bundled report fonts; loading them from Google Fonts because REPORT_FONTS_CDN_FALLBACK=1")
+        return f"@import url('{GOOGLE_FONTS_URL}');"
+    logger.info(f"Loaded {len(rules)} bundled report fonts")
+    return "\n".join(rules)
@@ -0,0 +1,93 @@
+"""
+Print-resolution derivatives of the analyzed image for embedding in reports.
+
+Uploads are often multi-megabyte phone photos or radiographs, but a report
+prints the image at most a page wide. Each upload is decoded once, scaled
+to REPORT_IMAGE_MAX_EDGE pixels on its longest side (roughly 170 dpi across
+an A4 text column), flattened to RGB or grayscale and re-encoded as a
+baseline JPEG, which both Chromium and ReportLab embed without further
+conversion. Derivatives are cached by a hash of the original bytes, so
+repeated and bulk reports for the same study reuse one derivative.
+"""
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from PIL import Image, ImageOps
+
+
+def image_digest(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def make_report_thumbnail(image_bytes: bytes, max_edge: int = 1200, quality: int = 80) -> bytes:
+    """Decode once, downscale to max_edge and re-encode as JPEG"""
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        if image.format == 'JPEG':
+            # Let the JPEG decoder skip DCT detail we are about to throw away
+            image.draft(image.mode, (max_edge, max_edge))
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ('I;16', 'I;16B', 'I;16L', 'I'):
+            # 16-bit radiographs: scale down to 8 bits before resampling
+            image = image.convert('I').point(lambda value: value / 256).convert('L')
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        if image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info):
+            image = image.convert('RGBA')
+            background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+            image = Image.alpha_composite(background, image)
+        image = image.convert('L' if image.mode in ('L', '1') else 'RGB')
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=quality, optimize=True)
+        return output.getvalue()
+
+
+class ReportImageCache:
+    """Size-bounded LRU of report image derivatives keyed by original digest"""
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "failures": 0, "original_bytes": 0, "thumbnail_bytes": 0}
+
+    def get(self, digest: str) -> Optional[bytes]:
+        with self._lock:
+            thumbnail = self._entries.get(digest)
+            if thumbnail is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.stats["hits"] += 1
+            return thumbnail
+
+    def put(self, digest: str, thumbnail: bytes, original_size: int) -> None:
+        with self._lock:
+            self.stats["original_bytes"] += original_size
+            self.stats["thumbnail_bytes"] += len(thumbnail)
+            if len(thumbnail) > self.max_bytes:
+                return
+            previous = self._entries.pop(digest, None)
+            if previous is not None:
+                self.current_bytes -= len(previous)
+            self._entries[digest] = thumbnail
+            self.current_bytes += len(thumbnail)
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+                self.stats["evictions"] += 1
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.stats["failures"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+            }
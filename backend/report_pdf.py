@@ -0,0 +1,265 @@
+"""
+Native ReportLab renderer for the analysis report.
+
+Draws the same report as templates/report.html (summary, user and patient
+info, detailed analysis, analyzed image, parameter table, findings,
+recommendations and the disclaimer) without a browser, typically in tens
+of milliseconds. ReportLab has no OpenType shaping or bidi layout, so
+Arabic text is shaped into presentation forms with arabic_reshaper,
+wrapped in logical order using the font's metrics and only then reordered
+line by line with python-bidi.
+Text is set in an embedded TrueType font: the Noto Sans Arabic subset
+bundled in fonts/, or DejaVu Sans from the system.
+"""
+import functools
+import io
+import logging
+import os
+import re
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+import arabic_reshaper
+from bidi.algorithm import get_display
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import Image, KeepTogether, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from report_templates import CATEGORY_NAMES, LABELS
+
+logger = logging.getLogger(__name__)
+
+FONTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
+
+# (regular, bold) TrueType candidates, first complete pair wins
+FONT_CANDIDATES = [
+    (os.getenv("REPORT_FONT_REGULAR", ""), os.getenv("REPORT_FONT_BOLD", "")),
+    (os.path.join(FONTS_DIR, "NotoSansArabic-Regular.ttf"), os.path.join(FONTS_DIR, "NotoSansArabic-Bold.ttf")),
+    ("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"),
+    ("/usr/share/fonts/TTF/DejaVuSans.ttf", "/usr/share/fonts/TTF/DejaVuSans-Bold.ttf"),
+]
+
+ARABIC_RE = re.compile(r'[\u0600-\u06FF\u0750-\u077F\uFB50-\uFDFF\uFE70-\uFEFF]')
+MARKDOWN_RE = re.compile(r'\*\*|__|^#+\s*|^\s*[-*•]\s+', re.MULTILINE)
+
+PRIMARY = colors.HexColor('#4F46E5')
+MUTED = colors.HexColor('#6B7280')
+STATUS_COLORS = {
+    'high': colors.HexColor('#DC2626'),
+    'low': colors.HexColor('#D97706'),
+    'critical': colors.HexColor('#991B1B'),
+    'normal': colors.HexColor('#059669'),
+}
+
+# ReportLab's TrueType subsetting state is shared per registered font and is not thread-safe
+_build_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=1)
+def report_fonts() -> Tuple[str, str]:
+    """Register the embedded report font pair once; returns (regular, bold) font names"""
+    for regular, bold in FONT_CANDIDATES:
+        if regular and bold and os.path.exists(regular) and os.path.exists(bold):
+            pdfmetrics.registerFont(TTFont("Report", regular))
+            pdfmetrics.registerFont(TTFont("Report-Bold", bold))
+            logger.info(f"ReportLab report font: {regular}")
+            return "Report", "Report-Bold"
+    logger.warning("No TrueType report font found; Arabic reports will not render correctly")
+    return "Helvetica", "Helvetica-Bold"
+
+
+def clean_text(value: Any) -> str:
+    """Plain text for the PDF: markdown markers dropped, Greek mu mapped to the micro sign"""
+    text = MARKDOWN_RE.sub('', str(value if value is not None else ''))
+    return text.replace('μ', 'µ').strip()
+
+
+def visual_line(text: str) -> str:
+    """Shape Arabic letters and reorder one line for display; Latin-only text is unchanged"""
+    if not ARABIC_RE.search(text):
+        return text
+    return get_display(arabic_reshaper.reshape(text))
+
+
+def wrap_logical(text: str, font: str, size: float, width: float) -> List[str]:
+    """Break text into lines that fit width, measuring shaped glyphs but keeping logical order"""
+    space = pdfmetrics.stringWidth(' ', font, size)
+    lines = []
+    for paragraph in text.split('\n'):
+        current: List[str] = []
+        current_width = 0.0
+        for word in paragraph.split():
+            # Arabic joining never crosses a space, so words can be shaped and measured independently
+            word_width = pdfmetrics.stringWidth(arabic_reshaper.reshape(word), font, size)
+            if current and current_width + space + word_width > width:
+                lines.append(' '.join(current))
+                current, current_width = [word], word_width
+            else:
+                current_width += word_width + (space if current else 0)
+                current.append(word)
+        lines.append(' '.join(current))
+    return lines
+
+
+class ReportBuilder:
+    """Accumulates flowables for one report in one language"""
+
+    def __init__(self, language: str, width: float):
+        self.language = language if language in LABELS else 'en'
+        self.rtl = self.language == 'ar'
+        self.labels = LABELS[self.language]
+        self.width = width
+        self.font, self.bold = report_fonts()
+        align = TA_RIGHT if self.rtl else TA_LEFT
+        self.styles = {
+            'title': ParagraphStyle('Title', fontName=self.bold, fontSize=20, leading=26, alignment=TA_CENTER, textColor=PRIMARY),
+            'meta': ParagraphStyle('Meta', fontName=self.font, fontSize=10, leading=14, alignment=TA_CENTER, textColor=MUTED),
+            'section': ParagraphStyle('Section', fontName=self.bold, fontSize=13, leading=18, alignment=align, textColor=PRIMARY, spaceBefore=10, spaceAfter=4),
+            'body': ParagraphStyle('Body', fontName=self.font, fontSize=11, leading=16, alignment=align, spaceAfter=4),
+            'label': ParagraphStyle('Label', fontName=self.bold, fontSize=10, leading=14, alignment=align, textColor=MUTED),
+            'cell': ParagraphStyle('Cell', fontName=self.font, fontSize=10, leading=13, alignment=align),
+            'head': ParagraphStyle('Head', fontName=self.bold, fontSize=10, leading=13, alignment=align, textColor=colors.white),
+            'small': ParagraphStyle('Small', fontName=self.font, fontSize=9, leading=13, alignment=align, textColor=MUTED),
+        }
+        self.story: List[Any] = []
+
+    def para(self, text: Any, style: str, width: Optional[float] = None, color: Optional[colors.Color] = None) -> Paragraph:
+        """Paragraph with Arabic pre-wrapped to width so bidi reordering never crosses a line break"""
+        text = clean_text(text)
+        paragraph_style = self.styles[style]
+        if ARABIC_RE.search(text):
+            lines = wrap_logical(text, paragraph_style.fontName, paragraph_style.fontSize, (width or self.width) - 2)
+            markup = '<br/>'.join(escape(visual_line(line)) for line in lines)
+        else:
+            markup = escape(text).replace('\n', '<br/>')
+        if color is not None:
+            markup = f'<font color="{color.hexval()}">{markup}</font>'
+        return Paragraph(markup, paragraph_style)
+
+    def row(self, cells: List[Any]) -> List[Any]:
+        return list(reversed(cells)) if self.rtl else cells
+
+    def table(self, rows: List[List[Any]], widths: List[float], header: bool = False) -> Table:
+        table = Table([self.row(r) for r in rows], colWidths=self.row(widths), repeatRows=1 if header else 0)
+        commands = [
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#E5E7EB')),
+            ('TOPPADDING', (0, 0), (-1, -1), 4),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+        ]
+        if header:
+            commands.append(('BACKGROUND', (0, 0), (-1, 0), PRIMARY))
+            commands.append(('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F9FAFB')]))
+        else:
+            commands.append(('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#F9FAFB')))
+        table.setStyle(TableStyle(commands))
+        return table
+
+    def section(self, title: str, flowables: List[Any]) -> None:
+        # Keep a heading together with the start of its content
+        self.story.append(KeepTogether([self.para(title, 'section'), *flowables[:1]]))
+        self.story.extend(flowables[1:])
+
+    def info_grid(self, title: str, items: List[Tuple[str, Any]]) -> None:
+        label_width, value_width = self.width * 0.35, self.width * 0.65
+        rows = [[self.para(label, 'label', label_width), self.para(value, 'cell', value_width)] for label, value in items]
+        self.section(title, [self.table(rows, [label_width, value_width])])
+
+    def bullet_list(self, items: List[Any]) -> List[Any]:
+        return [self.para(f"{index}. {clean_text(item)}", 'body') for index, item in enumerate(items, 1)]
+
+    def parameters(self, parameters: List[Dict[str, Any]]) -> None:
+        t = self.labels
+        widths = [self.width * share for share in (0.28, 0.14, 0.16, 0.26, 0.16)]
+        header = [self.para(t[key], 'head', w) for key, w in zip(('parameter', 'value', 'unit', 'reference_range', 'status'), widths)]
+        rows = [header]
+        for param in parameters:
+            status = str(param.get('status', '') or '')
+            rows.append([
+                self.para(param.get('name', ''), 'cell', widths[0]),
+                self.para(param.get('value', ''), 'cell', widths[1]),
+                self.para(param.get('unit', ''), 'cell', widths[2]),
+                self.para(param.get('referenceRange', param.get('reference_range', '')), 'cell', widths[3]),
+                self.para(status, 'cell', widths[4], STATUS_COLORS.get(status.lower())),
+            ])
+        self.section(t['parameters'], [self.table(rows, widths, header=True)])
+
+    def image(self, data: bytes, max_height: float = 120 * mm) -> None:
+        """The analyzed image scaled to fit the column, never upscaled past 1px per point"""
+        width, height = ImageReader(io.BytesIO(data)).getSize()
+        scale = min(self.width / width, max_height / height, 1.0)
+        self.section(self.labels['analyzed_image'], [Image(io.BytesIO(data), width=width * scale, height=height * scale)])
+
+
+def render_report_pdf(
+    analysis: Dict[str, Any],
+    category: str,
+    language: str,
+    patient_data: Optional[Dict[str, Any]] = None,
+    image: Optional[bytes] = None
+) -> bytes:
+    """Render the analysis report to PDF bytes with ReportLab (CPU bound, call off the event loop)"""
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(
+        buffer, pagesize=A4,
+        leftMargin=15 * mm, rightMargin=15 * mm, topMargin=20 * mm, bottomMargin=20 * mm,
+        title=LABELS.get(language, LABELS['en'])['title'], author='MedDx',
+    )
+    report = ReportBuilder(language, doc.width)
+    t = report.labels
+    now = datetime.now()
+    patient_data = patient_data or {}
+
+    report.story.append(report.para(t['title'], 'title'))
+    report.story.append(report.para(f"{t['date']}: {now.strftime('%Y-%m-%d')} | {t['time']}: {now.strftime('%H:%M:%S')}", 'meta'))
+    report.story.append(Spacer(1, 8))
+
+    patient_items = [(t[key], patient_data[key]) for key in ('name', 'age', 'gender') if patient_data.get(key) not in (None, '')]
+    if patient_items:
+        report.info_grid(t['patient_info'], patient_items)
+    user_items = [(t[label], patient_data[key]) for key, label in (('generated_by', 'generated_by'), ('user_email', 'email')) if patient_data.get(key)]
+    if user_items:
+        report.info_grid(t['user_info'], user_items)
+
+    report.info_grid(t['analysis_summary'], [
+        (t['analysis_type'], CATEGORY_NAMES[report.language].get(category, category)),
+        (t['confidence'], f"{analysis.get('confidence', 95)}%"),
+        (t['severity'], analysis.get('severity', 'normal')),
+    ])
+
+    analysis_text = clean_text(analysis.get('analysis')) or t['no_analysis']
+    report.section(t['detailed_analysis'], [report.para(block, 'body') for block in re.split(r'\n\s*\n', analysis_text) if block.strip()])
+
+    if image:
+        report.image(image)
+
+    parameters = analysis.get('parameters') or []
+    if parameters:
+        report.parameters([param for param in parameters if isinstance(param, dict)])
+
+    findings = analysis.get('findings') or []
+    if isinstance(findings, str):
+        findings = [findings]
+    report.section(t['findings'], report.bullet_list(findings) if findings else [report.para(t['no_findings'], 'body')])
+
+    recommendations = analysis.get('recommendations') or []
+    if isinstance(recommendations, str):
+        recommendations = [recommendations]
+    report.section(t['recommendations'], report.bullet_list(recommendations) if recommendations else [report.para(t['no_recommendations'], 'body')])
+
+    report.story.append(Spacer(1, 12))
+    report.section(t['disclaimer'], [report.para(t['disclaimer_text'], 'small')])
+    report.story.append(Spacer(1, 12))
+    report.story.append(report.para(t['footer'], 'meta'))
+
+    with _build_lock:
+        doc.build(report.story)
+    return buffer.getvalue()
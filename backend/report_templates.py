@@ -0,0 +1,186 @@
+"""
+Report HTML templates and translation catalogs.
+
+Both HTML reports are rendered from templates/report.html, in the
+"standard" theme (create_pdf_html) or the "classic" theme
+(create_html_for_pdf). The template is compiled in two stages. Once per
+theme and language, its [[ ]] expressions are filled with the escaped
+catalog labels and the theme stylesheet (including the inlined
+@font-face rules), and the result is compiled into a Jinja template.
+Per report, that template only fills in the {{ }} values from the
+analysis and the analyzed image, inlined as a data URI. Autoescaping
+stops '<' or '&' in model output from breaking the markup. The catalogs
+below are shared with the native ReportLab renderer.
+"""
+import base64
+import functools
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from markupsafe import Markup
+
+from report_fonts import font_face_css
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+# Theme name -> stylesheet in templates/
+THEMES = {
+    'standard': 'report_standard.css',
+    'classic': 'report_classic.css',
+}
+
+LABELS = {
+    'en': {
+        'title': 'MEDICAL ANALYSIS REPORT',
+        'patient_info': 'PATIENT INFORMATION',
+        'user_info': 'USER INFORMATION',
+        'analysis_summary': 'ANALYSIS SUMMARY',
+        'analysis_type': 'Analysis Type',
+        'confidence': 'Confidence Score',
+        'severity': 'Severity Level',
+        'detailed_analysis': 'DETAILED ANALYSIS',
+        'parameters': 'LABORATORY PARAMETERS',
+        'analyzed_image': 'ANALYZED IMAGE',
+        'findings': 'KEY FINDINGS',
+        'recommendations': 'RECOMMENDATIONS',
+        'disclaimer': 'IMPORTANT DISCLAIMER',
+        'disclaimer_text': 'This application uses AI to analyze medical images with high accuracy to support clinical decision-making. However, it is not a substitute for professional medical advice, diagnosis, or treatment. Users must consult a licensed physician before taking any clinical action.',
+        'date': 'Report Date',
+        'time': 'Generated Time',
+        'generated_by': 'Generated By',
+        'email': 'Email',
+        'name': 'Name',
+        'age': 'Age',
+        'gender': 'Gender',
+        'parameter': 'Parameter',
+        'value': 'Value',
+        'unit': 'Unit',
+        'reference_range': 'Reference Range',
+        'status': 'Status',
+        'no_analysis': 'No detailed analysis available.',
+        'no_findings': 'No specific findings noted.',
+        'no_recommendations': 'Consult with healthcare provider for interpretation.',
+        'footer': 'Generated by MedDx AI Medical Analysis Platform',
+    },
+    'ar': {
+        'title': 'تقرير التحليل الطبي',
+        'patient_info': 'معلومات المريض',
+        'user_info': 'معلومات المستخدم',
+        'analysis_summary': 'ملخص التحليل',
+        'analysis_type': 'نوع التحليل',
+        'confidence': 'نسبة الثقة',
+        'severity': 'مستوى الخطورة',
+        'detailed_analysis': 'التحليل التفصيلي',
+        'parameters': 'المعايير المختبرية',
+        'analyzed_image': 'الصورة المحللة',
+        'findings': 'النتائج الرئيسية',
+        'recommendations': 'التوصيات',
+        'disclaimer': 'إخلاء مسؤولية مهم',
+        'disclaimer_text': 'يستخدم هذا التطبيق الذكاء الاصطناعي لتحليل الصور الطبية بدقة عالية لدعم اتخاذ القرارات السريرية. ومع ذلك، فهو ليس بديلاً عن الاستشارة الطبية المهنية أو التشخيص أو العلاج. يجب على المستخدمين استشارة طبيب مرخص قبل اتخاذ أي إجراء سريري.',
+        'date': 'تاريخ التقرير',
+        'time': 'وقت الإنشاء',
+        'generated_by': 'أنشأ بواسطة',
+        'email': 'البريد الإلكتروني',
+        'name': 'الاسم',
+        'age': 'العمر',
+        'gender': 'الجنس',
+        'parameter': 'المعيار',
+        'value': 'القيمة',
+        'unit': 'الوحدة',
+        'reference_range': 'المعدل الطبيعي',
+        'status': 'الحالة',
+        'no_analysis': 'لا يتوفر تحليل تفصيلي.',
+        'no_findings': 'لم يتم تسجيل نتائج محددة.',
+        'no_recommendations': 'استشر مقدم الرعاية الصحية لتفسير النتائج.',
+        'footer': 'تم الإنشاء بواسطة منصة MedDx للتحليل الطبي بالذكاء الاصطناعي',
+    },
+}
+
+CATEGORY_NAMES = {
+    'en': {'cbc': 'Complete Blood Count (CBC)', 'ecg': 'Electrocardiogram (ECG)', 'xray': 'X-Ray Analysis', 'microscopy': 'Microscopy Analysis'},
+    'ar': {'cbc': 'صورة دم كاملة', 'ecg': 'تخطيط القلب', 'xray': 'تحليل الأشعة السينية', 'microscopy': 'التحليل المجهري'},
+}
+
+
+# Stage one: static text per theme and language, with its own delimiters
+_static_environment = Environment(
+    loader=FileSystemLoader(TEMPLATES_DIR),
+    autoescape=select_autoescape(['html']),
+    variable_start_string='[[',
+    variable_end_string=']]',
+    block_start_string='[%',
+    block_end_string='%]',
+    comment_start_string='[#',
+    comment_end_string='#]',
+    auto_reload=False,
+)
+
+# Stage two: per-report values
+_report_environment = Environment(
+    autoescape=True,
+    trim_blocks=True,
+    lstrip_blocks=True,
+)
+
+
+@functools.lru_cache(maxsize=None)
+def theme_styles(theme: str) -> Markup:
+    """Font faces plus the theme's stylesheet, read once per theme"""
+    with open(os.path.join(TEMPLATES_DIR, THEMES[theme]), encoding='utf-8') as f:
+        return Markup(f"{font_face_css()}\n{f.read()}")
+
+
+@functools.lru_cache(maxsize=None)
+def compiled_report_template(theme: str, language: str):
+    """The report template with labels and styles baked in, compiled once per theme and language"""
+    source = _static_environment.get_template('report.html').render(
+        theme=theme,
+        language=language,
+        direction='rtl' if language == 'ar' else 'ltr',
+        t=LABELS.get(language, LABELS['en']),
+        styles=theme_styles(theme),
+    )
+    return _report_environment.from_string(source)
+
+
+def warm_templates() -> None:
+    """Compile every theme and language ahead of the first report"""
+    for theme in THEMES:
+        for language in LABELS:
+            compiled_report_template(theme, language)
+
+
+def as_list(value: Any) -> List[Any]:
+    if not value:
+        return []
+    return [value] if isinstance(value, str) else list(value)
+
+
+def render_report_html(
+    theme: str,
+    analysis: Dict[str, Any],
+    category: str,
+    language: str,
+    patient_data: Optional[Dict[str, Any]] = None,
+    image: Optional[bytes] = None
+) -> str:
+    """Fill the report template for one analysis; image is a JPEG from report_images"""
+    t = LABELS.get(language, LABELS['en'])
+    patient_data = patient_data or {}
+    now = datetime.now()
+    return compiled_report_template(theme, language).render(
+        date=now.strftime('%Y-%m-%d'),
+        time=now.strftime('%H:%M:%S'),
+        patient_items=[(t[key], patient_data[key]) for key in ('name', 'age', 'gender') if patient_data.get(key) not in (None, '')],
+        user_items=[(t[label], patient_data[key]) for key, label in (('generated_by', 'generated_by'), ('user_email', 'email')) if patient_data.get(key)],
+        category_name=CATEGORY_NAMES.get(language, CATEGORY_NAMES['en']).get(category, category),
+        confidence=analysis.get('confidence', 95),
+        severity=analysis.get('severity', 'normal'),
+        analysis_text=analysis.get('analysis'),
+        parameters=[param for param in as_list(analysis.get('parameters')) if isinstance(param, dict)],
+        findings=as_list(analysis.get('findings')),
+        recommendations=as_list(analysis.get('recommendations')),
+        image_src=f"data:image/jpeg;base64,{base64.b64encode(image).decode('ascii')}" if image else None,
+    )
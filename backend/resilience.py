@@ -0,0 +1,279 @@
+"""
+Retries, hedged requests and circuit breaking around the vision model call.
+
+* Retries: transient failures (connection errors, timeouts, 429, 5xx) are
+  retried with full-jitter exponential backoff, honouring Retry-After up
+  to max_delay; a longer Retry-After is passed to the client as
+  UpstreamOverloaded instead of holding the request (and its limiter slot).
+* Hedging: when enabled, a second attempt is started once the first has
+  been outstanding longer than the observed latency quantile (p95 by
+  default); whichever finishes first wins and the other is cancelled.
+  Latency samples time the upstream call only, not admission queueing.
+* Circuit breaker: after consecutive transient failures the breaker opens
+  and calls fail fast with CircuitOpen until a cool-down has passed; one
+  probe call is then let through to decide whether to close it again.
+
+Every knob can be set per category through the UPSTREAM_RESILIENCE
+environment variable, a JSON object keyed by category with a "default"
+entry, e.g. ``{"default": {"max_attempts": 3}, "ecg": {"hedge": true}}``.
+"""
+import asyncio
+import collections
+import json
+import logging
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+import openai
+
+from upstream_limiter import UpstreamOverloaded, parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLICY = {
+    "max_attempts": 3,
+    "base_delay": 0.5,
+    "max_delay": 8.0,
+    "hedge": False,
+    "hedge_quantile": 0.95,
+    "hedge_min_delay": 2.0,
+    # Used until enough latency samples exist to estimate the quantile
+    "hedge_default_delay": 10.0,
+    "breaker_failure_threshold": 5,
+    "breaker_reset_timeout": 30.0,
+}
+
+# Wraps one attempt, e.g. AdaptiveLimiter.run
+Admission = Callable[[Callable[[], Awaitable[Any]]], Awaitable[Any]]
+
+# Samples kept per category for the hedge delay quantile
+LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+
+
+class CircuitOpen(UpstreamOverloaded):
+    """Raised without calling upstream while the breaker is open"""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Transient upstream failures worth another attempt"""
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError)):
+        return True
+    status = getattr(error, "status_code", None)
+    return status in (408, 409, 429) or (status is not None and status >= 500)
+
+
+def load_policies() -> Dict[str, Dict[str, Any]]:
+    """Per-category policies from UPSTREAM_RESILIENCE merged over the defaults"""
+    overrides = {}
+    raw = os.getenv("UPSTREAM_RESILIENCE")
+    if raw:
+        try:
+            overrides = json.loads(raw)
+        except json.JSONDecodeError:
+            logger.warning("Ignoring UPSTREAM_RESILIENCE: not valid JSON")
+    base = {**DEFAULT_POLICY, **overrides.get("default", {})}
+    policies = {"default": base}
+    for category, policy in overrides.items():
+        if category != "default":
+            policies[category] = {**base, **policy}
+    return policies
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open probe"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.times_opened = 0
+        self.short_circuited = 0
+
+    def before_call(self) -> None:
+        """Raise CircuitOpen unless a call may go through now"""
+        if self.state == "open":
+            remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+            if remaining > 0:
+                self.short_circuited += 1
+                raise CircuitOpen("Upstream circuit breaker is open", remaining)
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self.probe_in_flight:
+                self.short_circuited += 1
+                raise CircuitOpen("Upstream circuit breaker is probing", 1.0)
+            self.probe_in_flight = True
+
+    def on_success(self) -> None:
+        if self.state != "closed":
+            logger.info("Upstream circuit breaker closed")
+        self.state = "closed"
+        self.failures = 0
+        self.probe_in_flight = False
+
+    def on_failure(self) -> None:
+        self.failures += 1
+        self.probe_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.times_opened += 1
+                logger.warning(f"Upstream circuit breaker opened after {self.failures} failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def on_neutral(self) -> None:
+        """Call ended without telling us anything about upstream health"""
+        self.probe_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+            "short_circuited": self.short_circuited,
+        }
+
+
+class ResilientCaller:
+    """Applies the retry, hedge and breaker policy of a category to a call"""
+
+    def __init__(self, policies: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.policies = policies or load_policies()
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.latencies: Dict[str, "collections.deque[float]"] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def policy(self, category: str) -> Dict[str, Any]:
+        return self.policies.get(category, self.policies["default"])
+
+    def breaker(self, category: str) -> CircuitBreaker:
+        if category not in self.breakers:
+            policy = self.policy(category)
+            self.breakers[category] = CircuitBreaker(policy["breaker_failure_threshold"], policy["breaker_reset_timeout"])
+        return self.breakers[category]
+
+    def _count(self, category: str, counter: str) -> None:
+        counters = self.stats.setdefault(category, collections.defaultdict(int))
+        counters[counter] += 1
+
+    def record_latency(self, category: str, seconds: float) -> None:
+        self.latencies.setdefault(category, collections.deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+    def hedge_delay(self, category: str) -> float:
+        """Observed latency quantile, never below the configured floor"""
+        policy = self.policy(category)
+        samples = self.latencies.get(category)
+        if not samples or len(samples) < MIN_LATENCY_SAMPLES:
+            return max(policy["hedge_min_delay"], policy["hedge_default_delay"])
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(policy["hedge_quantile"] * len(ordered)))
+        return max(policy["hedge_min_delay"], ordered[index])
+
+    def backoff(self, category: str, attempt: int, error: BaseException) -> float:
+        """Full-jitter exponential delay, or the upstream Retry-After if longer, at most max_delay"""
+        policy = self.policy(category)
+        ceiling = min(policy["max_delay"], policy["base_delay"] * (2 ** attempt))
+        delay = random.uniform(0, ceiling)
+        retry_after = parse_retry_after(error)
+        return min(policy["max_delay"], max(delay, retry_after)) if retry_after else delay
+
+    async def _attempt(self, category: str, fn: Callable[[], Awaitable[Any]], admission: Optional[Admission]) -> Any:
+        self._count(category, "attempts")
+
+        async def timed() -> Any:
+            started = time.perf_counter()
+            result = await fn()
+            self.record_latency(category, time.perf_counter() - started)
+            return result
+
+        return await (admission(timed) if admission else timed())
+
+    async def _hedged(self, category: str, fn: Callable[[], Awaitable[Any]], admission: Optional[Admission]) -> Any:
+        """Run fn, racing a second copy if the first is slower than the hedge delay"""
+        primary = asyncio.create_task(self._attempt(category, fn, admission))
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay(category))
+            if done:
+                return primary.result()
+
+            self._count(category, "hedges_fired")
+            hedge = asyncio.create_task(self._attempt(category, fn, admission))
+            pending = {primary, hedge}
+            first_error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._count(category, "hedges_won")
+                        return task.result()
+                    first_error = first_error or task.exception()
+            raise first_error
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    async def call(self, category: str, fn: Callable[[], Awaitable[Any]], admission: Optional[Admission] = None) -> Any:
+        """Call fn() under the category's breaker, hedge and retry policy
+
+        admission, if given, wraps every attempt (e.g. AdaptiveLimiter.run);
+        time spent in it does not count towards the hedge latency samples.
+        """
+        policy = self.policy(category)
+        breaker = self.breaker(category)
+        for attempt in range(policy["max_attempts"]):
+            breaker.before_call()
+            try:
+                if policy["hedge"]:
+                    result = await self._hedged(category, fn, admission)
+                else:
+                    result = await self._attempt(category, fn, admission)
+            except UpstreamOverloaded:
+                # Our own admission control shed the call; not an upstream failure
+                breaker.on_neutral()
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    breaker.on_neutral()
+                    raise
+                breaker.on_failure()
+                self._count(category, "transient_failures")
+                if attempt + 1 >= policy["max_attempts"] or breaker.state == "open":
+                    raise
+                retry_after = parse_retry_after(e)
+                if retry_after and retry_after > policy["max_delay"]:
+                    # Sleeping that long would hold the request and its limiter slot; let the client retry
+                    self._count(category, "retry_after_exceeded")
+                    raise UpstreamOverloaded(f"Upstream asked to retry after {retry_after:.0f}s", retry_after) from e
+                delay = self.backoff(category, attempt, e)
+                self._count(category, "retries")
+                logger.warning(f"Retrying {category} upstream call in {delay:.2f}s after: {str(e)}")
+                await asyncio.sleep(delay)
+            except BaseException:
+                breaker.on_neutral()
+                raise
+            else:
+                breaker.on_success()
+                return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Attempt/hedge counters and breaker state per category"""
+        categories = set(self.stats) | set(self.breakers)
+        snapshot = {}
+        for category in sorted(categories):
+            snapshot[category] = {
+                **dict(self.stats.get(category, {})),
+                "hedge_delay_s": round(self.hedge_delay(category), 2),
+            }
+            # Read, don't create: breaker() would register one for every category listed
+            if category in self.breakers:
+                snapshot[category]["breaker"] = self.breakers[category].snapshot()
+        return snapshot
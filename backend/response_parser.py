@@ -0,0 +1,142 @@
+"""
+Incremental parsing of markdown analysis replies.
+
+AnalysisParser takes the reply in arbitrary fragments as the model writes
+it. Text (or raw UTF-8 bytes, which may split a multi-byte Arabic
+character) is buffered only up to the next newline; every completed line
+is parsed once, and feed() reports what that line added: a new section,
+a finding or recommendation bullet, or a classified parameter. Parameters
+come from the Measured Parameters section, and from lines elsewhere that
+start with a known parameter name followed by its value. close()
+parses the unterminated last line, scores severity over the whole reply
+and returns the same dict as parse_analysis_response. Every character
+is visited a constant number of times, so the total cost is linear in
+the reply size however it is chunked.
+"""
+import codecs
+import random
+import re
+import time
+from typing import Any, Dict, List, Optional, Set, Union
+
+from lab_parameters import classify_parameters, scan_parameter_line
+from severity import detect_severity
+
+# Section headers the prompts ask for (both English and Arabic), one alternation per section
+SECTION_HEADER_RE = re.compile(
+    r'#+\s*(?:'
+    r'(?P<analysis>Detailed Analysis|التحليل التفصيلي)'
+    r'|(?P<findings>Key Findings|النتائج الرئيسية)'
+    r'|(?P<recommendations>Recommendations|التوصيات)'
+    r'|(?P<parameters>Measured Parameters|المعايير المقاسة)'
+    r')',
+    re.IGNORECASE
+)
+
+
+def detect_section_header(line: str) -> Optional[str]:
+    """Return the section a stripped markdown line opens, if any"""
+    match = SECTION_HEADER_RE.match(line)
+    return match.lastgroup if match else None
+
+
+class AnalysisParser:
+    """Stateful feed/close parser for one markdown reply"""
+
+    def __init__(self, category: str, patient_data: Optional[Dict[str, Any]] = None):
+        self.category = category
+        self.patient_data = patient_data
+        self.section = 'analysis'
+        self.parse_ms = 0.0
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._chunks: List[str] = []
+        self._partial: List[str] = []
+        self._analysis_lines: List[str] = []
+        self._sections: Dict[str, List[str]] = {'findings': [], 'recommendations': []}
+        self._parameters: List[Dict[str, Any]] = []
+        self._seen_parameters: Set[Any] = set()
+        self._closed = False
+
+    def feed(self, chunk: Union[str, bytes]) -> Dict[str, List[Any]]:
+        """Add a fragment; returns the sections, findings, recommendations and parameters it completed"""
+        if self._closed:
+            raise ValueError("feed() after close()")
+        started = time.perf_counter()
+        text = self._decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        update = self._empty_update()
+        if text:
+            self._chunks.append(text)
+            if '\n' not in text:
+                self._partial.append(text)
+            else:
+                lines = text.split('\n')
+                self._partial.append(lines[0])
+                self._parse_line(''.join(self._partial), update)
+                for line in lines[1:-1]:
+                    self._parse_line(line, update)
+                self._partial = [lines[-1]] if lines[-1] else []
+        self._finish_update(update)
+        self.parse_ms += (time.perf_counter() - started) * 1000
+        return update
+
+    def close(self) -> Dict[str, Any]:
+        """Parse the last line and return the parse_analysis_response dict"""
+        started = time.perf_counter()
+        if not self._closed:
+            self._closed = True
+            tail = self._decoder.decode(b'', final=True)
+            if tail:
+                self._chunks.append(tail)
+                self._partial.append(tail)
+            update = self._empty_update()
+            self._parse_line(''.join(self._partial), update)
+            self._finish_update(update)
+            self._partial = []
+        result = {
+            "analysis": ' '.join(self._analysis_lines),
+            "findings": self._sections['findings'],
+            "recommendations": self._sections['recommendations'],
+            "parameters": self._parameters,
+            "severity": detect_severity(''.join(self._chunks)),
+            "confidence": random.randint(90, 97),  # Random confidence between 90-97
+            "category": self.category
+        }
+        self.parse_ms += (time.perf_counter() - started) * 1000
+        return result
+
+    @staticmethod
+    def _empty_update() -> Dict[str, List[Any]]:
+        return {"sections": [], "findings": [], "recommendations": [], "parameters": []}
+
+    def _parse_line(self, raw_line: str, update: Dict[str, List[Any]]) -> None:
+        line = raw_line.strip()
+        if not line:
+            return
+        # Outside Measured Parameters, only lines led by a known parameter name count:
+        # "Repeat ECG in 2 weeks (1-2 days)" is a recommendation, not a measurement
+        candidate = scan_parameter_line(line, known_only=self.section != 'parameters', category=self.category)
+        if candidate is not None:
+            update["parameters"].append(candidate)
+        first = line[0]
+        if first == '#':
+            # Section header (English or Arabic); other headers are skipped
+            section = detect_section_header(line)
+            if section and section != self.section:
+                self.section = section
+                update["sections"].append(section)
+        elif first == '•' or first == '-':
+            # Bullet point
+            items = self._sections.get(self.section)
+            if items is not None:
+                item = line[1:].strip()
+                if item:
+                    items.append(item)
+                    update[self.section].append(item)
+        elif self.section == 'analysis':
+            self._analysis_lines.append(line)
+
+    def _finish_update(self, update: Dict[str, List[Any]]) -> None:
+        # Candidates of one fragment are classified together, deduplicated against earlier ones
+        if update["parameters"]:
+            update["parameters"] = classify_parameters(update["parameters"], self.patient_data, self._seen_parameters, self.category)
+            self._parameters.extend(update["parameters"])
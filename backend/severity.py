@@ -0,0 +1,275 @@
+"""
+Severity classification of model responses, in English and Arabic.
+
+The severity vocabulary, negation cues, clause breaks and section headers
+of both languages are compiled into one Aho-Corasick automaton over
+word tokens, so a response is classified in a single left-to-right pass
+however large the vocabulary grows. Around the matches:
+
+- a negation cue ("no", "without", "لا", "بدون", ...) cancels severity
+  terms in the next NEGATION_WINDOW tokens of the same clause, and a
+  trailing cue ("ruled out", "مستبعد", ...) cancels the ones just before
+  it; "non" and "غير" negate only the next word, and pseudo-negations
+  such as "no change" cancel nothing;
+- each term counts with the weight of the section it appears in, so
+  "seek urgent care if symptoms worsen" under Recommendations does not
+  outweigh the findings on its own.
+
+The most severe level whose weighted count reaches SEVERITY_THRESHOLD
+wins; a response with none is "normal".
+"""
+import re
+import threading
+from typing import Any, Dict, Iterable, List, Tuple
+
+SEVERITY_LEVELS = ('severe', 'moderate', 'mild')
+
+SEVERITY_TERMS = {
+    'severe': {
+        'en': ('severe', 'severely', 'critical', 'critically', 'emergency', 'urgent', 'urgently',
+               'life-threatening'),
+        'ar': ('شديد', 'شديدة', 'حرج', 'حرجة', 'خطير', 'خطيرة', 'طارئ', 'طارئة', 'طوارئ',
+               'عاجل', 'عاجلة', 'فوري', 'فورية', 'مهدد للحياة', 'مهددة للحياة'),
+    },
+    'moderate': {
+        'en': ('moderate', 'moderately', 'concerning'),
+        # "متوسط" alone also means "mean" (متوسط حجم الكرية = MCV)
+        'ar': ('متوسط الشدة', 'متوسطة الشدة', 'معتدل', 'معتدلة', 'مقلق', 'مقلقة',
+               'يثير القلق', 'تثير القلق', 'مثير للقلق', 'يثير الشك', 'تثير الشك'),
+    },
+    'mild': {
+        'en': ('mild', 'mildly', 'slight', 'slightly'),
+        'ar': ('خفيف', 'خفيفة', 'طفيف', 'طفيفة', 'بسيط', 'بسيطة'),
+    },
+}
+
+# Cancel severity terms that follow within NEGATION_WINDOW tokens
+NEGATION_CUES = {
+    'en': ('no', 'not', 'none', 'without', 'absence of', 'negative for', 'free of', 'denies'),
+    'ar': ('لا', 'ليس', 'ليست', 'لم', 'لن', 'بدون', 'دون', 'عدم', 'خالي من', 'خالية من',
+           'غياب', 'انعدام'),
+}
+# Negate only the next word ("غير نمطية تثير القلق" is atypical and worrying)
+BOUND_NEGATIONS = {
+    'en': ('non',),
+    'ar': ('غير',),
+}
+# Cancel severity terms that precede within NEGATION_WINDOW tokens
+POST_NEGATION_CUES = {
+    'en': ('ruled out', 'excluded', 'unlikely', 'not seen', 'absent'),
+    'ar': ('مستبعد', 'مستبعدة', 'غير مرجح', 'غير مرجحة'),
+}
+# Start with a negation cue but negate nothing
+PSEUDO_NEGATIONS = {
+    'en': ('no change', 'no improvement', 'no increase', 'not only', 'without improvement',
+           'no significant change'),
+    'ar': ('لا تغيير', 'دون تحسن', 'بدون تحسن', 'لم يتحسن', 'لم تتحسن'),
+}
+# End a negation scope inside a sentence
+CLAUSE_BREAKS = {
+    'en': ('but', 'however', 'although', 'though', 'except'),
+    'ar': ('لكن', 'ولكن', 'لكنه', 'لكنها', 'بينما', 'باستثناء'),
+}
+SECTION_HEADERS = {
+    'analysis': ('detailed analysis', 'التحليل التفصيلي'),
+    'findings': ('key findings', 'النتائج الرئيسية'),
+    'parameters': ('measured parameters', 'المعايير المقاسة'),
+    'recommendations': ('recommendations', 'التوصيات'),
+}
+SECTION_WEIGHTS = {'analysis': 1.0, 'findings': 1.5, 'parameters': 0.5, 'recommendations': 0.5}
+SEVERITY_THRESHOLD = 1.0
+NEGATION_WINDOW = 6
+
+# Arabic attaches conjunctions, prepositions and the article to the word
+ARABIC_PREFIXES = ('', 'ال', 'و', 'وال', 'ب', 'بال', 'ف', 'فال', 'ل', 'لل', 'ك')
+ARABIC_CUE_PREFIXES = ('', 'و', 'ف')
+# Tanween fatha is dropped by normalization, leaving the alif of the accusative
+ARABIC_SUFFIXES = ('', 'ا')
+
+# Line starts, headers, sentence punctuation, numbers and words; anything else is skipped
+_TOKEN_RE = re.compile(r'\n|(?m:^)[ \t]*#+|[.;:!?؛؟]|\d+(?:[.,]\d+)*|[\wً-ْـ]+')
+SENTENCE_END = frozenset('.;:!?؛؟')
+BOUNDARY_CHARS = SENTENCE_END | frozenset('\n# \t')
+# Diacritics and tatweel removed, hamza forms of alif and alif maqsura folded
+_ARABIC_FOLD = str.maketrans({
+    **{chr(code): None for code in range(0x064b, 0x0653)},
+    'ـ': None, 'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ى': 'ي',
+})
+_ARABIC_RE = re.compile(r'[؀-ۿ]')
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower().translate(_ARABIC_FOLD))
+
+
+def _phrase_tokens(phrase: str) -> Tuple[str, ...]:
+    return tuple(token for token in tokenize(phrase) if token != '\n')
+
+
+def _variants(phrase: str, prefixes: Tuple[str, ...], suffixes: Tuple[str, ...] = ('',)) -> List[Tuple[str, ...]]:
+    """Token sequences for a phrase: Arabic prefixes on the first word, suffixes on single words"""
+    tokens = _phrase_tokens(phrase)
+    if not _ARABIC_RE.search(phrase):
+        return [tokens]
+    if len(tokens) == 1:
+        return [(prefix + tokens[0] + suffix,) for prefix in prefixes for suffix in suffixes]
+    return [(prefix + tokens[0],) + tokens[1:] for prefix in prefixes]
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton over token sequences
+
+    Each state lists every pattern ending there, longest first, as
+    (length, payload) pairs.
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[Tuple[str, ...], Any]]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[Tuple[int, Any]]] = [[]]
+        for tokens, payload in patterns:
+            state = 0
+            for token in tokens:
+                next_state = self.goto[state].get(token)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][token] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = next_state
+            if (len(tokens), payload) not in self.output[state]:
+                self.output[state].append((len(tokens), payload))
+
+        # Breadth-first: a state's failure link is the longest proper suffix that is also a prefix
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for token, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and token not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(token, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+        for outputs in self.output:
+            outputs.sort(key=lambda item: -item[0])
+
+    def __len__(self) -> int:
+        return len(self.goto)
+
+
+def _compile_patterns() -> List[Tuple[Tuple[str, ...], Tuple[str, Any]]]:
+    patterns = []
+    for level, languages in SEVERITY_TERMS.items():
+        for phrases in languages.values():
+            for phrase in phrases:
+                patterns += [(tokens, ('term', level)) for tokens in _variants(phrase, ARABIC_PREFIXES, ARABIC_SUFFIXES)]
+    for kind, cues, value in (('neg', NEGATION_CUES, NEGATION_WINDOW), ('neg', BOUND_NEGATIONS, 1),
+                              ('post', POST_NEGATION_CUES, None), ('pseudo', PSEUDO_NEGATIONS, None),
+                              ('break', CLAUSE_BREAKS, None)):
+        for phrases in cues.values():
+            for phrase in phrases:
+                patterns += [(tokens, (kind, value)) for tokens in _variants(phrase, ARABIC_CUE_PREFIXES)]
+    for section, phrases in SECTION_HEADERS.items():
+        for phrase in phrases:
+            patterns.append((_phrase_tokens(phrase), ('section', section)))
+    return patterns
+
+
+class SeverityClassifier:
+    """Weighted, negation-aware severity scoring in one pass over the tokens"""
+
+    def __init__(self):
+        self.automaton = KeywordAutomaton(_compile_patterns())
+        self._lock = threading.Lock()
+        self.stats = {level: 0 for level in SEVERITY_LEVELS + ('normal',)}
+        self.stats["negated_terms"] = 0
+
+    def scores(self, text: str) -> Dict[str, float]:
+        """Weighted count of non-negated terms per level, plus "negated": how many were cancelled"""
+        goto, fail, output = self.automaton.goto, self.automaton.fail, self.automaton.output
+        root = goto[0]
+        scores = {level: 0.0 for level in SEVERITY_LEVELS}
+        negated = 0
+        weight = SECTION_WEIGHTS['analysis']
+        in_header = False
+        state = 0
+        negate_until = -1
+        negation_start = -1
+        # Terms of the current clause, held until a trailing negation can no longer reach them
+        pending: List[Tuple[int, str, float]] = []
+
+        for index, token in enumerate(tokenize(text)):
+            first = token[0]
+            if first in BOUNDARY_CHARS:
+                for _, level, term_weight in pending:
+                    scores[level] += term_weight
+                pending = []
+                negate_until = -1
+                state = 0
+                if first == '\n':
+                    in_header = False
+                elif first not in SENTENCE_END:
+                    in_header = True  # "#" marker, possibly indented
+                continue
+
+            if state:
+                while state and token not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(token, 0)
+            else:
+                state = root.get(token, 0)
+            if not state:
+                continue
+
+            for length, (kind, value) in output[state]:
+                start = index - length + 1
+                if kind == 'term':
+                    if in_header:
+                        continue
+                    if negation_start < start <= negate_until:
+                        negated += 1
+                    else:
+                        pending.append((index, value, weight))
+                elif kind == 'neg':
+                    negation_start, negate_until = start, index + value
+                elif kind == 'pseudo':
+                    if start == negation_start:
+                        negate_until = -1
+                elif kind == 'post':
+                    kept = [term for term in pending if term[0] < start - NEGATION_WINDOW]
+                    negated += len(pending) - len(kept)
+                    pending = kept
+                elif kind == 'break':
+                    for _, level, term_weight in pending:
+                        scores[level] += term_weight
+                    pending = []
+                    negate_until = -1
+                elif kind == 'section' and in_header:
+                    weight = SECTION_WEIGHTS[value]
+                    break
+
+        for _, level, term_weight in pending:
+            scores[level] += term_weight
+        scores['negated'] = negated
+        return scores
+
+    def classify(self, text: str) -> str:
+        """Most severe level whose weighted count reaches SEVERITY_THRESHOLD"""
+        scores = self.scores(text)
+        level = next((level for level in SEVERITY_LEVELS if scores[level] >= SEVERITY_THRESHOLD), 'normal')
+        with self._lock:
+            self.stats[level] += 1
+            self.stats["negated_terms"] += scores['negated']
+        return level
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "automaton_states": len(self.automaton)}
+
+
+severity_classifier = SeverityClassifier()
+
+
+def detect_severity(text: str) -> str:
+    return severity_classifier.classify(text)
@@ -0,0 +1,70 @@
+"""
+Single-flight coalescing of identical in-flight coroutines.
+
+Double-clicks and frontend retries send the same image with the same
+prompt parameters seconds apart. The first request for a key starts the
+work as its own task; concurrent duplicates await that task instead of
+issuing another upstream call. Waiters are shielded from each other, so a
+client that disconnects only cancels its own wait; when the last waiter
+of a call goes away the call itself is cancelled, so nobody keeps paying
+for a result no one will read.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Share one in-flight task among concurrent callers with the same key"""
+
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Task, int] = {}
+        self.stats = {"calls": 0, "executions": 0, "coalesced": 0, "abandoned": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Run fn() once per key at a time; returns (result, shared)"""
+        self.stats["calls"] += 1
+        task = self._in_flight.get(key)
+        shared = task is not None
+        if shared:
+            self.stats["coalesced"] += 1
+            logger.info(f"Coalesced duplicate request onto in-flight call {key[:12]}")
+        else:
+            self.stats["executions"] += 1
+            task = asyncio.create_task(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done, key=key: self._forget(key, done))
+
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            # Shield so cancelling this waiter leaves the shared call running for the others
+            return await asyncio.shield(task), shared
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                if not task.done():
+                    self._abandon(key, task)
+
+    def _abandon(self, key: str, task: asyncio.Task) -> None:
+        """Cancel a call whose last waiter was cancelled"""
+        self.stats["abandoned"] += 1
+        # Later callers start a fresh call instead of joining the cancelled one
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        task.cancel()
+        logger.info(f"Cancelled in-flight call {key[:12]}: no waiters left")
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled() and task.exception() is not None:
+            # Retrieved here so an error with no remaining waiters is not reported as unhandled
+            logger.debug(f"Shared call {key[:12]} failed: {task.exception()}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters for the metrics endpoint"""
+        return {**self.stats, "in_flight": len(self._in_flight)}
@@ -0,0 +1,175 @@
+"""
+Structured JSON output for analyses.
+
+Categories listed in STRUCTURED_OUTPUT_CATEGORIES ask the model for a JSON
+object following ANALYSIS_SCHEMA instead of the markdown layout. The
+reply is checked by a hand-written validator (one json.loads plus type
+checks, no schema library) that builds the same dict
+parse_analysis_response returns, with parameters run through the same
+reference-range classification. A reply that fails validation is handed
+to the markdown parser, which also copes with free text. Attempts,
+outcomes and parse time are counted per mode for the metrics endpoint.
+"""
+import json
+import random
+import threading
+from typing import Any, Dict, List, Optional
+
+from lab_parameters import classify_parameters
+
+SEVERITIES = ('normal', 'mild', 'moderate', 'severe')
+PARAMETER_STATUSES = ('normal', 'low', 'high', 'critical')
+
+# Strict-mode JSON schema: every property required, nothing else allowed
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "analysis": {"type": "string"},
+        "parameters": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "value": {"type": "string"},
+                    "unit": {"type": "string"},
+                    "referenceRange": {"type": "string"},
+                    "status": {"type": "string", "enum": list(PARAMETER_STATUSES)},
+                },
+                "required": ["name", "value", "unit", "referenceRange", "status"],
+                "additionalProperties": False,
+            },
+        },
+        "findings": {"type": "array", "items": {"type": "string"}},
+        "recommendations": {"type": "array", "items": {"type": "string"}},
+        "severity": {"type": "string", "enum": list(SEVERITIES)},
+    },
+    "required": ["analysis", "parameters", "findings", "recommendations", "severity"],
+    "additionalProperties": False,
+}
+
+JSON_FORMAT_INSTRUCTIONS = {
+    'en': """
+Respond with a single JSON object and nothing else, using exactly these keys:
+- "analysis": comprehensive analysis of the medical image as plain text
+- "parameters": array of measured parameters, each {"name", "value", "unit", "referenceRange", "status"} with status one of "normal", "low", "high", "critical" (use "" when unit or range is not visible)
+- "findings": array of key findings, one string each
+- "recommendations": array of recommendations, one string each
+- "severity": one of "normal", "mild", "moderate", "severe"
+""",
+    'ar': """
+أجب بكائن JSON واحد فقط دون أي نص آخر، باستخدام هذه المفاتيح بالضبط (المفاتيح وقيم status و severity بالإنجليزية، والنصوص بالعربية):
+- "analysis": تحليل شامل للصورة الطبية كنص عادي
+- "parameters": مصفوفة المعايير المقاسة، كل عنصر {"name", "value", "unit", "referenceRange", "status"} وقيمة status إحدى "normal" أو "low" أو "high" أو "critical" (استخدم "" إذا لم تظهر الوحدة أو المعدل)
+- "findings": مصفوفة النتائج الرئيسية، نص لكل نتيجة
+- "recommendations": مصفوفة التوصيات، نص لكل توصية
+- "severity": إحدى القيم "normal" أو "mild" أو "moderate" أو "severe"
+""",
+}
+
+
+class StructuredOutputError(ValueError):
+    """The model reply is not a JSON object matching ANALYSIS_SCHEMA"""
+
+
+def json_format_instruction(language: str) -> str:
+    return JSON_FORMAT_INSTRUCTIONS.get(language, JSON_FORMAT_INSTRUCTIONS['en'])
+
+
+def response_format() -> Dict[str, Any]:
+    """response_format argument for chat.completions.create"""
+    return {"type": "json_schema", "json_schema": {"name": "medical_analysis", "strict": True, "schema": ANALYSIS_SCHEMA}}
+
+
+def _text(value: Any, field: str, allow_number: bool = False) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value.strip()
+    if allow_number and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise StructuredOutputError(f"{field} must be a string")
+
+
+def _text_list(value: Any, field: str) -> List[str]:
+    if not isinstance(value, list):
+        raise StructuredOutputError(f"{field} must be an array")
+    items = [_text(item, f"{field} item") for item in value]
+    return [item for item in items if item]
+
+
+def _parameter(value: Any) -> Dict[str, str]:
+    if not isinstance(value, dict):
+        raise StructuredOutputError("parameters item must be an object")
+    name = _text(value.get('name'), "parameter name")
+    if not name:
+        raise StructuredOutputError("parameter name is empty")
+    status = _text(value.get('status'), "parameter status").lower() or 'normal'
+    if status not in PARAMETER_STATUSES:
+        raise StructuredOutputError(f"parameter status {status!r} is not one of {', '.join(PARAMETER_STATUSES)}")
+    return {
+        "name": name,
+        "value": _text(value.get('value'), "parameter value", allow_number=True),
+        "unit": _text(value.get('unit'), "parameter unit"),
+        "referenceRange": _text(value.get('referenceRange'), "parameter referenceRange"),
+        "status": status,
+    }
+
+
+def parse_structured_response(response_text: str, category: str, patient_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Validate a JSON reply and build the parse_analysis_response dict; raises StructuredOutputError"""
+    text = response_text.strip()
+    if text.startswith('```'):
+        # Tolerate a fenced reply from models that ignore response_format
+        text = text.split('\n', 1)[1] if '\n' in text else ''
+        text = text.rsplit('```', 1)[0]
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise StructuredOutputError(f"invalid JSON: {e.msg} at position {e.pos}")
+    if not isinstance(data, dict):
+        raise StructuredOutputError("top level must be an object")
+    missing = [key for key in ANALYSIS_SCHEMA["required"] if key not in data]
+    if missing:
+        raise StructuredOutputError(f"missing keys: {', '.join(missing)}")
+
+    severity = _text(data['severity'], "severity").lower()
+    if severity not in SEVERITIES:
+        raise StructuredOutputError(f"severity {severity!r} is not one of {', '.join(SEVERITIES)}")
+    if not isinstance(data['parameters'], list):
+        raise StructuredOutputError("parameters must be an array")
+
+    return {
+        "analysis": _text(data['analysis'], "analysis"),
+        "findings": _text_list(data['findings'], "findings"),
+        "recommendations": _text_list(data['recommendations'], "recommendations"),
+        "parameters": classify_parameters([_parameter(item) for item in data['parameters']], patient_data, category=category),
+        "severity": severity,
+        "confidence": random.randint(90, 97),  # Random confidence between 90-97, as the markdown parser
+        "category": category,
+    }
+
+
+class ParseStats:
+    """Per-mode parse outcomes and timings"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._modes: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, mode: str, outcome: str, elapsed_ms: float) -> None:
+        """outcome: "ok", "fallback" (structured reply failed validation) or "empty" (no findings found)"""
+        with self._lock:
+            stats = self._modes.setdefault(mode, {"responses": 0, "ok": 0, "fallback": 0, "empty": 0, "parse_ms_total": 0.0})
+            stats["responses"] += 1
+            stats[outcome] += 1
+            stats["parse_ms_total"] += elapsed_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            modes = {mode: dict(stats) for mode, stats in self._modes.items()}
+        for stats in modes.values():
+            stats["success_rate"] = round(stats["ok"] / stats["responses"], 3) if stats["responses"] else 0.0
+            stats["avg_parse_ms"] = round(stats["parse_ms_total"] / stats["responses"], 3) if stats["responses"] else 0.0
+            stats["parse_ms_total"] = round(stats["parse_ms_total"], 1)
+        return modes
@@ -0,0 +1,218 @@
+"""
+Adaptive admission control for calls to the upstream model endpoint.
+
+models.github.ai rate-limits per token, so firing every request of a burst
+at once mostly produces 429s. The limiter keeps an AIMD concurrency window:
+each success while the window is full grows it by roughly one slot per
+window's worth of calls, and a 429 or 5xx halves it, at most once per
+round trip: overloads reported by calls admitted before the last decrease
+do not shrink it again. A Retry-After from upstream pauses admissions
+until it expires. Requests beyond the window wait in a bounded FIFO queue;
+when the queue is full or the wait exceeds the timeout, the caller gets
+UpstreamOverloaded with a Retry-After hint instead of piling on.
+"""
+import asyncio
+import collections
+import email.utils
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamOverloaded(Exception):
+    """Raised when a request cannot be admitted upstream in time"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(error: BaseException) -> Optional[float]:
+    """Seconds from a Retry-After / retry-after-ms header on an SDK error, if any"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """True for upstream 429 and 5xx responses"""
+    status = getattr(error, "status_code", None)
+    return status == 429 or (status is not None and status >= 500)
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency window with a bounded, time-limited wait queue"""
+
+    def __init__(
+        self,
+        initial_limit: float = 8,
+        min_limit: float = 1,
+        max_limit: float = 32,
+        backoff_factor: float = 0.5,
+        max_queue: int = 64,
+        queue_timeout: float = 30.0,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.backoff_factor = backoff_factor
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.last_decrease = float("-inf")
+        self._waiters: "collections.deque[asyncio.Future]" = collections.deque()
+        self._wake_handle: Optional[asyncio.TimerHandle] = None
+        self.stats = {
+            "admitted": 0,
+            "queued": 0,
+            "rejected_queue_full": 0,
+            "rejected_timeout": 0,
+            "throttled": 0,
+            "wait_ms_total": 0.0,
+            "wait_ms_max": 0.0,
+        }
+
+    def _can_admit(self) -> bool:
+        return self.in_flight < int(self.limit) and time.monotonic() >= self.paused_until
+
+    def _retry_after_hint(self) -> float:
+        return max(1.0, self.paused_until - time.monotonic(), self.queue_timeout / 4)
+
+    async def acquire(self) -> float:
+        """Wait for an upstream slot or raise UpstreamOverloaded; returns the time.monotonic() of admission"""
+        if not self._waiters and self._can_admit():
+            self.in_flight += 1
+            self.stats["admitted"] += 1
+            return time.monotonic()
+
+        if len(self._waiters) >= self.max_queue:
+            self.stats["rejected_queue_full"] += 1
+            raise UpstreamOverloaded("Upstream queue is full", self._retry_after_hint())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.stats["queued"] += 1
+        started = time.perf_counter()
+        self._schedule_wake()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.queue_timeout)
+            return time.monotonic()
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # Admitted in the same tick the timeout fired
+                return time.monotonic()
+            self.stats["rejected_timeout"] += 1
+            raise UpstreamOverloaded("Timed out waiting for an upstream slot", self._retry_after_hint())
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Slot was handed over just as we were cancelled; give it back
+                self.release()
+            raise
+        finally:
+            if not waiter.done():
+                waiter.cancel()
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+            waited_ms = (time.perf_counter() - started) * 1000
+            self.stats["wait_ms_total"] += waited_ms
+            self.stats["wait_ms_max"] = max(self.stats["wait_ms_max"], waited_ms)
+
+    def release(self) -> None:
+        """Free a slot and admit queued requests the window now allows"""
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        self._wake_handle = None
+        while self._waiters and self._can_admit():
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            self.stats["admitted"] += 1
+            waiter.set_result(None)
+        self._schedule_wake()
+
+    def _schedule_wake(self) -> None:
+        # While paused by Retry-After nothing completes to trigger admissions, so use a timer
+        remaining = self.paused_until - time.monotonic()
+        if self._waiters and remaining > 0 and self._wake_handle is None:
+            self._wake_handle = asyncio.get_running_loop().call_later(remaining, self._wake)
+
+    def on_success(self, admitted_at: Optional[float] = None) -> None:
+        """Additive increase: about one slot per window of successful calls, only while the window is in use"""
+        if admitted_at is not None and admitted_at < self.last_decrease:
+            return  # Admitted under the larger window that just overloaded upstream
+        # Called before the slot is released, so in_flight still counts this call
+        if self.in_flight >= int(self.limit):
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def on_overload(self, retry_after: Optional[float] = None, admitted_at: Optional[float] = None) -> None:
+        """Multiplicative decrease once per round trip, plus a pause when upstream asked for one"""
+        self.stats["throttled"] += 1
+        now = time.monotonic()
+        if retry_after:
+            self.paused_until = max(self.paused_until, now + retry_after)
+        if admitted_at is not None and admitted_at < self.last_decrease:
+            # Sent before the last decrease: the window has already reacted to this congestion
+            return
+        self.last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.backoff_factor)
+        logger.warning(f"Upstream overloaded; concurrency window now {self.limit:.1f}, retry after {retry_after or 0:.1f}s")
+
+    def record_outcome(self, error: Optional[BaseException], admitted_at: Optional[float] = None) -> None:
+        """Adjust the window from how a call admitted at admitted_at (time.monotonic()) ended"""
+        if error is None:
+            self.on_success(admitted_at)
+        elif is_overload_error(error):
+            self.on_overload(parse_retry_after(error), admitted_at)
+
+    async def run(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn() inside an upstream slot, adapting the window to its outcome"""
+        admitted_at = await self.acquire()
+        try:
+            result = await fn()
+        except Exception as e:
+            self.record_outcome(e, admitted_at)
+            raise
+        else:
+            self.record_outcome(None, admitted_at)
+            return result
+        finally:
+            self.release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Window, queue and wait-time figures for the metrics endpoint"""
+        # Only queued requests wait, whether they were admitted, rejected or cancelled
+        queued = self.stats["queued"]
+        return {
+            **self.stats,
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queue_depth": len(self._waiters),
+            "paused_for_seconds": round(max(0.0, self.paused_until - time.monotonic()), 1),
+            "wait_ms_avg": round(self.stats["wait_ms_total"] / queued, 1) if queued else 0.0,
+        }
@@ -0,0 +1,50 @@
+"""
+Incremental ZIP writer for streaming archives over HTTP.
+
+zipfile can write to a non-seekable file object: each member is followed by
+a data descriptor instead of patching its local header afterwards. The
+sink below is such an object; it only collects the bytes written since the
+last drain, so a response can yield every member as soon as it is added
+and the finished archive is never held in memory.
+"""
+import time
+import zipfile
+from typing import List
+
+
+class _ChunkSink:
+    """Write-only, non-seekable file object that buffers until drained"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ZipStream:
+    """Build a ZIP member by member; add() and close() return the bytes to send"""
+
+    def __init__(self, compression: int = zipfile.ZIP_STORED):
+        self._sink = _ChunkSink()
+        self._zip = zipfile.ZipFile(self._sink, mode="w", compression=compression)
+
+    def add(self, name: str, data: bytes) -> bytes:
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        info.compress_type = self._zip.compression
+        self._zip.writestr(info, data)
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        """Write the central directory"""
+        self._zip.close()
+        return self._sink.drain()